@@ -0,0 +1,186 @@
+"""Ограничение параллельных запросов по классам маршрутов и сброс нагрузки.
+
+Без лимита всплеск запросов занимает все потоки threadpool, которые затем ждут соединения
+из пула SessionLocal до таймаута, и тормозит все маршруты сразу. Здесь общий лимит
+не превышает размер пула, у классов свои потолки и очереди. Освободившееся место
+сначала получает оплата, затем админка, затем каталог. Если очередь класса заполнена
+или ожидание вышло за таймаут класса, запрос сразу получает 503 с Retry-After.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+from database import DB_MAX_OVERFLOW, DB_POOL_SIZE
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+ADMISSION_RETRY_AFTER = os.getenv("ADMISSION_RETRY_AFTER", "1")
+
+# Служебные маршруты не ограничиваются: метрики нужны именно под нагрузкой
+EXEMPT_PATHS = ("/metrics",)
+ROUTE_CLASSES = (
+    ("/api/pay", "checkout"),
+    ("/api/quotes", "checkout"),
+    ("/api/admin/", "admin"),
+    ("/api/super/", "admin"),
+    ("/api/suppliers", "admin"),
+)
+
+
+class RouteClass:
+    def __init__(self, name: str, priority: int, limit: int, queue: int, timeout: float):
+        prefix = f"ADMISSION_{name.upper()}_"
+        self.name = name
+        self.priority = priority  # меньше — раньше получает освободившееся место
+        self.limit = int(os.getenv(prefix + "LIMIT", str(limit)))
+        self.queue = int(os.getenv(prefix + "QUEUE", str(queue)))
+        self.timeout = float(os.getenv(prefix + "TIMEOUT", str(timeout)))
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.wait_seconds_total = 0.0
+
+
+def default_classes(total: int):
+    return {
+        "checkout": RouteClass("checkout", 0, total, 200, 10.0),
+        "admin": RouteClass("admin", 1, max(total // 4, 1), 20, 5.0),
+        # Каталог никогда не занимает весь пул: место для оплаты остаётся всегда
+        "public": RouteClass("public", 2, max(total * 3 // 4, 1), 50, 1.0),
+    }
+
+
+def classify(path: str):
+    for prefix, name in ROUTE_CLASSES:
+        if path.startswith(prefix):
+            return name
+    return "public"
+
+
+class Shed(Exception):
+    pass
+
+
+class AdmissionController:
+    def __init__(self, total: int = ADMISSION_MAX_CONCURRENCY, classes=None):
+        self.total = total
+        self.classes = classes or default_classes(total)
+        self.active = 0
+        self._waiters = []  # куча (приоритет, порядок, future, класс)
+        self._order = itertools.count()
+
+    def _has_room(self, route_class: RouteClass):
+        return self.active < self.total and route_class.active < route_class.limit
+
+    def _admit(self, route_class: RouteClass):
+        self.active += 1
+        route_class.active += 1
+        route_class.admitted += 1
+
+    async def acquire(self, name: str):
+        route_class = self.classes[name]
+        if not self._waiters and self._has_room(route_class):
+            self._admit(route_class)
+            return
+        if route_class.waiting >= route_class.queue:
+            route_class.shed += 1
+            raise Shed()
+
+        # Встаём в очередь и сразу раздаём свободные места: более важные запросы получат их первыми
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (route_class.priority, next(self._order), future, route_class))
+        self._dispatch()
+        if future.done():
+            return
+        route_class.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), route_class.timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                return  # место выдали одновременно с таймаутом — запрос уже допущен
+            future.cancel()
+            route_class.shed += 1
+            raise Shed()
+        except asyncio.CancelledError:
+            # Клиент отключился в очереди: если место уже выдано, возвращаем его
+            if future.done() and not future.cancelled():
+                self.release(name)
+            else:
+                future.cancel()
+            raise
+        finally:
+            route_class.waiting -= 1
+            route_class.wait_seconds_total += time.perf_counter() - started
+
+    def release(self, name: str):
+        route_class = self.classes[name]
+        self.active -= 1
+        route_class.active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        skipped = []
+        while self._waiters and self.active < self.total:
+            entry = heapq.heappop(self._waiters)
+            future, route_class = entry[2], entry[3]
+            if future.done():
+                continue  # ушёл по таймауту
+            if route_class.active >= route_class.limit:
+                skipped.append(entry)  # класс упёрся в свой потолок, место достаётся следующим
+                continue
+            self._admit(route_class)
+            future.set_result(None)
+        for entry in skipped:
+            heapq.heappush(self._waiters, entry)
+
+    def stats(self):
+        stats = {"all": {"active": self.active, "limit": self.total}}
+        for name, route_class in self.classes.items():
+            stats[name] = {
+                "active": route_class.active,
+                "limit": route_class.limit,
+                "waiting": route_class.waiting,
+                "admitted": route_class.admitted,
+                "shed": route_class.shed,
+                "wait_seconds_total": round(route_class.wait_seconds_total, 6),
+            }
+        return stats
+
+
+admission = AdmissionController()
+
+
+class AdmissionMiddleware:
+    """Чистый ASGI: место держится, пока ответ не отправлен целиком (включая потоковые выгрузки)."""
+
+    def __init__(self, app, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if not ADMISSION_ENABLED or scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        name = classify(scope["path"])
+        try:
+            await self.controller.acquire(name)
+        except Shed:
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", ADMISSION_RETRY_AFTER.encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": b'{"detail":"Server is busy, please retry"}'})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name)
@@ -1,12 +1,29 @@
+import asyncio
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from models import User
 from datetime import datetime, timedelta
-from database import get_db
+from database import engine, get_db
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Сколько bcrypt операций может идти одновременно; остальные ждут в очереди, не блокируя event loop
+HASH_CONCURRENCY = int(os.getenv("HASH_CONCURRENCY", "2"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_CONCURRENCY, thread_name_prefix="bcrypt")
 
 def hash_password(password: str):
     return pwd_context.hash(password)
@@ -14,10 +31,23 @@ def hash_password(password: str):
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+async def hash_password_async(password: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, hash_password, password)
+
+async def verify_password_async(plain_password, hashed_password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_password, plain_password, hashed_password)
+
 SECRET_KEY = "supersecret"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 720
 
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_INVALIDATE_CHANNEL = "auth_invalidate"
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 router = APIRouter()
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
@@ -26,18 +56,159 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def decode_payload(token: str):
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
 def decode_token(token: str):
-    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    return int(payload.get("sub"))
+    return int(decode_payload(token).get("sub"))
+
+
+class AuthenticatedUser:
+    """Снимок пользователя, который можно безопасно держать в кэше между запросами."""
+
+    __slots__ = ("id", "email", "is_superuser", "supplier_id")
+
+    def __init__(self, user: User):
+        self.id = user.id
+        self.email = user.email
+        self.is_superuser = user.is_superuser
+        self.supplier_id = user.supplier_id
+
+
+class TokenCache:
+    """LRU кэш проверенных токенов с TTL."""
+
+    def __init__(self, ttl: float = AUTH_CACHE_TTL, max_size: int = AUTH_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at <= time.monotonic():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return user
+
+    def put(self, token: str, user: AuthenticatedUser, token_exp: float = None):
+        ttl = self.ttl
+        if token_exp is not None:
+            # Запись не должна пережить сам токен (exp — unix время)
+            ttl = min(ttl, token_exp - time.time())
+            if ttl <= 0:
+                return
+        with self._lock:
+            self._entries[token] = (time.monotonic() + ttl, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for token in [t for t, (_, user) in self._entries.items() if user.id == user_id]:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+
+    try:
+        payload = decode_payload(token)
+        user_id = int(payload.get("sub"))
+    except (JWTError, TypeError, ValueError):
+        raise HTTPException(status_code=401)
+
+    user = db.query(User).filter(User.id == user_id).first()
+    if user is None or user.current_token != token:
+        raise HTTPException(status_code=401)
+
+    authenticated = AuthenticatedUser(user)
+    token_cache.put(token, authenticated, payload.get("exp"))
+    return authenticated
+
+
+def invalidate_user_tokens(db: Session, user_id: int):
+    """Сбрасывает кэш токенов пользователя здесь и во всех воркерах.
+
+    Вызывается после commit изменений пользователя: иначе параллельный запрос
+    успеет снова закэшировать старое состояние из ещё не закоммиченной базы.
+    """
+    token_cache.invalidate_user(user_id)
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": AUTH_INVALIDATE_CHANNEL, "payload": str(user_id)})
+        db.commit()  # NOTIFY доставляется слушателям только после commit
+
+
+def _listen_for_invalidations(stop_event: threading.Event):
+    while not stop_event.is_set():
+        raw = None
+        try:
+            raw = engine.raw_connection()
+            raw.detach()  # отдельное соединение, не занимает место в пуле
+            connection = raw.driver_connection
+            connection.autocommit = True
+            connection.cursor().execute(f"LISTEN {AUTH_INVALIDATE_CHANNEL}")
+            # Пока слушатель был отключён, уведомления могли потеряться
+            token_cache.clear()
+            while not stop_event.is_set():
+                if select.select([connection], [], [], 5) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    token_cache.invalidate_user(int(notify.payload))
+        except Exception:
+            logger.exception("Auth invalidation listener failed, reconnecting")
+            token_cache.clear()
+            stop_event.wait(5)
+        finally:
+            if raw is not None:
+                try:
+                    raw.close()
+                except Exception:
+                    pass
+
+
+_listener_stop = threading.Event()
+
+
+def start_auth_listener():
+    if engine.dialect.name != "postgresql":
+        return
+    _listener_stop.clear()
+    threading.Thread(
+        target=_listen_for_invalidations, args=(_listener_stop,), daemon=True, name="auth-invalidate"
+    ).start()
+
+
+def stop_auth_listener():
+    _listener_stop.set()
+
 
 @router.post("/api/admin/login")
 async def admin_login(request: Request, db: Session = Depends(get_db)):
     data = await request.json()
     user = db.query(User).filter(User.email == data["email"]).first()
-    if not user or not verify_password(data["password"], user.password_hash):
+    if not user or not await verify_password_async(data["password"], user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     access_token = create_access_token(data={"sub": str(user.id)})
     user.current_token = access_token
     db.commit()
-    return {"token": access_token, "is_superuser": user.is_superuser, "supplier_id": user.supplier_id}  
\ No newline at end of file
+    invalidate_user_tokens(db, user.id)
+    return {"token": access_token, "is_superuser": user.is_superuser, "supplier_id": user.supplier_id}
@@ -0,0 +1,596 @@
+"""Нагрузочные замеры основных эндпоинтов и горячих участков кода.
+
+Данные — из seed_data.py. По умолчанию приложение поднимается в этом же процессе
+(httpx.ASGITransport, база из DATABASE_URL); --url меряет уже запущенный сервер:
+
+    python seed_data.py --scale 10
+    python benchmark.py                                  # все сценарии по 10 секунд
+    python benchmark.py --scenario cars --scenario pay --concurrency 32
+    python seed_data.py --cars 10000 --reservations 1000000
+    python benchmark.py --scenario cars_available        # поиск свободных машин на большом парке
+    python benchmark.py --url http://127.0.0.1:8000 --json results.json
+    python benchmark.py --baseline results.json          # код 1, если p99 вырос больше --max-regression
+    python benchmark.py --micro                          # сериализация, поиск, расчёт цен без HTTP
+    ADMISSION_ENABLED=0 python benchmark.py --scenario car_reservations --scenario car_reservations_sync --concurrency 200
+                                                         # тот же запрос через async и sync сессию, без сброса нагрузки
+    python benchmark.py --micro --scenario auth_token_cached --scenario auth_token_uncached
+                                                         # get_current_user с кэшем токенов и без него
+    python benchmark.py --check car_race --concurrency 20  # проверки корректности, код 1 при провале
+    python benchmark.py --check id_allocator             # номера броней из базы DATABASE_URL, не с --url
+    python benchmark.py --check login_hammer --duration 5  # каталог, пока идут логины
+    python benchmark.py --check overload --concurrency 200 # каталог и оплата одновременно, хвост допущенных
+
+Отчёт — p50/p90/p99/max в миллисекундах, запросы в секунду, ошибки и отказы 503 (shed) по сценарию;
+латентность и rps считаются только по допущенным запросам.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+import httpx
+
+ADMIN_EMAIL = "admin@example.com"
+BOOKING_HORIZON_DAYS = 365
+ID_ALLOCATOR_IDS = 50_000
+ID_ALLOCATOR_MIN_RATE = 10_000  # номеров в секунду
+OVERLOAD_SCENARIOS = ("cars", "excursions_search", "pay")
+# Допущенный запрос ждёт в очереди не дольше таймаута своего класса, сверху — время самой обработки
+OVERLOAD_SERVICE_MS = 1000
+
+
+def percentile(sorted_values, fraction: float):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(name: str, latencies, errors: int, elapsed: float, shed: int = 0):
+    latencies = sorted(latencies)
+    ms = lambda value: round(value * 1000, 2)
+    return {
+        "scenario": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "shed": shed,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p90_ms": ms(percentile(latencies, 0.90)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1]) if latencies else 0.0,
+    }
+
+
+class Fixture:
+    """Id из самой базы, чтобы сценарии попадали в существующие записи."""
+
+    def __init__(self, suppliers, car_ids, excursions, token, rnd):
+        self.suppliers = suppliers
+        self.car_suppliers = [s["id"] for s in suppliers if s.get("supplier_type") == "car"] or [s["id"] for s in suppliers]
+        self.tour_suppliers = [s["id"] for s in suppliers if s.get("supplier_type") == "tour"] or [s["id"] for s in suppliers]
+        self.car_ids = car_ids
+        self.excursions = excursions
+        self.token = token
+        self.rnd = rnd
+        self.quotes = []
+
+    @property
+    def auth(self):
+        return {"Authorization": f"Bearer {self.token}"} if self.token else {}
+
+
+async def load_fixture(client: httpx.AsyncClient, args, rnd):
+    suppliers = (await client.get("/operators", params={"fields": "id,supplier_type"})).raise_for_status().json()
+    car_ids = [car["id"] for car in (await client.get("/cars", params={"fields": "id"})).raise_for_status().json()]
+    excursions = []
+    for supplier in suppliers:
+        if supplier.get("supplier_type") == "tour" and len(excursions) < 5000:
+            response = await client.get(
+                "/excursions", params={"operator_id": supplier["id"], "fields": "id,operator_id,title"}
+            )
+            excursions.extend(response.raise_for_status().json())
+    token = None
+    response = await client.post("/api/admin/login", json={"email": args.email, "password": args.password})
+    if response.status_code == 200:
+        token = response.json()["token"]
+    else:
+        print(f"Admin login failed ({response.status_code}), admin scenarios will report errors", file=sys.stderr)
+    fixture = Fixture(suppliers, car_ids, excursions, token, rnd)
+
+    # Суммы для /api/pay считает сам сервер, иначе брони упадут на проверке цены
+    if excursions:
+        items = [
+            {
+                "type": "excursion",
+                "id": rnd.choice(excursions)["id"],
+                "date": (date.today() + timedelta(days=rnd.randint(1, BOOKING_HORIZON_DAYS))).isoformat(),
+                "adults": rnd.randint(1, 2),
+            }
+            for _ in range(200)
+        ]
+        response = await client.post("/api/quotes", json={"items": items})
+        fixture.quotes = [q for q in response.raise_for_status().json()["quotes"] if "error" not in q]
+    return fixture
+
+
+def _booking_body(**fields):
+    return {
+        "firstName": "Bench",
+        "lastName": "Mark",
+        "phone": "+70000000000",
+        "contact_method": "email",
+        "email": "bench@example.com",
+        **fields,
+    }
+
+
+def _pay_request(f: Fixture):
+    quote = f.rnd.choice(f.quotes)
+    body = _booking_body(
+        adults=quote["adults"],
+        date=quote["date"],
+        total_price=quote["total"],
+        supplier_id=quote["supplier_id"],
+        booking_type="excursion",
+        excursion_id=quote["id"],
+    )
+    return "POST", "/api/pay", {"json": body}
+
+
+def _quote_request(f: Fixture):
+    day = date.today() + timedelta(days=f.rnd.randint(1, BOOKING_HORIZON_DAYS))
+    items = [
+        {"type": "car", "id": f.rnd.choice(f.car_ids), "start_date": day.isoformat(),
+         "end_date": (day + timedelta(days=f.rnd.randint(1, 14))).isoformat()}
+        for _ in range(10)
+    ]
+    return "POST", "/api/quotes", {"json": {"items": items}}
+
+
+def _available_request(f: Fixture):
+    # Окна вокруг сегодняшнего дня: сид раскладывает брони и в прошлое, и в будущее
+    start = date.today() + timedelta(days=f.rnd.randint(-BOOKING_HORIZON_DAYS, BOOKING_HORIZON_DAYS))
+    end = start + timedelta(days=f.rnd.randint(1, 14))
+    params = {"start_date": start.isoformat(), "end_date": end.isoformat(), "fields": "id,price_per_day"}
+    if f.rnd.random() < 0.5:
+        params["car_type"] = f.rnd.choice(["SUV", "sedan"])
+    return "GET", "/cars/available", {"params": params}
+
+
+def _stats_request(f: Fixture):
+    end = date.today()
+    params = {
+        "supplier_id": f.rnd.choice(f.car_suppliers),
+        "from": (end - timedelta(days=365)).isoformat(),
+        "to": end.isoformat(),
+        "granularity": "month",
+    }
+    return "GET", "/api/admin/stats", {"params": params, "headers": f.auth}
+
+
+SEARCH_WORDS = ["desert", "safari", "yacht", "dubai", "сафари", "прогулка", "museum", "tour", "дуба", "snorkel"]
+
+# Сценарий: имя -> (нужные данные, функция, которая собирает один запрос)
+SCENARIOS = {
+    "operators": ("suppliers", lambda f: ("GET", "/operators", {})),
+    "cars": ("car_ids", lambda f: ("GET", "/cars", {})),
+    "cars_fields": ("car_ids", lambda f: ("GET", "/cars", {"params": {"fields": "id,brand,model,price_per_day"}})),
+    "cars_search": ("car_ids", lambda f: ("GET", "/cars/search", {"params": {
+        "car_type": f.rnd.choice(["SUV", "sedan"]), "min_price": 100, "max_price": f.rnd.choice([300, 600, 1200]),
+    }})),
+    "excursions": ("tour_suppliers", lambda f: ("GET", "/excursions", {"params": {"operator_id": f.rnd.choice(f.tour_suppliers)}})),
+    "excursions_search": ("excursions", lambda f: ("GET", "/excursions/search", {"params": {"q": f.rnd.choice(SEARCH_WORDS)}})),
+    "cars_available": ("car_ids", _available_request),
+    "car_reservations": ("car_ids", lambda f: ("GET", "/car-reservations", {"params": {"car_id": f.rnd.choice(f.car_ids)}})),
+    "car_reservations_sync": ("car_ids", lambda f: ("GET", "/_bench/car-reservations-sync", {"params": {"car_id": f.rnd.choice(f.car_ids)}})),
+    "quotes": ("car_ids", _quote_request),
+    "pay": ("quotes", _pay_request),
+    "admin_bookings": ("token", lambda f: ("GET", "/api/admin/bookings", {
+        "params": {"supplier_id": f.rnd.choice(f.car_suppliers + f.tour_suppliers), "limit": 100}, "headers": f.auth,
+    })),
+    "admin_cars": ("token", lambda f: ("GET", "/api/admin/cars", {
+        "params": {"supplier_id": f.rnd.choice(f.car_suppliers)}, "headers": f.auth,
+    })),
+    "admin_stats": ("token", _stats_request),
+}
+
+
+async def check_car_race(client: httpx.AsyncClient, fixture: Fixture, args):
+    """--concurrency одновременных броней одной машины на одни даты: проходит ровно одна."""
+    for _ in range(20):
+        car_id = fixture.rnd.choice(fixture.car_ids)
+        # За горизонтом сценария pay и сида — окно почти наверняка свободно, занятое пропускаем
+        start = date.today() + timedelta(days=fixture.rnd.randint(2 * BOOKING_HORIZON_DAYS, 20 * BOOKING_HORIZON_DAYS))
+        end = start + timedelta(days=fixture.rnd.randint(0, 6))
+        reserved = (await client.get("/car-reservations", params={"car_id": car_id})).raise_for_status().json()
+        if not any(r["start_date"] <= end.isoformat() and r["end_date"] >= start.isoformat() for r in reserved):
+            break
+    else:
+        return {"ok": False, "detail": "no free car window found"}
+
+    item = {"type": "car", "id": car_id, "start_date": start.isoformat(), "end_date": end.isoformat()}
+    quote = (await client.post("/api/quotes", json={"items": [item]})).raise_for_status().json()["quotes"][0]
+    body = _booking_body(
+        booking_type="car",
+        car_id=car_id,
+        supplier_id=quote.get("supplier_id", 0),
+        date=start.isoformat(),
+        start_date=start.isoformat(),
+        end_date=end.isoformat(),
+        total_price=quote.get("total", 0),
+    )
+    responses = await asyncio.gather(*(client.post("/api/pay", json=body) for _ in range(args.concurrency)))
+    statuses = sorted(response.status_code for response in responses)
+
+    reserved = (await client.get("/car-reservations", params={"car_id": car_id})).raise_for_status().json()
+    inside = sorted(
+        (r["start_date"], r["end_date"]) for r in reserved
+        if r["start_date"] <= end.isoformat() and r["end_date"] >= start.isoformat()
+    )
+    ok = statuses.count(200) == 1 and statuses.count(409) == len(statuses) - 1 and len(inside) == 1
+    return {"ok": ok, "detail": f"car {car_id}: statuses {statuses}, reservations in window {len(inside)}"}
+
+
+def _allocate_ids(count: int, threads: int):
+    from id_allocator import BOOKING_ID_BLOCK_SIZE, BlockIdAllocator
+
+    # Отдельный счётчик, чтобы не тратить номера броней; два аллокатора — как два воркера uvicorn
+    allocators = [BlockIdAllocator("benchmark", BOOKING_ID_BLOCK_SIZE, lambda db: 1) for _ in range(2)]
+    chunks = [[] for _ in range(threads)]
+
+    def work(index: int):
+        allocator = allocators[index % len(allocators)]
+        chunks[index] = [allocator.next_id() for _ in range(count // threads)]
+
+    workers = [threading.Thread(target=work, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return chunks, time.perf_counter() - started
+
+
+async def check_id_allocator(client: httpx.AsyncClient, fixture: Fixture, args):
+    """Номера из --concurrency потоков: без повторов, по возрастанию в потоке, не медленнее ID_ALLOCATOR_MIN_RATE."""
+    chunks, elapsed = await asyncio.to_thread(_allocate_ids, ID_ALLOCATOR_IDS, args.concurrency)
+    ids = [value for chunk in chunks for value in chunk]
+    duplicates = len(ids) - len(set(ids))
+    ordered = all(a < b for chunk in chunks for a, b in zip(chunk, chunk[1:]))
+    rate = len(ids) / elapsed if elapsed else float("inf")
+    ok = not duplicates and ordered and rate >= ID_ALLOCATOR_MIN_RATE
+    return {"ok": ok, "detail": f"{len(ids)} ids in {elapsed:.2f}s ({rate:.0f}/s), duplicates {duplicates}, ordered {ordered}"}
+
+
+def bcrypt_seconds():
+    from auth import hash_password, verify_password
+
+    hashed = hash_password("benchmark")
+    started = time.perf_counter()
+    verify_password("benchmark", hashed)
+    return time.perf_counter() - started
+
+
+async def check_login_hammer(client: httpx.AsyncClient, fixture: Fixture, args):
+    """p99 каталога под --concurrency параллельными логинами вырастает меньше, чем на одну проверку bcrypt.
+
+    Если хэширование блокирует event loop, хвост каталога ждёт bcrypt целиком, обычно не один.
+    """
+    _, catalog = SCENARIOS["operators"]
+    # Неверный пароль: bcrypt работает так же, а действующий токен админа не меняется
+    login = lambda f: ("POST", "/api/admin/login", {"json": {"email": args.email, "password": args.password + "-wrong"}})
+
+    alone = await run_load(client, fixture, "catalog", catalog, args.concurrency, args.duration)
+    loaded, logins = await asyncio.gather(
+        run_load(client, fixture, "catalog", catalog, args.concurrency, args.duration),
+        run_load(client, fixture, "login", login, args.concurrency, args.duration),
+    )
+    limit_ms = alone["p99_ms"] + await asyncio.to_thread(bcrypt_seconds) * 1000
+    ok = logins["requests"] > 0 and loaded["p99_ms"] <= limit_ms
+    return {
+        "ok": ok,
+        "detail": f"catalog p99 {alone['p99_ms']} -> {loaded['p99_ms']} ms (limit {limit_ms:.1f}) "
+                  f"during {logins['requests']} logins, {logins['shed']} shed",
+    }
+
+
+async def check_overload(client: httpx.AsyncClient, fixture: Fixture, args):
+    """Каталог и оплата одновременно, по --concurrency клиентов на сценарий.
+
+    Лишнее должно отсекаться 503, p99 допущенных — укладываться в таймаут очереди своего класса
+    плюс OVERLOAD_SERVICE_MS, а оплата — отсекаться реже каталога. Таймауты берутся из настроек
+    admission этого процесса, поэтому с --url окружение должно совпадать с сервером.
+    """
+    from admission import admission, classify
+
+    names = [name for name in OVERLOAD_SCENARIOS if getattr(fixture, SCENARIOS[name][0])]
+    if len(names) < len(OVERLOAD_SCENARIOS):
+        return {"ok": False, "detail": "no data for all scenarios, run seed_data.py first"}
+    limits = {name: admission.classes[classify(SCENARIOS[name][1](fixture)[1])].timeout * 1000 + OVERLOAD_SERVICE_MS for name in names}
+    for name in names:
+        await warm_up(client, fixture, name, args)
+    results = await asyncio.gather(*(run_scenario(client, fixture, name, args) for name in names))
+
+    shed_share = lambda r: r["shed"] / ((r["requests"] + r["shed"]) or 1)
+    pay = next(r for r in results if r["scenario"] == "pay")
+    catalog = [r for r in results if r["scenario"] != "pay"]
+    problems = [f"{r['scenario']} p99 over {limits[r['scenario']]:.0f} ms" for r in results if r["p99_ms"] > limits[r["scenario"]]]
+    if not any(r["shed"] for r in results):
+        problems.append("nothing was shed, raise --concurrency")
+    if shed_share(pay) > min(shed_share(r) for r in catalog):
+        problems.append("pay was shed more than the catalog")
+    detail = ", ".join(f"{r['scenario']} p99 {r['p99_ms']} ms {r['requests']} ok {r['shed']} shed" for r in results)
+    return {"ok": not problems, "detail": "; ".join([detail, *problems])}
+
+
+# Проверки корректности под нагрузкой: имя -> корутина (client, fixture, args) -> {"ok", "detail"}
+CHECKS = {
+    "car_race": check_car_race,
+    "id_allocator": check_id_allocator,
+    "login_hammer": check_login_hammer,
+    "overload": check_overload,
+}
+
+
+async def warm_up(client: httpx.AsyncClient, fixture: Fixture, name: str, args):
+    # Кэши каталога и индексы поиска строятся до замера
+    _, build = SCENARIOS[name]
+    for _ in range(args.warmup):
+        method, url, kwargs = build(fixture)
+        await client.request(method, url, **kwargs)
+
+
+async def run_scenario(client: httpx.AsyncClient, fixture: Fixture, name: str, args):
+    _, build = SCENARIOS[name]
+    return await run_load(client, fixture, name, build, args.concurrency, args.duration, args.requests)
+
+
+async def run_load(client: httpx.AsyncClient, fixture: Fixture, name: str, build, concurrency: int, duration: float, requests=None):
+    latencies = []
+    errors = 0
+    shed = 0
+    deadline = time.perf_counter() + duration
+    remaining = requests
+
+    async def worker():
+        nonlocal errors, shed, remaining
+        while time.perf_counter() < deadline and (remaining is None or remaining > 0):
+            if remaining is not None:
+                remaining -= 1
+            method, url, kwargs = build(fixture)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                await response.aread()
+                status = response.status_code
+            except httpx.HTTPError:
+                status = None
+            if status == 503:
+                # Отказ admission control считается отдельно: хвост латентности — только у допущенных
+                shed += 1
+                await asyncio.sleep(0.1)  # как клиент, соблюдающий Retry-After, только короче
+                continue
+            latencies.append(time.perf_counter() - started)
+            errors += status is None or status >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, latencies, errors, time.perf_counter() - started, shed)
+
+
+# Маршруты, которые benchmark добавляет в приложение сам; с --url их нет
+IN_PROCESS_SCENARIOS = {"car_reservations_sync"}
+
+
+def add_sync_twins(app):
+    """Синхронная копия /car-reservations: тот же запрос через Session в threadpool, для сравнения с async."""
+    from fastapi import Depends
+    from sqlalchemy.orm import Session
+    from database import get_read_db
+    from json_utils import FastJSONResponse
+    from models import CarReservation
+
+    def car_reservations_sync(car_id: int, db: Session = Depends(get_read_db)):
+        reservations = db.query(CarReservation).filter(CarReservation.car_id == car_id).all()
+        return FastJSONResponse([{"id": r.id, "start_date": r.start_date, "end_date": r.end_date} for r in reservations])
+
+    app.add_api_route("/_bench/car-reservations-sync", car_reservations_sync, methods=["GET"])
+
+
+def make_client(args):
+    if args.url:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        return httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60)
+    from main import app
+
+    add_sync_twins(app)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+
+async def run_http(args):
+    rnd = random.Random(args.seed)
+    async with make_client(args) as client:
+        fixture = await load_fixture(client, args, rnd)
+        names = []
+        for name in args.scenario or list(SCENARIOS):
+            requirement = SCENARIOS[name][0]
+            if args.url and name in IN_PROCESS_SCENARIOS:
+                print(f"skip {name}: only available in-process (without --url)", file=sys.stderr)
+            elif getattr(fixture, requirement):
+                names.append(name)
+            else:
+                print(f"skip {name}: no {requirement} (run seed_data.py first)", file=sys.stderr)
+        for name in names:
+            await warm_up(client, fixture, name, args)
+        results = []
+        for name in names:
+            result = await run_scenario(client, fixture, name, args)
+            print_row(result)
+            results.append(result)
+    return results
+
+
+async def run_checks(args):
+    rnd = random.Random(args.seed)
+    async with make_client(args) as client:
+        fixture = await load_fixture(client, args, rnd)
+        results = []
+        for name in args.check:
+            result = {"check": name, **await CHECKS[name](client, fixture, args)}
+            print(f"{'PASS' if result['ok'] else 'FAIL':<6}{name:<22}{result['detail']}")
+            results.append(result)
+    return results
+
+
+def time_call(name: str, func, seconds: float):
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    while time.perf_counter() < deadline:
+        call_started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(name, latencies, 0, time.perf_counter() - started)
+
+
+def admin_token(email: str):
+    """Действующий токен админа; если входа ещё не было, выписывает его как admin_login."""
+    from auth import create_access_token
+    from database import SessionLocal
+    from models import User
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first()
+        if user is None:
+            return None
+        if not user.current_token:
+            user.current_token = create_access_token(data={"sub": str(user.id)})
+            db.commit()
+        return user.current_token
+    finally:
+        db.close()
+
+
+def run_micro(args):
+    from auth import get_current_user, token_cache
+    from database import open_read_session
+    from json_utils import dumps, project
+    from main import car_index, excursion_index, load_search_cars, QuoteItem
+    from pricing import quote_items
+
+    rnd = random.Random(args.seed)
+    cars = load_search_cars()
+    if not cars:
+        print("No cars in the database, run seed_data.py first", file=sys.stderr)
+        return []
+    car_ids = [car["id"] for car in cars]
+    car_index.snapshot()
+    excursion_index.search("tour")
+    db = open_read_session()
+    try:
+        items = [
+            QuoteItem(type="car", id=rnd.choice(car_ids), start_date=date.today(), end_date=date.today() + timedelta(days=7))
+            for _ in range(50)
+        ]
+        cases = [
+            ("dumps_cars", lambda: dumps(cars)),
+            ("dumps_cars_projected", lambda: dumps(project(cars, ("id", "price_per_day")))),
+            ("car_search", lambda: car_index.search({"car_type": {rnd.choice(["SUV", "sedan"])}}, {}, 100, 800)),
+            ("excursion_search", lambda: excursion_index.search(rnd.choice(SEARCH_WORDS))),
+            ("quote_50_cars", lambda: quote_items(db, items)),
+        ]
+        token = admin_token(args.email)
+        if token:
+            # До кэша каждый запрос админки декодировал JWT и читал пользователя из базы
+            cases += [
+                ("auth_token_cached", lambda: get_current_user(token, db)),
+                ("auth_token_uncached", lambda: (token_cache.clear(), get_current_user(token, db))),
+            ]
+        results = []
+        for name, func in cases:
+            if args.scenario and name not in args.scenario:
+                continue
+            result = time_call(name, func, args.duration)
+            print_row(result)
+            results.append(result)
+        return results
+    finally:
+        db.close()
+
+
+def print_header():
+    print(f"{'scenario':<22}{'requests':>10}{'errors':>8}{'shed':>8}{'rps':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+
+
+def print_row(r):
+    print(
+        f"{r['scenario']:<22}{r['requests']:>10}{r['errors']:>8}{r['shed']:>8}{r['rps']:>10}"
+        f"{r['p50_ms']:>10}{r['p90_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}"
+    )
+
+
+def compare(results, baseline_path: str, max_regression: float):
+    with open(baseline_path) as f:
+        baseline = {r["scenario"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        before = baseline.get(result["scenario"])
+        if not before or not before["p99_ms"]:
+            continue
+        change = result["p99_ms"] / before["p99_ms"] - 1
+        print(f"{result['scenario']:<22} p99 {before['p99_ms']} -> {result['p99_ms']} ms ({change:+.0%})")
+        if change > max_regression:
+            regressions.append(result["scenario"])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark booking API endpoints")
+    parser.add_argument("--url", help="benchmark a running server instead of an in-process app")
+    parser.add_argument("--scenario", action="append", help="scenario to run, repeatable (default: all)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--requests", type=int, help="stop each scenario after this many requests")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--email", default=ADMIN_EMAIL)
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--micro", action="store_true", help="time in-process hot paths instead of HTTP")
+    parser.add_argument("--check", action="append", choices=list(CHECKS), help="run a correctness check, repeatable")
+    parser.add_argument("--json", dest="json_path", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare p99 against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p99 growth, 0.2 = +20%%")
+    args = parser.parse_args()
+
+    names = set(SCENARIOS) if not args.micro else None
+    if names is not None and args.scenario and not set(args.scenario) <= names:
+        parser.error(f"unknown scenario, choose from: {', '.join(SCENARIOS)}")
+
+    if args.check:
+        results = asyncio.run(run_checks(args))
+        if args.json_path:
+            with open(args.json_path, "w") as f:
+                json.dump({"mode": "check", "url": args.url, "results": results}, f, indent=2)
+        sys.exit(0 if all(result["ok"] for result in results) else 1)
+
+    print_header()
+    results = run_micro(args) if args.micro else asyncio.run(run_http(args))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"mode": "micro" if args.micro else "http", "url": args.url, "results": results}, f, indent=2)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.max_regression)
+        if regressions:
+            print(f"p99 regressed by more than {args.max_regression:.0%}: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
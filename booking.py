@@ -0,0 +1,276 @@
+from datetime import date, datetime
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from date_ranges import check_range
+from email_utils import enqueue_booking_email
+from id_allocator import booking_ids
+from models import ConfirmedBooking, Car, CarReservation, Excursion, ExcursionReservation, ExcursionInventory
+from pricing import PRICE_TOLERANCE, QuoteError, quote_car, quote_excursion, rate_cache
+from rollups import record_booking, record_car_days
+
+
+class BookingError(Exception):
+    status_code = 400
+
+    @property
+    def detail(self):
+        return str(self)
+
+
+class BookingNotFound(BookingError):
+    status_code = 404
+
+
+class BookingConflict(BookingError):
+    status_code = 409
+
+
+class PriceMismatch(BookingConflict):
+    def __init__(self, quoted_total: float):
+        super().__init__("Price has changed, please review the new total")
+        self.quoted_total = quoted_total
+
+    @property
+    def detail(self):
+        return {"message": str(self), "total_price": self.quoted_total}
+
+
+def parse_date(value: str | None):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise BookingError(f"Invalid date: {value}")
+
+
+def lock_car(db: Session, car_id: int):
+    """Блокировка, под которой проверяются и пишутся брони машины: параллельные брони идут по очереди.
+
+    Postgres — SELECT ... FOR UPDATE по строке машины. В SQLite FOR UPDATE ничего не делает,
+    поэтому транзакция начинается с холостого UPDATE: он сразу берёт блокировку записи базы,
+    и следующая бронь ждёт её до проверки пересечений, а не после.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(update(Car).where(Car.id == car_id).values(id=Car.id))
+    car = db.query(Car).filter(Car.id == car_id).with_for_update().first()
+    if not car:
+        raise BookingNotFound("Car not found")
+    return car
+
+
+def car_is_reserved(db: Session, car_id: int, start_date, end_date):
+    return db.query(
+        db.query(CarReservation.id)
+        .filter(
+            CarReservation.car_id == car_id,
+            CarReservation.start_date <= end_date,
+            CarReservation.end_date >= start_date,
+        )
+        .exists()
+    ).scalar()
+
+
+def excursion_is_closed(db: Session, excursion_id: int, day):
+    return db.query(
+        db.query(ExcursionReservation.id)
+        .filter(ExcursionReservation.excursion_id == excursion_id, ExcursionReservation.date == day)
+        .exists()
+    ).scalar()
+
+
+def seats_sold(db: Session, excursion_id: int, days):
+    """Дата -> мест продано по подтверждённым броням (в том числе до появления лимита)."""
+    return dict(
+        db.query(ConfirmedBooking.date, func.coalesce(func.sum(ConfirmedBooking.people_count), 0))
+        .filter(
+            ConfirmedBooking.excursion_id == excursion_id,
+            ConfirmedBooking.booking_type == "excursion",
+            days,
+        )
+        .group_by(ConfirmedBooking.date)
+    )
+
+
+def reserve_seats(db: Session, excursion: Excursion, day, seats: int):
+    # Строка инвентаря на день создаётся при первой брони, дальше — только условный UPDATE
+    capacity = excursion.daily_capacity
+    sold = seats_sold(db, excursion.id, ConfirmedBooking.date == day).get(day, 0)
+    db.execute(
+        dialect_insert(db)(ExcursionInventory)
+        .values(excursion_id=excursion.id, date=day, capacity=capacity, remaining=capacity - sold)
+        .on_conflict_do_nothing(index_elements=["excursion_id", "date"])
+    )
+    updated = (
+        db.query(ExcursionInventory)
+        .filter(
+            ExcursionInventory.excursion_id == excursion.id,
+            ExcursionInventory.date == day,
+            ExcursionInventory.remaining >= seats,
+        )
+        .update({"remaining": ExcursionInventory.remaining - seats}, synchronize_session=False)
+    )
+    if not updated:
+        raise BookingConflict("Not enough seats left for this date")
+
+
+def sync_inventory_capacity(db: Session, excursion_id: int, capacity: int | None):
+    """Переносит новую вместимость на будущие дни, сохраняя уже проданные места.
+
+    Без лимита инвентарь не ведётся: строки удаляются, иначе календарь показывал бы старые остатки.
+    """
+    inventory = db.query(ExcursionInventory).filter(ExcursionInventory.excursion_id == excursion_id)
+    if capacity is None:
+        inventory.delete(synchronize_session=False)
+        return
+    today = date.today()
+    inventory.filter(
+        ExcursionInventory.date >= today,
+        ExcursionInventory.capacity != capacity,
+    ).update(
+        {
+            "remaining": ExcursionInventory.remaining + (capacity - ExcursionInventory.capacity),
+            "capacity": capacity,
+        },
+        synchronize_session=False,
+    )
+    # Дни, проданные без лимита, получают строку сразу — с остатком за вычетом уже проданного
+    sold = seats_sold(db, excursion_id, ConfirmedBooking.date >= today)
+    if sold:
+        db.execute(
+            dialect_insert(db)(ExcursionInventory)
+            .values([
+                {"excursion_id": excursion_id, "date": day, "capacity": capacity, "remaining": capacity - people}
+                for day, people in sold.items()
+            ])
+            .on_conflict_do_nothing(index_elements=["excursion_id", "date"])
+        )
+
+
+def sync_imported_capacity(db: Session, rows):
+    """Для массового импорта экскурсий: синхронизирует инвентарь строк, у которых меняется вместимость."""
+    current = dict(
+        db.query(Excursion.id, Excursion.daily_capacity).filter(Excursion.id.in_([row["id"] for row in rows]))
+    )
+    for row in rows:
+        if current.get(row["id"]) != row["daily_capacity"]:
+            sync_inventory_capacity(db, row["id"], row["daily_capacity"])
+
+
+def verify_total(quote, client_total: float):
+    """Возвращает сумму по серверному расчёту; расхождение с суммой клиента — 409 с новой ценой."""
+    try:
+        quoted = quote()["total"]
+    except QuoteError:
+        # У позиции не задана цена — считать нечего, остаётся сумма клиента
+        return client_total
+    if abs(quoted - client_total) > PRICE_TOLERANCE:
+        raise PriceMismatch(quoted)
+    return quoted
+
+
+def create_booking(db: Session, booking, before_commit=None):
+    """Проверяет пересечения и записывает бронь, резерв машины и письмо одной транзакцией.
+
+    before_commit(booking_entry) добавляет в ту же транзакцию свои записи (ответ для Idempotency-Key).
+    """
+    date_obj = parse_date(booking.date)
+    date_from_obj = parse_date(booking.start_date)
+    date_to_obj = parse_date(booking.end_date)
+
+    if booking.booking_type == "excursion":
+        people = (booking.adults or 0, booking.children or 0, booking.infants or 0)
+        if min(people) < 0:
+            raise BookingError("People counts must not be negative")
+        total_people = sum(people)
+        if total_people < 1:
+            raise BookingError("At least one person is required for excursion bookings")
+        if not booking.excursion_id:
+            raise BookingError("excursion_id is required for excursion bookings")
+    elif booking.booking_type == "car":
+        total_people = 1
+        if not booking.car_id:
+            raise BookingError("car_id is required for car bookings")
+    else:
+        raise BookingError("booking_type must be 'car' or 'excursion'")
+    total_price = booking.total_price or 0
+    # Номер берётся до начала транзакции брони: аллокатор работает через своё соединение
+    booking_id = booking_ids.next_id()
+
+    # Поставщик берётся из самой позиции: от него зависят сводки и выдача броней в админке
+    if booking.booking_type == "car":
+        if not date_from_obj or not date_to_obj:
+            raise BookingError("start_date and end_date are required for car bookings")
+        try:
+            check_range(date_from_obj, date_to_obj)
+        except ValueError as exc:
+            raise BookingError(str(exc))
+        car = lock_car(db, booking.car_id)
+        supplier_id = car.supplier_id
+        if car_is_reserved(db, booking.car_id, date_from_obj, date_to_obj):
+            raise BookingConflict("Car is already reserved for these dates")
+        total_price = verify_total(
+            lambda: quote_car(rate_cache.get(db), car, date_from_obj, date_to_obj), total_price
+        )
+    else:
+        excursion = db.query(Excursion).filter(Excursion.id == booking.excursion_id).first()
+        if not excursion:
+            raise BookingNotFound("Excursion not found")
+        supplier_id = excursion.operator_id
+        if not date_obj:
+            raise BookingError("date is required for excursion bookings")
+        if excursion_is_closed(db, booking.excursion_id, date_obj):
+            raise BookingConflict("Excursion is not available on this date")
+        total_price = verify_total(
+            lambda: quote_excursion(
+                rate_cache.get(db),
+                excursion,
+                date_obj,
+                booking.adults or 0,
+                booking.children or 0,
+                booking.infants or 0,
+            ),
+            total_price,
+        )
+        if excursion.daily_capacity is not None:
+            reserve_seats(db, excursion, date_obj, total_people)
+
+    booking_entry = ConfirmedBooking(
+        booking_id=booking_id,
+        first_name=booking.firstName,
+        last_name=booking.lastName,
+        phone=booking.phone,
+        email=booking.email,
+        document_number=booking.document_number,
+        pickup_location=booking.pickup_location,
+        contact_method=booking.contact_method,
+        language=booking.language,
+        people_count=total_people,
+        date=date_obj or date_from_obj,
+        total_price=total_price,
+        supplier_id=supplier_id,
+        booking_type=booking.booking_type,
+        excursion_id=booking.excursion_id if booking.booking_type == "excursion" else None,
+        car_id=booking.car_id if booking.booking_type == "car" else None
+    )
+    db.add(booking_entry)
+
+    if booking.booking_type == "car":
+        db.add(CarReservation(car_id=booking.car_id, start_date=date_from_obj, end_date=date_to_obj))
+        record_car_days(db, supplier_id, [(date_from_obj, date_to_obj)])
+    record_booking(db, supplier_id, booking_entry.date, booking.booking_type, total_people, total_price)
+
+    enqueue_booking_email(db, booking)
+    if before_commit is not None:
+        before_commit(booking_entry)
+
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise BookingConflict("Booking could not be saved, please retry")
+    db.refresh(booking_entry)
+    return booking_entry
@@ -0,0 +1,140 @@
+import base64
+import csv
+import io
+from datetime import date
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from database import open_read_session
+from json_utils import FastJSONResponse, dumps
+from models import ConfirmedBooking
+
+EXPORT_CHUNK_SIZE = 1000
+
+bookings_table = ConfirmedBooking.__table__
+
+
+def encode_cursor(row):
+    raw = f"{row['date'].isoformat() if row['date'] else ''}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw_date, raw_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return (date.fromisoformat(raw_date) if raw_date else None), int(raw_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def bookings_query(
+    supplier_id: int | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    booking_type: str | None = None,
+    car_id: int | None = None,
+    excursion_id: int | None = None,
+    cursor: str | None = None,
+    fields=None,
+):
+    # Проекция на уровне SQL; id и date нужны курсору и отбрасываются позже
+    columns = [
+        column
+        for column in bookings_table.columns
+        if not fields or column.key in fields or column.key in ("id", "date")
+    ]
+    # Новые брони первыми; порядок (date, id) однозначный, поэтому курсор стабилен
+    query = select(*columns).order_by(
+        ConfirmedBooking.date.desc().nulls_last(), ConfirmedBooking.id.desc()
+    )
+    if supplier_id is not None:
+        query = query.where(ConfirmedBooking.supplier_id == supplier_id)
+    if date_from is not None:
+        query = query.where(ConfirmedBooking.date >= date_from)
+    if date_to is not None:
+        query = query.where(ConfirmedBooking.date <= date_to)
+    if booking_type is not None:
+        query = query.where(ConfirmedBooking.booking_type == booking_type)
+    if car_id is not None:
+        query = query.where(ConfirmedBooking.car_id == car_id)
+    if excursion_id is not None:
+        query = query.where(ConfirmedBooking.excursion_id == excursion_id)
+
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        if cursor_date is None:
+            query = query.where(and_(ConfirmedBooking.date.is_(None), ConfirmedBooking.id < cursor_id))
+        else:
+            query = query.where(
+                or_(
+                    ConfirmedBooking.date < cursor_date,
+                    and_(ConfirmedBooking.date == cursor_date, ConfirmedBooking.id < cursor_id),
+                    ConfirmedBooking.date.is_(None),
+                )
+            )
+    return query
+
+
+def _output_columns(query, fields):
+    return [column.key for column in query.selected_columns if not fields or column.key in fields]
+
+
+def fetch_page(db: Session, query, limit: int, fields=None):
+    rows = [row._mapping for row in db.execute(query.limit(limit + 1))]
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    keys = _output_columns(query, fields)
+    return [{key: row[key] for key in keys} for row in rows[:limit]], next_cursor
+
+
+def _stream_rows(query):
+    # Свой Session: зависимость get_db закрывается раньше, чем отдан стриминговый ответ.
+    # Выгрузка тяжёлая, поэтому по возможности читаем с реплики.
+    db = open_read_session()
+    try:
+        result = db.execute(query.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE))
+        for chunk in result.partitions(EXPORT_CHUNK_SIZE):
+            yield [row._mapping for row in chunk]
+    finally:
+        db.close()
+
+
+def _ndjson_chunks(query, fields):
+    keys = _output_columns(query, fields)
+    for rows in _stream_rows(query):
+        yield b"".join(dumps({key: row[key] for key in keys}) + b"\n" for row in rows)
+
+
+def _csv_chunks(query, fields):
+    keys = _output_columns(query, fields)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(keys)
+    for rows in _stream_rows(query):
+        for row in rows:
+            writer.writerow([row[key] for key in keys])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_response(query, export_format: str, fields=None):
+    if export_format == "csv":
+        return StreamingResponse(
+            _csv_chunks(query, fields),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="bookings.csv"'},
+        )
+    return StreamingResponse(_ndjson_chunks(query, fields), media_type="application/x-ndjson")
+
+
+def bookings_response(db: Session, query, limit: int, export_format: str, fields=None):
+    if export_format != "json":
+        return export_response(query, export_format, fields)
+    rows, next_cursor = fetch_page(db, query, limit, fields)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return FastJSONResponse(rows, headers=headers)
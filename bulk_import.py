@@ -0,0 +1,105 @@
+import csv
+import io
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+BULK_BATCH_SIZE = 1000
+BULK_MAX_ROWS = 20000
+
+
+def parse_csv(raw: bytes):
+    reader = csv.DictReader(io.StringIO(raw.decode("utf-8-sig")))
+    # Пустая ячейка = поле не передано, чтобы сработали значения по умолчанию
+    return [{key: value for key, value in row.items() if key and value not in ("", None)} for row in reader]
+
+
+async def read_rows(request: Request):
+    """JSON массив, CSV в теле запроса (text/csv) или CSV файл в multipart поле file."""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Expected a CSV file in the 'file' field")
+        rows = parse_csv(await upload.read())
+    elif "csv" in content_type:
+        rows = parse_csv(await request.body())
+    else:
+        try:
+            rows = await request.json()
+        except ValueError:
+            # Битый JSON (в том числе не UTF-8) — ошибка клиента, а не 500
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of objects")
+
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ROWS} rows per request")
+    return rows
+
+
+def _format_errors(exc: ValidationError):
+    return [{"field": ".".join(str(part) for part in error["loc"]), "message": error["msg"]} for error in exc.errors()]
+
+
+def _chunks(items, size=BULK_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def import_rows(db: Session, rows, schema, model, owner_field: str, current, before_update=None):
+    """Проверяет строки схемой и пишет их пачками в одной транзакции.
+
+    Строки с id обновляют существующие записи (upsert), без id — вставляются.
+    Невалидные строки пропускаются и попадают в отчёт об ошибках.
+    before_update(db, batch) вызывается перед каждой пачкой обновлений, пока в базе старые значения.
+    """
+    errors = []
+    inserts = []
+    updates = []
+    for index, row in enumerate(rows):
+        row = dict(row)
+        row_id = row.pop("id", None)
+        try:
+            values = schema(**row).dict()
+        except ValidationError as exc:
+            errors.append({"row": index, "errors": _format_errors(exc)})
+            continue
+        if not current.is_superuser and values[owner_field] != current.supplier_id:
+            errors.append({"row": index, "errors": [{"field": owner_field, "message": "Not allowed for this supplier"}]})
+            continue
+        if row_id is None:
+            inserts.append(values)
+            continue
+        try:
+            updates.append((index, int(row_id), values))
+        except (TypeError, ValueError):
+            errors.append({"row": index, "errors": [{"field": "id", "message": "Invalid id"}]})
+
+    owners = {}
+    update_ids = [row_id for _, row_id, _ in updates]
+    owner_column = getattr(model, owner_field)
+    for batch in _chunks(update_ids):
+        owners.update(db.query(model.id, owner_column).filter(model.id.in_(batch)).all())
+
+    update_values = []
+    for index, row_id, values in updates:
+        if row_id not in owners:
+            errors.append({"row": index, "errors": [{"field": "id", "message": "Not found"}]})
+        elif not current.is_superuser and owners[row_id] != current.supplier_id:
+            errors.append({"row": index, "errors": [{"field": "id", "message": "Not allowed for this supplier"}]})
+        else:
+            update_values.append({"id": row_id, **values})
+
+    for batch in _chunks(inserts):
+        db.execute(insert(model), batch)
+    for batch in _chunks(update_values):
+        if before_update is not None:
+            before_update(db, batch)
+        db.execute(update(model), batch)
+    db.commit()
+
+    errors.sort(key=lambda error: error["row"])
+    return {"inserted": len(inserts), "updated": len(update_values), "errors": errors}
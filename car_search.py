@@ -0,0 +1,202 @@
+import bisect
+import logging
+import threading
+import time
+from operator import itemgetter
+
+from catalog_cache import CATALOG_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+def _supplier_id(row):
+    return row["supplier"]["id"] if row["supplier"] else None
+
+
+# Атрибуты с фасетами: значение -> битовая маска машин с этим значением
+FACETS = {
+    "car_type": itemgetter("car_type"),
+    "transmission": itemgetter("transmission"),
+    "fuel_type": itemgetter("fuel_type"),
+    "drive_type": itemgetter("drive_type"),
+    "seats": itemgetter("seats"),
+    "year": itemgetter("year"),
+    "has_air_conditioning": itemgetter("has_air_conditioning"),
+    "supplier_id": _supplier_id,
+}
+
+
+def _nulls_last(getter, reverse=False):
+    sign = -1 if reverse else 1
+
+    def key(row):
+        value = getter(row)
+        return (value is None, sign * value if value is not None else 0, row["id"])
+
+    return key
+
+
+SORTS = {
+    "price_desc": _nulls_last(itemgetter("price_per_day"), reverse=True),
+    "year_desc": _nulls_last(itemgetter("year"), reverse=True),
+    "year_asc": _nulls_last(itemgetter("year")),
+    "newest": lambda row: -row["id"],
+}
+
+
+class CarSnapshot:
+    """Колоночный снимок каталога: фильтры и фасеты считаются AND/popcount по битовым маскам.
+
+    Строки упорядочены по цене, поэтому диапазон цен — непрерывный отрезок бит.
+    """
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=_nulls_last(itemgetter("price_per_day")))
+        self.size = len(self.rows)
+        self.all = (1 << self.size) - 1
+        self.prices = [row["price_per_day"] for row in self.rows if row["price_per_day"] is not None]
+
+        self.values = {}
+        for name, getter in FACETS.items():
+            positions = {}
+            for index, row in enumerate(self.rows):
+                value = getter(row)
+                if value is not None:
+                    positions.setdefault(value, []).append(index)
+            self.values[name] = {value: self._mask(positions[value]) for value in sorted(positions)}
+
+        self.orders = {"price_asc": range(self.size)}
+        for name, key in SORTS.items():
+            self.orders[name] = sorted(range(self.size), key=lambda index: key(self.rows[index]))
+
+    def _mask(self, positions):
+        buffer = bytearray((self.size + 7) // 8)
+        for index in positions:
+            buffer[index >> 3] |= 1 << (index & 7)
+        return int.from_bytes(buffer, "little")
+
+    def _price_mask(self, min_price, max_price):
+        low = bisect.bisect_left(self.prices, min_price) if min_price is not None else 0
+        high = bisect.bisect_right(self.prices, max_price) if max_price is not None else len(self.prices)
+        if min_price is None and max_price is None:
+            return self.all  # без фильтра по цене машины без цены тоже подходят
+        return ((1 << high) - 1) ^ ((1 << low) - 1) if high > low else 0
+
+    def _value_mask(self, name, accept):
+        mask = 0
+        for value, value_mask in self.values[name].items():
+            if accept(value):
+                mask |= value_mask
+        return mask
+
+    def search(self, values, ranges, min_price, max_price, sort, offset, limit):
+        masks = {}
+        for name, accepted in values.items():
+            if accepted:
+                masks[name] = self._value_mask(name, accepted.__contains__)
+        for name, (low, high) in ranges.items():
+            if low is not None or high is not None:
+                mask = self._value_mask(
+                    name, lambda value: (low is None or value >= low) and (high is None or value <= high)
+                )
+                masks[name] = masks.get(name, self.all) & mask
+        price_mask = self._price_mask(min_price, max_price)
+
+        def combined(exclude=None):
+            mask = price_mask
+            for name, filter_mask in masks.items():
+                if name != exclude:
+                    mask &= filter_mask
+            return mask
+
+        matched = combined()
+        # Счётчики фасета не учитывают фильтр по самому атрибуту, иначе выбранный SUV скрыл бы седаны
+        facets = {}
+        for name, value_masks in self.values.items():
+            base = combined(name) if name in masks else matched
+            counts = []
+            for value, value_mask in value_masks.items():
+                count = (base & value_mask).bit_count()
+                if count:
+                    counts.append({"value": value, "count": count})
+            facets[name] = counts
+
+        bits = bin(matched)[:1:-1]  # bits[i] — бит i-й строки
+        items = []
+        skipped = 0
+        for index in self.orders[sort]:
+            if index >= len(bits) or bits[index] != "1":
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            items.append(self.rows[index])
+            if len(items) == limit:
+                break
+
+        return {"total": matched.bit_count(), "items": items, "facets": facets}
+
+
+class CarSearchIndex:
+    """Снимок перестраивается после изменений машин (invalidate) или по TTL.
+
+    Перестройка большого каталога занимает секунды, поэтому идёт в фоновом потоке,
+    а поиск до её конца отвечает по старому снимку. Ждёт только самая первая сборка.
+    """
+
+    def __init__(self, loader, ttl: float = CATALOG_CACHE_TTL):
+        self.loader = loader
+        self.ttl = ttl
+        self._snapshot = None
+        self._expires_at = 0.0
+        self._version = 0  # растёт при каждом invalidate
+        self._built_version = None
+        self._rebuilding = False
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def _build(self, only_if_missing=False):
+        with self._build_lock:
+            if only_if_missing and self._snapshot is not None:
+                return  # первую сборку уже сделал другой поток
+            version = self._version
+            # Изменение во время загрузки оставит снимок устаревшим — следующий запрос начнёт новую сборку
+            self._snapshot = CarSnapshot(self.loader())
+            self._built_version = version
+            self._expires_at = time.monotonic() + self.ttl
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def build():
+            try:
+                self._build()
+            except Exception:
+                logger.exception("Car search snapshot rebuild failed")
+            finally:
+                with self._lock:
+                    self._rebuilding = False
+
+        threading.Thread(target=build, daemon=True, name="car-search-snapshot").start()
+
+    def snapshot(self) -> CarSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            self._build(only_if_missing=True)
+            return self._snapshot
+        if self._built_version != self._version or time.monotonic() >= self._expires_at:
+            self._rebuild_in_background()
+        return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+
+    def warm_up(self):
+        self._rebuild_in_background()
+
+    def search(self, values, ranges, min_price=None, max_price=None, sort="price_asc", offset=0, limit=20):
+        return self.snapshot().search(values, ranges, min_price, max_price, sort, offset, limit)
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from fastapi import Request, Response
+
+from json_utils import dumps
+
+# Страховка для нескольких воркеров: инвалидация локальная, поэтому записи живут ограниченное время
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+# Сверх лимита вытесняются давно не читавшиеся записи
+CATALOG_CACHE_MAX_ENTRIES = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", "1000"))
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class LoadAbandoned(Exception):
+    """Загрузчик отменён до результата; ожидающие повторяют попытку сами."""
+
+
+class CatalogCache:
+    """In-process кэш каталога с single-flight загрузкой и инвалидацией по префиксу ключа."""
+
+    def __init__(self, ttl: float = CATALOG_CACHE_TTL, max_entries: int = CATALOG_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._key_locks = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.invalidated_at = float("-inf")  # time.monotonic() последней инвалидации
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_load(self, key: str, loader):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry:
+                self.hits += 1
+                return entry[1]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Холодный ключ грузит один поток, остальные ждут его результат
+        with key_lock:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry:
+                    self.coalesced += 1
+                    return entry[1]
+                self.misses += 1
+                generation = self._generation
+            try:
+                value = loader()
+                with self._lock:
+                    # Если во время загрузки была инвалидация, результат мог устареть — не сохраняем
+                    if generation == self._generation:
+                        self._store(key, value)
+            finally:
+                with self._lock:
+                    # Замок нужен только на время загрузки; ждущие уже держат ссылку на него
+                    if self._key_locks.get(key) is key_lock:
+                        del self._key_locks[key]
+            return value
+
+    async def get_or_load_async(self, key: str, loader):
+        """То же, что get_or_load, для async обработчиков: ожидающие не занимают потоки."""
+        retry = False
+        while True:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry:
+                    self.hits += not retry
+                    return entry[1]
+                pending = self._pending.get(key)
+                if pending is not None:
+                    self.coalesced += not retry
+                else:
+                    self.misses += 1
+                    self.coalesced -= retry  # ожидание стало загрузкой
+                    generation = self._generation
+                    pending = self._pending[key] = asyncio.get_running_loop().create_future()
+                    break
+            try:
+                return await asyncio.shield(pending)
+            except LoadAbandoned:
+                retry = True  # запрос-загрузчик отменён (клиент ушёл) — загрузку подхватит один из ожидающих
+
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            pending.set_exception(LoadAbandoned())
+            pending.exception()
+            raise
+        except Exception as exc:
+            pending.set_exception(exc)
+            pending.exception()  # ошибку получат ожидающие; не логируем её как потерянную
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+        with self._lock:
+            if generation == self._generation:
+                self._store(key, value)
+        pending.set_result(value)
+        return value
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def invalidate(self, *prefixes: str):
+        with self._lock:
+            self._generation += 1
+            self.invalidated_at = time.monotonic()
+            if not prefixes:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k.startswith(prefixes)]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            served = self.hits + self.coalesced
+            total = served + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+                "hits": self.hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "hit_ratio": served / total if total else 0.0,
+            }
+
+
+catalog_cache = CatalogCache()
+
+
+def render_json(data) -> CachedResponse:
+    return CachedResponse(dumps(data))
+
+
+def etag_matches(request: Request, etag: str):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _conditional_response(request: Request, cached: CachedResponse):
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+
+def cached_json_response(request: Request, key: str, loader):
+    cached = catalog_cache.get_or_load(key, lambda: render_json(loader()))
+    return _conditional_response(request, cached)
+
+
+async def cached_json_response_async(request: Request, key: str, loader):
+    async def load():
+        return render_json(await loader())
+
+    cached = await catalog_cache.get_or_load_async(key, load)
+    return _conditional_response(request, cached)
@@ -1,33 +1,308 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+import logging
 import os
+import threading
+import time
+import traceback
 from dotenv import load_dotenv
 
+from catalog_cache import catalog_cache
+
 load_dotenv()  # Загружаем переменные из .env
 
+logger = logging.getLogger(__name__)
+
 USER = os.getenv("user")
 PASSWORD = os.getenv("password")
 HOST = os.getenv("host")
 PORT = os.getenv("port")
 DBNAME = os.getenv("dbname")
 
-#DATABASE_URL = os.getenv("DATABASE_URL")
-DATABASE_URL = f"postgresql+psycopg2://{USER}:{PASSWORD}@{HOST}:{PORT}/{DBNAME}?sslmode=require"
+# DATABASE_URL (например sqlite:///./dev.db или локальный Postgres) имеет приоритет над отдельными параметрами
+DATABASE_URL = os.getenv("DATABASE_URL") or f"postgresql+psycopg2://{USER}:{PASSWORD}@{HOST}:{PORT}/{DBNAME}?sslmode=require"
+# Необязательная реплика для read-only эндпоинтов
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Соединение, которое держат дольше порога, считается утечкой и попадает в лог
+DB_LEAK_THRESHOLD = float(os.getenv("DB_LEAK_THRESHOLD", "30"))
+DB_LEAK_TRACEBACKS = os.getenv("DB_LEAK_TRACEBACKS", "0") == "1"
+DB_REPLICA_RETRY_SECONDS = float(os.getenv("DB_REPLICA_RETRY_SECONDS", "30"))
+# Сколько после правки каталога читать с основной базы: дольше этого реплика не должна отставать
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+
+
+class PoolMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+        self.leaks_reported = 0
+        self.held = {}  # id(dbapi connection) -> (время выдачи, стек или None)
+        self.lock = threading.Lock()
+        self.engine = None
+
+    def record_wait(self, seconds: float, timed_out: bool):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        stack = traceback.format_stack(limit=15) if DB_LEAK_TRACEBACKS else None
+        with self.lock:
+            self.held[id(dbapi_connection)] = (time.monotonic(), stack)
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        with self.lock:
+            entry = self.held.pop(id(dbapi_connection), None)
+        if entry and time.monotonic() - entry[0] > DB_LEAK_THRESHOLD:
+            logger.warning("%s pool: connection returned after %.1fs", self.name, time.monotonic() - entry[0])
+
+    def on_detach(self, dbapi_connection, connection_record):
+        # Отсоединённые от пула соединения (например LISTEN) живут сколько нужно
+        with self.lock:
+            self.held.pop(id(dbapi_connection), None)
+
+    def leaked(self):
+        now = time.monotonic()
+        with self.lock:
+            return [(now - started, stack) for started, stack in self.held.values() if now - started > DB_LEAK_THRESHOLD]
+
+    def stats(self):
+        pool = self.engine.pool if self.engine is not None else None
+        with self.lock:
+            stats = {
+                "checkouts": self.checkouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "timeouts": self.timeouts,
+                "held": len(self.held),
+                "leaks_reported": self.leaks_reported,
+            }
+        stats["leaked"] = len(self.leaked())
+        if isinstance(pool, QueuePool):
+            stats.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+        return stats
+
+
+def instrumented_pool_class(metrics: PoolMetrics, base=QueuePool):
+    class InstrumentedQueuePool(base):
+        # Время ожидания свободного соединения — главный сигнал насыщения пула
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                metrics.record_wait(time.perf_counter() - started, timed_out=True)
+                raise
+            metrics.record_wait(time.perf_counter() - started, timed_out=False)
+            return connection
+
+    return InstrumentedQueuePool
 
 
-engine = create_engine(DATABASE_URL)
+pool_metrics = {}
+
+
+def make_engine(url: str, name: str):
+    metrics = PoolMetrics(name)
+    options = {"pool_pre_ping": True}
+    if not url.startswith("sqlite"):
+        options.update(
+            poolclass=instrumented_pool_class(metrics),
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    new_engine = create_engine(url, **options)
+    metrics.engine = new_engine
+    event.listen(new_engine, "checkout", metrics.on_checkout)
+    event.listen(new_engine, "checkin", metrics.on_checkin)
+    event.listen(new_engine, "detach", metrics.on_detach)
+    pool_metrics[name] = metrics
+    return new_engine
+
+
+engine = make_engine(DATABASE_URL, "primary")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+replica_engine = make_engine(DATABASE_REPLICA_URL, "replica") if DATABASE_REPLICA_URL else None
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine else SessionLocal
+_replica_down_until = 0.0
+
 Base = declarative_base()
 
-# Автоматическое создание таблиц при запуске
-from models import ConfirmedBooking, Supplier, Excursion, Car, CarReservation, ExcursionReservation
-Base.metadata.create_all(bind=engine)
+# Схема создаётся и обновляется миграциями: python migrations.py
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def dialect_insert(db):
+    """insert() с поддержкой ON CONFLICT для текущей базы (Postgres или SQLite)."""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+
+def async_database_url(url: str):
+    # Тот же DSN, но с асинхронным драйвером: psycopg2 -> asyncpg, pysqlite -> aiosqlite
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite")
+    query = dict(parsed.query)
+    sslmode = query.pop("sslmode", None)
+    if sslmode:
+        query["ssl"] = sslmode
+    return parsed.set(drivername="postgresql+asyncpg", query=query)
+
+
+def make_async_engine(url: str, name: str):
+    # Асинхронные движки обслуживают чтение каталога, поэтому их пулы меряются так же, как синхронные
+    metrics = PoolMetrics(name)
+    options = {"pool_pre_ping": True}
+    if not url.startswith("sqlite"):
+        options.update(
+            poolclass=instrumented_pool_class(metrics, AsyncAdaptedQueuePool),
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    new_engine = create_async_engine(async_database_url(url), **options)
+    metrics.engine = new_engine.sync_engine
+    event.listen(new_engine.sync_engine, "checkout", metrics.on_checkout)
+    event.listen(new_engine.sync_engine, "checkin", metrics.on_checkin)
+    event.listen(new_engine.sync_engine, "detach", metrics.on_detach)
+    pool_metrics[name] = metrics
+    return new_engine
+
+
+async_engine = make_async_engine(DATABASE_URL, "primary_async")
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async_replica_engine = make_async_engine(DATABASE_REPLICA_URL, "replica_async") if DATABASE_REPLICA_URL else None
+AsyncReadSessionLocal = (
+    async_sessionmaker(async_replica_engine, autoflush=False, expire_on_commit=False)
+    if async_replica_engine
+    else AsyncSessionLocal
+)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def use_replica(replica):
+    """Реплика недоступна или могла ещё не получить последнюю правку каталога — читаем с основной базы.
+
+    Иначе отстающая реплика отдала бы старый каталог сразу после инвалидации, и кэш хранил бы его весь TTL.
+    """
+    now = time.monotonic()
+    return (
+        replica is not None
+        and now >= _replica_down_until
+        and now - catalog_cache.invalidated_at >= DB_REPLICA_MAX_LAG
+    )
+
+
+def open_read_session():
+    global _replica_down_until
+    if use_replica(replica_engine):
+        db = ReadSessionLocal()
+        try:
+            db.connection()  # сразу берём соединение, чтобы pre-ping проверил реплику
+            return db
+        except (OperationalError, PoolTimeoutError):
+            db.close()
+            _replica_down_until = time.monotonic() + DB_REPLICA_RETRY_SECONDS
+            logger.warning("Read replica unavailable, using primary for %ss", DB_REPLICA_RETRY_SECONDS)
+    return SessionLocal()
+
+
+def get_read_db():
+    db = open_read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db():
+    global _replica_down_until
+    if use_replica(async_replica_engine):
+        db = AsyncReadSessionLocal()
+        try:
+            await db.connection()
+        except (OperationalError, PoolTimeoutError, OSError):
+            await db.close()
+            _replica_down_until = time.monotonic() + DB_REPLICA_RETRY_SECONDS
+            logger.warning("Read replica unavailable, using primary for %ss", DB_REPLICA_RETRY_SECONDS)
+        else:
+            try:
+                yield db
+            finally:
+                await db.close()
+            return
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def pool_stats():
+    return {name: metrics.stats() for name, metrics in pool_metrics.items()}
+
+
+def _report_leaks(stop_event: threading.Event):
+    reported = set()
+    while not stop_event.wait(DB_LEAK_THRESHOLD / 2):
+        alive = set()
+        now = time.monotonic()
+        for name, metrics in pool_metrics.items():
+            with metrics.lock:
+                held = dict(metrics.held)
+            for key, (started, stack) in held.items():
+                alive.add((name, key, started))
+                if now - started > DB_LEAK_THRESHOLD and (name, key, started) not in reported:
+                    reported.add((name, key, started))
+                    metrics.leaks_reported += 1
+                    logger.warning(
+                        "%s pool: connection held for %.1fs%s",
+                        name,
+                        now - started,
+                        "\n" + "".join(stack) if stack else "",
+                    )
+        reported &= alive
+
+
+_leak_stop = threading.Event()
+
+
+def start_leak_detector():
+    _leak_stop.clear()
+    threading.Thread(target=_report_leaks, args=(_leak_stop,), daemon=True, name="db-leak-detector").start()
+
+
+def stop_leak_detector():
+    _leak_stop.set()
@@ -0,0 +1,67 @@
+from datetime import date, timedelta
+
+ONE_DAY = timedelta(days=1)
+# Защита от случайного «до 2999 года» в правилах повторения
+MAX_RANGE_DAYS = 3660
+
+
+def merge_ranges(ranges):
+    """Сливает пересекающиеся и соседние диапазоны (даты включительно), результат отсортирован."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + ONE_DAY:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def check_range(start: date, end: date):
+    """ValueError для перевёрнутого или слишком длинного диапазона (даты включительно)."""
+    if end < start:
+        raise ValueError("end_date must not be before start_date")
+    if (end - start).days > MAX_RANGE_DAYS:
+        raise ValueError(f"Date range is longer than {MAX_RANGE_DAYS} days")
+
+
+def days_in_range(start: date, end: date):
+    if (end - start).days > MAX_RANGE_DAYS:
+        raise ValueError(f"Date range is longer than {MAX_RANGE_DAYS} days")
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def weekly_dates(start: date, until: date, weekdays):
+    """Все даты с start по until включительно, попадающие на weekdays (0 = понедельник)."""
+    wanted = set(weekdays)
+    return [day for day in days_in_range(start, until) if day.weekday() in wanted]
+
+
+def clip_ranges(ranges, start: date, end: date):
+    return [(max(s, start), min(e, end)) for s, e in ranges if s <= end and e >= start]
+
+
+def ranges_to_bitmap(ranges, start: date, end: date):
+    """Бит на каждый день окна (старший бит первого байта = start), 1 — день занят."""
+    days = (end - start).days + 1
+    bits = bytearray((days + 7) // 8)
+    for s, e in ranges:
+        for offset in range((s - start).days, (e - start).days + 1):
+            bits[offset >> 3] |= 0x80 >> (offset & 7)
+    return bytes(bits)
+
+
+def subtract_ranges(ranges, taken):
+    """Части ranges, не покрытые диапазонами taken (даты включительно)."""
+    taken = merge_ranges(taken)
+    result = []
+    for start, end in ranges:
+        for taken_start, taken_end in taken:
+            if taken_end < start or taken_start > end:
+                continue
+            if taken_start > start:
+                result.append((start, taken_start - ONE_DAY))
+            start = taken_end + ONE_DAY
+        if start <= end:
+            result.append((start, end))
+    return result
@@ -1,12 +1,39 @@
+import logging
+import random
 import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 import os
 from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import EmailOutbox
 
 load_dotenv()  # Загружаем переменные из .env
 
+logger = logging.getLogger(__name__)
+
+# Для локальной проверки: SMTP_HOST=localhost SMTP_PORT=1025 SMTP_SSL=0
+# и любой отладочный SMTP сервер (например `python -m aiosmtpd -n -l localhost:1025`)
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_SSL = os.getenv("SMTP_SSL", "1") == "1"
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "1"))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "8"))
+EMAIL_POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", "2"))
+EMAIL_BACKOFF_BASE = float(os.getenv("EMAIL_BACKOFF_BASE", "5"))
+EMAIL_BACKOFF_MAX = float(os.getenv("EMAIL_BACKOFF_MAX", "3600"))
+# Сколько секунд письмо считается захваченным воркером (на случай падения процесса)
+EMAIL_LEASE_SECONDS = float(os.getenv("EMAIL_LEASE_SECONDS", "300"))
+
 
-def send_booking_email(booking):
+def render_booking_email(booking):
     if booking.booking_type == "excursion":
         body = f"""
 Новая заявка на экскурсию:
@@ -45,11 +72,171 @@ Email: {booking.email}
 """
         subject = f"Аренда авто: {booking.firstName} {booking.lastName} ({booking.start_date})"
 
-    msg = MIMEText(body)
-    msg['Subject'] = subject
-    msg['From'] = os.getenv("EMAIL_USER")
-    msg['To'] = os.getenv("EMAIL_TO")
+    return subject, body
+
+
+def enqueue_booking_email(db: Session, booking):
+    # Письмо пишется в outbox в той же транзакции, что и бронь; commit делает вызывающий код
+    subject, body = render_booking_email(booking)
+    db.add(EmailOutbox(recipient=os.getenv("EMAIL_TO"), subject=subject, body=body))
+
+
+class SMTPConnection:
+    """Одно авторизованное SMTP соединение, переиспользуемое между письмами."""
+
+    def __init__(self):
+        self.server = None
+        self.last_used = 0.0
+
+    def _connect(self):
+        if SMTP_SSL:
+            server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=30)
+        else:
+            server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+        password = os.getenv("EMAIL_PASS")
+        if password:
+            server.login(os.getenv("EMAIL_USER"), password)
+        self.server = server
+
+    def send(self, msg):
+        if self.server is None:
+            self._connect()
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Сервер закрыл простаивающее соединение — переподключаемся один раз
+            self.close()
+            self._connect()
+            self.server.send_message(msg)
+        self.last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self.server is not None and time.monotonic() - self.last_used > SMTP_IDLE_TIMEOUT:
+            self.close()
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.server = None
+
+
+def _backoff(attempts: int):
+    delay = min(EMAIL_BACKOFF_BASE * 2 ** (attempts - 1), EMAIL_BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_batch(db: Session, limit: int = EMAIL_BATCH_SIZE):
+    now = datetime.utcnow()
+    candidates = (
+        db.query(EmailOutbox.id, EmailOutbox.attempts)
+        .filter(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    claimed = []
+    lease_until = now + timedelta(seconds=EMAIL_LEASE_SECONDS)
+    for outbox_id, attempts in candidates:
+        # Условный UPDATE: письмо достаётся только одному воркеру даже без SKIP LOCKED
+        updated = (
+            db.query(EmailOutbox)
+            .filter(
+                EmailOutbox.id == outbox_id,
+                EmailOutbox.status == "pending",
+                EmailOutbox.attempts == attempts,
+            )
+            .update(
+                {"attempts": attempts + 1, "next_attempt_at": lease_until},
+                synchronize_session=False,
+            )
+        )
+        if updated:
+            claimed.append(outbox_id)
+    db.commit()
+    if not claimed:
+        return []
+    return db.query(EmailOutbox).filter(EmailOutbox.id.in_(claimed)).all()
+
+
+def deliver_batch(db: Session, connection: SMTPConnection, limit: int = EMAIL_BATCH_SIZE):
+    items = claim_batch(db, limit)
+    for item in items:
+        msg = MIMEText(item.body)
+        msg["Subject"] = item.subject
+        msg["From"] = os.getenv("EMAIL_USER")
+        msg["To"] = item.recipient
+        try:
+            connection.send(msg)
+        except (smtplib.SMTPException, OSError) as exc:
+            connection.close()
+            item.last_error = str(exc)[:500]
+            if item.attempts >= EMAIL_MAX_ATTEMPTS:
+                item.status = "failed"
+                logger.error("Outbox email %s failed permanently: %s", item.id, exc)
+            else:
+                item.next_attempt_at = datetime.utcnow() + _backoff(item.attempts)
+                logger.warning("Outbox email %s attempt %s failed: %s", item.id, item.attempts, exc)
+        else:
+            item.status = "sent"
+            item.sent_at = datetime.utcnow()
+            item.last_error = None
+        db.commit()
+    return len(items)
+
+
+class OutboxWorker(threading.Thread):
+    def __init__(self, stop_event: threading.Event):
+        super().__init__(daemon=True, name="email-outbox")
+        self.stop_event = stop_event
+        self.connection = SMTPConnection()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            db = SessionLocal()
+            try:
+                sent = deliver_batch(db, self.connection)
+            except Exception:
+                logger.exception("Email outbox worker error")
+                db.rollback()
+                sent = 0
+            finally:
+                db.close()
+            if sent < EMAIL_BATCH_SIZE:
+                self.connection.close_if_idle()
+                self.stop_event.wait(EMAIL_POLL_INTERVAL)
+        self.connection.close()
+
+
+_stop_event = threading.Event()
+_workers: list[OutboxWorker] = []
+
+
+def start_outbox_workers(count: int = EMAIL_WORKERS):
+    _stop_event.clear()
+    for _ in range(count - len(_workers)):
+        worker = OutboxWorker(_stop_event)
+        worker.start()
+        _workers.append(worker)
+
+
+def stop_outbox_workers(timeout: float = 10):
+    _stop_event.set()
+    for worker in _workers:
+        worker.join(timeout)
+    _workers.clear()
+
 
-    with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-        server.login(msg['From'], os.getenv("EMAIL_PASS"))
-        server.send_message(msg)
\ No newline at end of file
+if __name__ == "__main__":
+    # Отдельный процесс-отправитель: запуск с EMAIL_WORKERS=0 в API и `python email_utils.py`
+    logging.basicConfig(level=logging.INFO)
+    start_outbox_workers(max(EMAIL_WORKERS, 1))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_outbox_workers()
@@ -0,0 +1,338 @@
+import bisect
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Полная перестройка страхует от рассинхрона между воркерами; между ними индекс обновляют обработчики админки
+EXCURSION_INDEX_TTL = float(os.getenv("EXCURSION_INDEX_TTL", "900"))
+PREFIX_EXPANSIONS = 50
+MASK_CACHE_SIZE = 4096
+FUZZY_MIN_LENGTH = 4
+
+LANGS = ("en", "ru")
+# Поле, язык (None — индексируется для обоих) и вес в ранжировании
+FIELDS = (
+    ("title", None, 3.0),
+    ("location_en", "en", 2.0),
+    ("location_ru", "ru", 2.0),
+    ("description_en", "en", 1.0),
+    ("description_ru", "ru", 1.0),
+)
+EXACT, PREFIX, FUZZY = 1.0, 0.8, 0.6
+
+WORD_RE = re.compile(r"\w+")
+CYRILLIC_RE = re.compile(r"[а-я]")
+
+EN_SUFFIXES = ("ations", "ation", "ments", "ment", "ness", "ings", "ing", "ies", "ied", "ers", "er", "ed", "ly", "es", "s")
+RU_REFLEXIVE = ("ся", "сь")
+RU_ENDINGS = tuple(sorted(
+    {
+        # прилагательные и причастия
+        "ими", "ыми", "его", "ого", "ему", "ому", "ее", "ие", "ые", "ое", "ей", "ий", "ый", "ой",
+        "ем", "им", "ым", "ом", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+        # существительные
+        "иями", "ями", "ами", "ией", "иям", "ием", "иях", "ев", "ов", "ье", "еи", "ии", "ям",
+        "ам", "ах", "ях", "ию", "ью", "ия", "ья", "я", "а", "е", "и", "й", "о", "у", "ы", "ь", "ю",
+        # глаголы
+        "ать", "ять", "ить", "еть", "ешь", "ует", "уют", "ают", "яют", "ит", "ет", "ут", "ют",
+        "ла", "ло", "ли", "ть",
+    },
+    key=len,
+    reverse=True,
+))
+
+
+def tokenize(text: str):
+    return WORD_RE.findall(text.lower().replace("ё", "е"))
+
+
+def _strip(word: str, endings, min_stem: int):
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= min_stem:
+            return word[: -len(ending)]
+    return word
+
+
+def stem_word(word: str) -> str:
+    """Лёгкий стемминг: отрезает типичные окончания, язык определяется по алфавиту слова."""
+    if CYRILLIC_RE.search(word):
+        return _strip(_strip(word, RU_REFLEXIVE, 3), RU_ENDINGS, 3)
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("es") and word[:-2].endswith(("s", "x", "z", "ch", "sh")):
+        return word[:-2]
+    return _strip(word, EN_SUFFIXES, 3)
+
+
+def _deletes(term: str):
+    return {term} | {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a: str, b: str):
+    # Дамерау–Левенштейн <= 1: замена, вставка, удаление или перестановка соседних букв
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diff = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    if len(a) > len(b):
+        a, b = b, a
+    for i in range(len(a)):
+        if a[i] != b[i]:
+            return a[i:] == b[i + 1:]
+    return True
+
+
+class _InvertedIndex:
+    def __init__(self):
+        self.docs = {}
+        # Постинги упорядочены по вкладу: стем -> {вес: id экскурсий}; лучшие совпадения берутся первыми
+        self.postings = {lang: {} for lang in LANGS}
+        self.df = {lang: {} for lang in LANGS}
+        self.by_operator = {}
+        self._masks = {}  # битовые маски (бит = id экскурсии) для постингов, которые уже спрашивали
+        self.words = {}  # словоформа -> стем, для префиксного поиска
+        self.sorted_words = None
+        self.deletes = {}  # вариант стема без одной буквы -> стемы, для опечаток
+
+    def _register(self, word: str):
+        stem = self.words.get(word)
+        if stem is None:
+            stem = self.words[word] = stem_word(word)
+            if self.sorted_words is not None:
+                bisect.insort(self.sorted_words, word)
+            if len(stem) >= FUZZY_MIN_LENGTH:
+                for variant in _deletes(stem):
+                    self.deletes.setdefault(variant, set()).add(stem)
+        return stem
+
+    def _weights(self, doc: dict):
+        weights = {}
+        for field, field_lang, weight in FIELDS:
+            text = doc.get(field)
+            if not text:
+                continue
+            for word in set(tokenize(text)):
+                stem = self._register(word)
+                for lang in LANGS if field_lang is None else (field_lang,):
+                    weights[lang, stem] = weights.get((lang, stem), 0.0) + weight
+        return weights
+
+    def add(self, doc: dict):
+        doc_id = doc["id"]
+        self.remove(doc_id)
+        for (lang, stem), weight in self._weights(doc).items():
+            self.postings[lang].setdefault(stem, {}).setdefault(weight, set()).add(doc_id)
+            self.df[lang][stem] = self.df[lang].get(stem, 0) + 1
+            self._masks.pop((lang, stem, weight), None)
+        self.by_operator.setdefault(doc.get("operator_id"), set()).add(doc_id)
+        self._masks.pop(("operator", doc.get("operator_id")), None)
+        self.docs[doc_id] = doc
+
+    def remove(self, doc_id: int):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        # Веса пересчитываются из сохранённого документа, чтобы не держать их для каждой экскурсии
+        for (lang, stem), weight in self._weights(doc).items():
+            self._masks.pop((lang, stem, weight), None)
+            levels = self.postings[lang][stem]
+            levels[weight].discard(doc_id)
+            if not levels[weight]:
+                del levels[weight]
+            self.df[lang][stem] -= 1
+            if not levels:
+                del self.postings[lang][stem]
+                del self.df[lang][stem]
+        self.by_operator[doc.get("operator_id")].discard(doc_id)
+        self._masks.pop(("operator", doc.get("operator_id")), None)
+
+    def _mask(self, key, doc_ids):
+        mask = self._masks.get(key)
+        if mask is None:
+            buffer = bytearray((max(doc_ids, default=0) >> 3) + 1)
+            for doc_id in doc_ids:
+                buffer[doc_id >> 3] |= 1 << (doc_id & 7)
+            mask = int.from_bytes(buffer, "little")
+            if len(self._masks) >= MASK_CACHE_SIZE:
+                self._masks.clear()
+            self._masks[key] = mask
+        return mask
+
+    def _prefix_words(self, prefix: str):
+        if self.sorted_words is None:
+            self.sorted_words = sorted(self.words)
+        start = bisect.bisect_left(self.sorted_words, prefix)
+        for word in self.sorted_words[start:start + PREFIX_EXPANSIONS]:
+            if not word.startswith(prefix):
+                break
+            yield word
+
+    def _expand(self, token: str, last: bool, langs):
+        stem = stem_word(token)
+        matches = {}
+        if any(stem in self.postings[lang] for lang in langs):
+            matches[stem] = EXACT
+        if last:
+            # Последнее слово запроса может быть недописано — автодополнение по словоформам
+            for word in self._prefix_words(token):
+                matches.setdefault(self.words[word], PREFIX)
+        if not matches and len(stem) >= FUZZY_MIN_LENGTH:
+            for variant in _deletes(stem):
+                for candidate in self.deletes.get(variant, ()):
+                    if candidate not in matches and _within_one_edit(stem, candidate):
+                        matches[candidate] = FUZZY
+
+        # Уровни слова: оценка -> экскурсии с такой оценкой, по убыванию оценки
+        by_score = {}
+        for term, factor in matches.items():
+            for lang in langs:
+                levels = self.postings[lang].get(term)
+                if not levels:
+                    continue
+                idf = math.log(1 + len(self.docs) / self.df[lang][term])
+                for weight, doc_ids in levels.items():
+                    score = weight * factor * idf
+                    by_score[score] = by_score.get(score, 0) | self._mask((lang, term, weight), doc_ids)
+        return sorted(by_score.items(), reverse=True)
+
+    def search(self, query: str, langs, operator_id, limit: int, offset: int):
+        tokens = list(dict.fromkeys(tokenize(query)))
+        token_levels = [self._expand(token, i == len(tokens) - 1, langs) for i, token in enumerate(tokens)]
+        if not token_levels or not all(token_levels):
+            return {"total": 0, "items": []}
+
+        # Экскурсия должна совпасть с каждым словом запроса
+        matched = -1
+        for levels in token_levels:
+            token_mask = 0
+            for _, level_mask in levels:
+                token_mask |= level_mask
+            matched &= token_mask
+        if operator_id is not None:
+            matched &= self._mask(("operator", operator_id), self.by_operator.get(operator_id, ()))
+
+        # Ранжирование масками, а не по одной экскурсии: найденное разбивается на классы
+        # с одинаковой суммарной оценкой пересечениями с уровнями каждого слова
+        classes = [(0.0, matched)]
+        for levels in token_levels:
+            refined = []
+            for base, remaining in classes:
+                for level_score, level_mask in levels:
+                    part = remaining & level_mask
+                    if part:
+                        refined.append((base + level_score, part))
+                        remaining ^= part
+                        if not remaining:
+                            break
+            classes = refined
+
+        by_score = {}
+        for score, mask in classes:
+            by_score[score] = by_score.get(score, 0) | mask
+        need = offset + limit
+        top = []
+        for score in sorted(by_score, reverse=True):
+            # Внутри одной оценки — новые экскурсии первыми, то есть старшие биты
+            mask = by_score[score]
+            while mask and len(top) < need:
+                doc_id = mask.bit_length() - 1
+                top.append((doc_id, score))
+                mask ^= 1 << doc_id
+            if len(top) >= need:
+                break
+
+        return {
+            "total": matched.bit_count(),
+            "items": [dict(self.docs[doc_id], score=round(score, 4)) for doc_id, score in top[offset:]],
+        }
+
+
+class ExcursionSearchIndex:
+    """Инвертированный индекс экскурсий в памяти процесса.
+
+    Строится лениво из loader() и перестраивается по TTL; правки админки применяются сразу через upsert/remove.
+    """
+
+    def __init__(self, loader, ttl: float = EXCURSION_INDEX_TTL):
+        self.loader = loader
+        self.ttl = ttl
+        self._index = None
+        self._expires_at = 0.0
+        self._pending = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def _current(self):
+        index = self._index
+        if index is not None and time.monotonic() < self._expires_at:
+            return index
+        # Устаревший индекс продолжает отвечать, пока другой поток строит новый
+        if not self._build_lock.acquire(blocking=index is None):
+            return index
+        try:
+            if self._index is not None and time.monotonic() < self._expires_at:
+                return self._index
+            with self._lock:
+                self._pending = []
+            fresh = _InvertedIndex()
+            for doc in self.loader():
+                fresh.add(doc)
+            with self._lock:
+                # Правки, пришедшие во время загрузки, могли в неё не попасть
+                for doc_id, doc in self._pending:
+                    if doc is None:
+                        fresh.remove(doc_id)
+                    else:
+                        fresh.add(doc)
+                self._pending = None
+                self._index = fresh
+                self._expires_at = time.monotonic() + self.ttl
+            return fresh
+        finally:
+            # Если loader() упал, правки больше некуда применять — иначе список рос бы бесконечно
+            with self._lock:
+                self._pending = None
+            self._build_lock.release()
+
+    def upsert(self, doc: dict):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((doc["id"], doc))
+            if self._index is not None:
+                self._index.add(doc)
+
+    def remove(self, doc_id: int):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((doc_id, None))
+            if self._index is not None:
+                self._index.remove(doc_id)
+
+    def invalidate(self):
+        self._expires_at = 0.0
+
+    def warm_up(self):
+        # Первая сборка на большом каталоге занимает секунды — делаем её в фоне при старте
+        def build():
+            try:
+                self._current()
+            except Exception:
+                logger.exception("Excursion search index warm-up failed")
+
+        threading.Thread(target=build, daemon=True, name="excursion-index").start()
+
+    def search(self, query: str, lang: str | None = None, operator_id: int | None = None, limit: int = 10, offset: int = 0):
+        index = self._current()
+        langs = (lang,) if lang else LANGS
+        with self._lock:
+            return index.search(query, langs, operator_id, limit, offset)
@@ -0,0 +1,81 @@
+import os
+import threading
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import ConfirmedBooking, IdSequence
+
+BOOKING_ID_BLOCK_SIZE = int(os.getenv("BOOKING_ID_BLOCK_SIZE", "100"))
+# Первый номер брони в пустой базе — короткий, но не похожий на порядковый номер
+BOOKING_ID_START = int(os.getenv("BOOKING_ID_START", "100001"))
+# Старые номера броней — unix время оплаты (~1.7e9), новые идут отдельным коротким диапазоном под ними
+LEGACY_BOOKING_ID_MIN = 1_000_000_000
+
+
+class BlockIdAllocator:
+    """Выдаёт id из блоков, зарезервированных в таблице id_sequences.
+
+    Один UPDATE на блок: процессы (воркеры uvicorn) никогда не получают
+    пересекающиеся блоки, а внутри процесса номера строго возрастают.
+    """
+
+    def __init__(self, name: str, block_size: int, initial_value):
+        self.name = name
+        self.block_size = block_size
+        self.initial_value = initial_value
+        self._lock = threading.Lock()
+        self._next = 0
+        self._limit = 0
+
+    def next_id(self) -> int:
+        with self._lock:
+            if self._next >= self._limit:
+                self._next, self._limit = self._reserve_block()
+            value = self._next
+            self._next += 1
+            return value
+
+    def reserve_range(self, count: int):
+        """Отдельный диапазон из count номеров, например для массовой загрузки данных."""
+        return self._reserve_block(count)
+
+    def _reserve_block(self, size: int | None = None):
+        size = size or self.block_size
+        db = SessionLocal()
+        try:
+            while True:
+                # UPDATE берёт блокировку строки, поэтому чтение в той же транзакции согласовано
+                updated = db.execute(
+                    text("UPDATE id_sequences SET next_value = next_value + :block WHERE name = :name"),
+                    {"block": size, "name": self.name},
+                ).rowcount
+                if updated:
+                    limit = db.query(IdSequence.next_value).filter(IdSequence.name == self.name).scalar()
+                    db.commit()
+                    return limit - size, limit
+
+                start = self.initial_value(db)
+                db.add(IdSequence(name=self.name, next_value=start + size))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # Другой процесс создал счётчик одновременно с нами — берём блок обычным путём
+                    db.rollback()
+                    continue
+                return start, start + size
+        finally:
+            db.close()
+
+
+def _initial_booking_id(db):
+    # Продолжение от старых номеров дало бы длинные id у самого предела 32-битной колонки
+    current_max = (
+        db.query(func.max(ConfirmedBooking.booking_id))
+        .filter(ConfirmedBooking.booking_id < LEGACY_BOOKING_ID_MIN)
+        .scalar()
+    )
+    return max((current_max or 0) + 1, BOOKING_ID_START)
+
+
+booking_ids = BlockIdAllocator("booking_id", BOOKING_ID_BLOCK_SIZE, _initial_booking_id)
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, dialect_insert
+from models import IdempotencyKey
+
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+# Сколько повтор ждёт завершения первого запроса с тем же ключом
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+# Обработка дольше этого считается оборвавшейся (упал воркер), ключ можно перехватить
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "120"))
+IDEMPOTENCY_SWEEP_SECONDS = 300
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+POLL_INTERVAL = 0.2
+
+# Повторы в том же процессе просыпаются сразу, из других воркеров — опросом базы
+_waiters = {}
+_waiters_lock = threading.Lock()
+_next_sweep = 0.0
+
+
+class Replay:
+    def __init__(self, status_code: int, body):
+        self.status_code = status_code
+        self.body = body
+
+
+def request_hash(payload: dict):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _sweep(db: Session, now: datetime):
+    global _next_sweep
+    if time.monotonic() < _next_sweep:
+        return
+    _next_sweep = time.monotonic() + IDEMPOTENCY_SWEEP_SECONDS
+    db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < now))
+    db.commit()
+
+
+def _try_claim(db: Session, key: str, digest: str, now: datetime):
+    insert = dialect_insert(db)
+    inserted = db.execute(
+        insert(IdempotencyKey)
+        .values(
+            key=key,
+            request_hash=digest,
+            status="in_progress",
+            created_at=now,
+            expires_at=now + timedelta(hours=IDEMPOTENCY_TTL_HOURS),
+        )
+        .on_conflict_do_nothing(index_elements=["key"])
+    ).rowcount
+    if not inserted:
+        # Просроченный ключ или оборвавшаяся обработка: бронь не записана, ключ переходит к нам
+        inserted = db.execute(
+            update(IdempotencyKey)
+            .where(
+                IdempotencyKey.key == key,
+                (IdempotencyKey.expires_at < now)
+                | (
+                    (IdempotencyKey.status == "in_progress")
+                    & (IdempotencyKey.created_at < now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS))
+                ),
+            )
+            .values(
+                request_hash=digest,
+                status="in_progress",
+                response_code=None,
+                response_body=None,
+                created_at=now,
+                expires_at=now + timedelta(hours=IDEMPOTENCY_TTL_HOURS),
+            )
+        ).rowcount
+    db.commit()
+    return bool(inserted)
+
+
+def claim(key: str, payload: dict):
+    """Закрепляет ключ за текущим запросом или возвращает Replay с ответом первого.
+
+    Пока первый запрос с ключом обрабатывается, повтор ждёт его завершения, а не выполняется параллельно.
+    """
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+    digest = request_hash(payload)
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    db = SessionLocal()
+    try:
+        _sweep(db, datetime.utcnow())
+        while True:
+            if _try_claim(db, key, digest, datetime.utcnow()):
+                return None
+            row = db.get(IdempotencyKey, key)
+            db.commit()  # отпускаем снимок: следующая итерация должна видеть свежие данные
+            if row is None:
+                continue  # ключ удалили между INSERT и чтением — пробуем занять снова
+            if row.request_hash != digest:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+            if row.status == "done":
+                return Replay(row.response_code, json.loads(row.response_body))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is still in progress",
+                    headers={"Retry-After": "1"},
+                )
+            with _waiters_lock:
+                event = _waiters.setdefault(key, threading.Event())
+            event.wait(min(POLL_INTERVAL, remaining))
+    finally:
+        db.close()
+
+
+def complete(db: Session, key: str, status_code: int, body):
+    """Сохраняет ответ в транзакции брони: бронь и ответ на повтор фиксируются вместе."""
+    db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.key == key)
+        .values(status="done", response_code=status_code, response_body=json.dumps(body, default=str))
+    )
+
+
+def release(key: str):
+    """Снимает ключ после неуспешной обработки: ничего не записано, повтор выполнится заново."""
+    db = SessionLocal()
+    try:
+        db.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.status == "in_progress"))
+        db.commit()
+    finally:
+        db.close()
+    notify(key)
+
+
+def notify(key: str):
+    with _waiters_lock:
+        event = _waiters.pop(key, None)
+    if event is not None:
+        event.set()
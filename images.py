@@ -0,0 +1,232 @@
+"""Загрузка фото каталога: варианты размеров создаются один раз при загрузке.
+
+Файлы называются по sha256 исходника, поэтому их можно кэшировать навсегда
+(Cache-Control: immutable): новое фото — новое имя. Локальное хранилище раздаётся
+самим приложением по IMAGE_BASE_URL; другое хранилище (S3, CDN) подключается
+подменой image_store на объект с теми же методами save, delete и url.
+"""
+import hashlib
+import io
+import json
+import os
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from starlette.staticfiles import StaticFiles
+
+from models import CatalogImage
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:  # Pillow необязателен, без него сохраняется только исходный файл
+    Image = None
+
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "media")
+IMAGE_BASE_URL = os.getenv("IMAGE_BASE_URL", "/media")
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(15 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = 50_000_000
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+IMAGES_PER_ITEM = 20
+# Имя варианта и максимальная длинная сторона; крупнее исходника варианты не растягиваются
+IMAGE_VARIANTS = (("thumb", 320), ("medium", 800), ("large", 1600))
+IMAGE_FORMATS = (("webp", "WEBP", {"quality": 80, "method": 4}), ("jpeg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}))
+# Набор id в IN (...) до этого размера, дальше дешевле прочитать все фото этого типа
+IN_LIST_LIMIT = 1000
+
+MAGIC = ((b"\xff\xd8\xff", "jpeg"), (b"\x89PNG\r\n\x1a\n", "png"), (b"GIF8", "gif"))
+
+if Image is not None:
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+
+class LocalImageStore:
+    def __init__(self, root: str, base_url: str):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def save(self, name: str, data: bytes):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, name)
+        if os.path.exists(path):
+            return  # то же содержимое уже загружено — имя по хэшу совпадает
+        # Через временный файл: раздача никогда не увидит недописанную картинку
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def delete(self, name: str):
+        try:
+            os.remove(os.path.join(self.root, name))
+        except FileNotFoundError:
+            pass
+
+    def url(self, name: str):
+        return f"{self.base_url}/{name}"
+
+
+image_store = LocalImageStore(IMAGE_STORE_DIR, IMAGE_BASE_URL)
+
+
+class ImmutableStaticFiles(StaticFiles):
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMAGE_CACHE_CONTROL
+        return response
+
+
+def _render(original, width: int):
+    image = original.copy()
+    image.thumbnail((width, width), Image.LANCZOS)
+    files = []
+    for ext, pil_format, options in IMAGE_FORMATS:
+        frame = image
+        if pil_format == "JPEG" and frame.mode != "RGB":
+            frame = frame.convert("RGB")  # у JPEG нет прозрачности
+        buffer = io.BytesIO()
+        frame.save(buffer, pil_format, **options)
+        files.append((ext, buffer.getvalue()))
+    return image.size, files
+
+
+def make_variants(data: bytes, digest: str):
+    """Список (описание варианта, байты файла) для всех размеров и форматов."""
+    if Image is None:
+        ext = next((ext for magic, ext in MAGIC if data.startswith(magic)), None)
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            ext = "webp"
+        if ext is None:
+            raise HTTPException(status_code=400, detail="Unsupported image format")
+        return [({"name": "original", "width": None, "height": None, "format": ext, "file": f"{digest}.{ext}"}, data)]
+
+    try:
+        original = Image.open(io.BytesIO(data))
+        original.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise HTTPException(status_code=400, detail="Unsupported or corrupted image")
+    original = ImageOps.exif_transpose(original)  # телефоны пишут поворот в EXIF, а не в пиксели
+    if original.mode not in ("RGB", "RGBA"):
+        original = original.convert("RGBA" if "A" in original.getbands() else "RGB")
+
+    variants = []
+    previous_size = None
+    for name, width in IMAGE_VARIANTS:
+        size, files = _render(original, width)
+        if size == previous_size:
+            break  # исходник меньше этого размера — больший вариант был бы копией предыдущего
+        previous_size = size
+        for ext, content in files:
+            variants.append(({
+                "name": name,
+                "width": size[0],
+                "height": size[1],
+                "format": ext,
+                "file": f"{digest}-{name}.{ext}",
+            }, content))
+    return variants
+
+
+def store_image(db: Session, item_type: str, item_id: int, supplier_id: int, data: bytes):
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty file")
+    if len(data) > IMAGE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image is larger than {IMAGE_MAX_BYTES} bytes")
+    count, last_position = (
+        db.query(func.count(CatalogImage.id), func.max(CatalogImage.position))
+        .filter(CatalogImage.item_type == item_type, CatalogImage.item_id == item_id)
+        .one()
+    )
+    if count >= IMAGES_PER_ITEM:
+        raise HTTPException(status_code=400, detail=f"At most {IMAGES_PER_ITEM} images per item")
+
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    variants = make_variants(data, digest)
+    for variant, content in variants:
+        image_store.save(variant["file"], content)
+    image = CatalogImage(
+        item_type=item_type,
+        item_id=item_id,
+        supplier_id=supplier_id,
+        position=0 if last_position is None else last_position + 1,  # после удалений count уже занят
+        content_hash=digest,
+        variants=json.dumps([variant for variant, _ in variants]),
+    )
+    db.add(image)
+    db.commit()
+    db.refresh(image)
+    return image
+
+
+def delete_images(db: Session, images):
+    """Удаляет записи фото вместе с остальными изменениями сессии (коммит здесь), затем их файлы."""
+    files = {}
+    for image in images:
+        files.setdefault(image.content_hash, set()).update(variant["file"] for variant in json.loads(image.variants))
+        db.delete(image)
+    db.commit()
+    if not files:
+        return
+    # Тот же файл мог быть загружен к другой позиции — тогда файлы остаются
+    shared = {
+        content_hash
+        for (content_hash,) in db.query(CatalogImage.content_hash).filter(CatalogImage.content_hash.in_(files)).distinct()
+    }
+    for content_hash, names in files.items():
+        if content_hash not in shared:
+            for name in names:
+                image_store.delete(name)
+
+
+def delete_image(db: Session, image: CatalogImage):
+    delete_images(db, [image])
+
+
+def delete_item_images(db: Session, item_type: str, item_id: int):
+    images = db.query(CatalogImage).filter(CatalogImage.item_type == item_type, CatalogImage.item_id == item_id).all()
+    delete_images(db, images)
+
+
+def image_to_dict(image: CatalogImage):
+    return {
+        "id": image.id,
+        "variants": [
+            {
+                "name": variant["name"],
+                "width": variant["width"],
+                "height": variant["height"],
+                "format": variant["format"],
+                "url": image_store.url(variant["file"]),
+            }
+            for variant in json.loads(image.variants)
+        ],
+    }
+
+
+def legacy_images(urls: str | None):
+    """Ссылки, вставленные до загрузки файлов (image_url, image_urls через запятую)."""
+    return [
+        {"id": None, "variants": [{"name": "original", "width": None, "height": None, "format": None, "url": url}]}
+        for url in (part.strip() for part in (urls or "").split(","))
+        if url
+    ]
+
+
+def load_images(db: Session, item_type: str, item_ids=None):
+    """item_id -> список фото по порядку; item_ids=None — все фото этого типа."""
+    query = db.query(CatalogImage).filter(CatalogImage.item_type == item_type)
+    if item_ids is not None:
+        item_ids = set(item_ids)
+        if not item_ids:
+            return {}
+        if len(item_ids) <= IN_LIST_LIMIT:
+            query = query.filter(CatalogImage.item_id.in_(item_ids))
+    images = {}
+    for image in query.order_by(CatalogImage.position, CatalogImage.id):
+        if item_ids is None or image.item_id in item_ids:
+            images.setdefault(image.item_id, []).append(image_to_dict(image))
+    return images
+
+
+def item_images(images: dict, item_id: int, legacy_urls: str | None):
+    return images.get(item_id, []) + legacy_images(legacy_urls)
@@ -0,0 +1,37 @@
+import orjson
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+
+
+def dumps(data) -> bytes:
+    # orjson сам сериализует date/datetime; всё остальное — через стандартный энкодер FastAPI
+    return orjson.dumps(data, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(Response):
+    """JSON ответ через orjson без обхода данных jsonable_encoder."""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def parse_fields(fields: str | None, allowed):
+    """?fields=a,b -> отсортированный кортеж имён из allowed; неизвестное имя — 400.
+
+    Проекция входит в ключ кэша каталога, поэтому произвольные строки в кэш не попадают.
+    """
+    if not fields:
+        return None
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - allowed
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(sorted(names)) or None
+
+
+def project(items, fields):
+    if not fields:
+        return items
+    return [{key: item[key] for key in fields if key in item} for item in items]
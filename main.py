@@ -1,19 +1,93 @@
-from fastapi import FastAPI, Depends, Request, HTTPException
+from fastapi import FastAPI, Depends, File, Header, Request, HTTPException, Query, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, Field, field_validator
+from sqlalchemy import insert, literal, null, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
-from database import SessionLocal, engine, get_db
-from models import ConfirmedBooking, Supplier, Excursion, Car, CarReservation, ExcursionReservation, User, Base
-from datetime import datetime, timedelta, date
-from auth import router as auth_router, SECRET_KEY, ALGORITHM, decode_token, hash_password
+from database import (
+    get_db,
+    get_read_db,
+    get_async_read_db,
+    open_read_session,
+    pool_stats,
+    start_leak_detector,
+    stop_leak_detector,
+)
+from models import (
+    ConfirmedBooking,
+    Supplier,
+    Excursion,
+    Car,
+    CarReservation,
+    CatalogImage,
+    ExcursionReservation,
+    ExcursionInventory,
+    SeasonalRate,
+    StayDiscount,
+    User,
+)
+import base64
+import calendar
+import idempotency
+import os
+import secrets
+from datetime import datetime, date
+from typing import Literal
+from auth import (
+    router as auth_router,
+    decode_token,
+    hash_password_async,
+    oauth2_scheme,
+    get_current_user,
+    invalidate_user_tokens,
+    start_auth_listener,
+    stop_auth_listener,
+)
+from email_utils import start_outbox_workers, stop_outbox_workers
+from booking import create_booking, car_is_reserved, lock_car, sync_imported_capacity, sync_inventory_capacity, BookingError
+from catalog_cache import catalog_cache, cached_json_response_async
+from bookings_listing import bookings_query, bookings_response
+from bulk_import import read_rows, import_rows
+from pricing import QUOTES_MAX_ITEMS, quote_items
+from rollups import record_car_days, supplier_stats
+from date_ranges import merge_ranges, check_range, clip_ranges, ranges_to_bitmap, days_in_range, subtract_ranges, weekly_dates
+from json_utils import FastJSONResponse, parse_fields, project
+from car_search import CarSearchIndex
+from excursion_search import ExcursionSearchIndex
+from images import (
+    IMAGE_BASE_URL,
+    IMAGE_MAX_BYTES,
+    IMAGE_STORE_DIR,
+    ImmutableStaticFiles,
+    delete_image,
+    delete_item_images,
+    image_to_dict,
+    item_images,
+    load_images,
+    store_image,
+)
+from admission import AdmissionMiddleware, admission
+from metrics import METRICS_TOKEN, MetricsMiddleware, registry as metrics_registry
 
-from jose import JWTError, jwt
-from fastapi.security import OAuth2PasswordBearer
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # brotli необязателен, без него отдаём gzip
+    BrotliMiddleware = None
+
+# Сжимаем только крупные ответы: мелкие JSON от этого лишь медленнее
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 app = FastAPI()
 
 app.include_router(auth_router)
+# Варианты фото из локального хранилища; имена по хэшу содержимого, кэш браузера и CDN — навсегда
+app.mount(IMAGE_BASE_URL, ImmutableStaticFiles(directory=IMAGE_STORE_DIR, check_dir=False), name="media")
+
+# Внутри CORS: ответ 503 при перегрузке тоже получает CORS-заголовки и читается фронтендом
+app.add_middleware(AdmissionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,9 +95,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Idempotent-Replayed"],
 )
 
-Base.metadata.create_all(bind=engine)
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESS_MIN_SIZE, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_SIZE)
+# Добавлен последним, то есть внешним: в замер попадают сжатие и CORS
+app.add_middleware(MetricsMiddleware)
+
+
+@app.on_event("startup")
+def start_background_workers():
+    start_outbox_workers()
+    start_auth_listener()
+    start_leak_detector()
+    car_index.warm_up()
+    excursion_index.warm_up()
+
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    stop_outbox_workers()
+    stop_auth_listener()
+    stop_leak_detector()
 
 class BookingData(BaseModel):
     firstName: str
@@ -74,6 +170,7 @@ class ExcursionCreate(BaseModel):
     adult_price: float
     child_price: float
     infant_price: float
+    daily_capacity: int | None = Field(default=None, ge=0)
     operator_id: int
 
 
@@ -88,112 +185,458 @@ class ExcursionReservationCreate(BaseModel):
     date: date
 
 
+class DateRange(BaseModel):
+    start_date: date
+    end_date: date
+
+
+class WeeklyRule(BaseModel):
+    weekdays: list[int]  # 0 = понедельник ... 6 = воскресенье
+    start_date: date
+    until: date
+
+    @field_validator("weekdays")
+    @classmethod
+    def check_weekdays(cls, weekdays):
+        if any(day < 0 or day > 6 for day in weekdays):
+            raise ValueError("weekdays must be between 0 (Monday) and 6 (Sunday)")
+        return weekdays
+
+
+class CarReservationBatch(BaseModel):
+    car_id: int
+    ranges: list[DateRange] = []
+    recurrence: WeeklyRule | None = None
+
+
+class ExcursionReservationBatch(BaseModel):
+    excursion_id: int
+    dates: list[date] = []
+    ranges: list[DateRange] = []
+    recurrence: WeeklyRule | None = None
+
+
+class QuoteItem(BaseModel):
+    type: Literal["car", "excursion"]
+    id: int
+    start_date: date | None = None
+    end_date: date | None = None
+    day: date | None = Field(default=None, alias="date")
+    adults: int = Field(default=1, ge=0)
+    children: int = Field(default=0, ge=0)
+    infants: int = Field(default=0, ge=0)
+
+
+class QuoteRequest(BaseModel):
+    items: list[QuoteItem] = Field(max_length=QUOTES_MAX_ITEMS)
+
+
+class SeasonalRateCreate(BaseModel):
+    supplier_id: int
+    item_type: Literal["car", "excursion"]
+    item_id: int | None = None
+    start_date: date
+    end_date: date
+    multiplier: float = Field(gt=0)
+
+
+class StayDiscountCreate(BaseModel):
+    supplier_id: int
+    car_id: int | None = None
+    min_days: int = Field(ge=1)
+    percent: float = Field(gt=0, lt=100)
+
+
+def expand_batch_dates(ranges: list[DateRange], recurrence: WeeklyRule | None):
+    try:
+        days = []
+        for r in ranges:
+            check_range(r.start_date, r.end_date)
+            days.extend(days_in_range(r.start_date, r.end_date))
+        if recurrence:
+            if recurrence.until < recurrence.start_date:
+                raise ValueError("until must not be before start_date")
+            days.extend(weekly_dates(recurrence.start_date, recurrence.until, recurrence.weekdays))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return days
+
+
+def payment_response(booking_entry: ConfirmedBooking):
+    return {"status": "success", "booking_id": booking_entry.booking_id, "total_price": booking_entry.total_price}
+
 @app.post("/api/pay")
-def process_payment(booking: BookingData, db: Session = Depends(get_db)):
-    booking_id = int(datetime.utcnow().timestamp())
-
-    total_people = booking.adults + booking.children + booking.infants if booking.booking_type == "excursion" else 1
-    date_obj = datetime.strptime(booking.date, "%Y-%m-%d").date() if booking.date else None
-    date_from_obj = datetime.strptime(booking.start_date, "%Y-%m-%d").date() if booking.start_date else None
-    date_to_obj = datetime.strptime(booking.end_date, "%Y-%m-%d").date() if booking.end_date else None
-
-    booking_entry = ConfirmedBooking(
-        booking_id=booking_id,
-        first_name=booking.firstName,
-        last_name=booking.lastName,
-        phone=booking.phone,
-        email=booking.email,
-        document_number=booking.document_number,
-        pickup_location=booking.pickup_location,
-        contact_method=booking.contact_method,
-        language=booking.language,
-        people_count=total_people,
-        date=date_obj or date_from_obj,
-        total_price=booking.total_price or 0,
-        supplier_id=booking.supplier_id,
-        booking_type=booking.booking_type,
-        excursion_id=booking.excursion_id if booking.booking_type == "excursion" else None,
-        car_id=booking.car_id
-    )
-    db.add(booking_entry)
-    db.commit()
-    db.refresh(booking_entry)
-
-     # ➕ если бронируется машина — записываем диапазон в cars_reservation
-    if booking.booking_type == "car" and booking.car_id:
-        res = CarReservation(
-            car_id=booking.car_id,
-            start_date=date_from_obj,
-            end_date=date_to_obj
-        )
-        db.add(res)
-        db.commit()
+def process_payment(
+    booking: BookingData,
+    idempotency_key: str | None = Header(None),
+    db: Session = Depends(get_db),
+):
+    save_response = None
+    if idempotency_key is not None:
+        # Повтор с тем же ключом получает сохранённый ответ и не трогает таблицы броней
+        replay = idempotency.claim(idempotency_key, booking.model_dump())
+        if replay is not None:
+            return JSONResponse(replay.body, status_code=replay.status_code, headers={"Idempotent-Replayed": "true"})
 
-    from email_utils import send_booking_email  # импорт функции (если в отдельном файле)
-    send_booking_email(booking)
+        def store_idempotent_response(entry):
+            idempotency.complete(db, idempotency_key, 200, payment_response(entry))
 
-    return {"status": "success", "booking_id": booking_entry.booking_id}
+        save_response = store_idempotent_response
+
+    try:
+        booking_entry = create_booking(db, booking, save_response)
+    except BookingError as exc:
+        db.rollback()
+        if idempotency_key is not None:
+            idempotency.release(idempotency_key)
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+    except Exception:
+        db.rollback()
+        if idempotency_key is not None:
+            idempotency.release(idempotency_key)
+        raise
+
+    if idempotency_key is not None:
+        idempotency.notify(idempotency_key)
+    return payment_response(booking_entry)
+
+@app.post("/api/quotes")
+def get_quotes(request: QuoteRequest, db: Session = Depends(get_read_db)):
+    # Позиции с ошибкой получают поле error, остальные считаются как обычно
+    return FastJSONResponse({"quotes": quote_items(db, request.items)})
+
+def model_to_dict(obj):
+    return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+
+def column_keys(model):
+    return frozenset(column.key for column in model.__table__.columns)
+
+def fields_key(key: str, fields):
+    # У каждой проекции своя запись в кэше; префикс ключа сохраняется для инвалидации
+    return f"{key}|fields={','.join(fields)}" if fields else key
+
+OPERATOR_FIELDS = column_keys(Supplier)
 
 @app.get("/operators")
-def get_operators(db: Session = Depends(get_db)):
-    return db.query(Supplier).all()
+async def get_operators(request: Request, fields: str | None = None, db: AsyncSession = Depends(get_async_read_db)):
+    fields = parse_fields(fields, OPERATOR_FIELDS)
+
+    async def load():
+        result = await db.execute(select(Supplier))
+        return project([model_to_dict(s) for s in result.scalars()], fields)
+
+    return await cached_json_response_async(request, fields_key("operators", fields), load)
 
 @app.get("/excursions")
-def get_excursions(operator_id: int, db: Session = Depends(get_db)):
-    return db.query(Excursion).filter(Excursion.operator_id == operator_id).all()
+async def get_excursions(
+    operator_id: int,
+    request: Request,
+    fields: str | None = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    fields = parse_fields(fields, EXCURSION_FIELDS)
+
+    async def load():
+        result = await db.execute(select(Excursion).where(Excursion.operator_id == operator_id))
+        excursions = result.scalars().all()
+        images = await db.run_sync(load_images, "excursion", [e.id for e in excursions])
+        return project([excursion_to_dict(e, images) for e in excursions], fields)
+
+    return await cached_json_response_async(request, fields_key(f"excursions:operator:{operator_id}", fields), load)
+
+def excursion_to_dict(excursion: Excursion, images: dict):
+    # Вместо строки image_urls — фото с вариантами размеров, старые ссылки идут последними
+    data = model_to_dict(excursion)
+    data["images"] = item_images(images, excursion.id, data.pop("image_urls"))
+    return data
+
+EXCURSION_FIELDS = column_keys(Excursion) - {"image_urls"} | {"images"}
+
+def excursion_doc(db: Session, excursion: Excursion):
+    return excursion_to_dict(excursion, load_images(db, "excursion", [excursion.id]))
+
+def load_search_excursions():
+    db = open_read_session()
+    try:
+        images = load_images(db, "excursion")
+        return [excursion_to_dict(e, images) for e in db.query(Excursion)]
+    finally:
+        db.close()
+
+excursion_index = ExcursionSearchIndex(load_search_excursions)
+
+@app.get("/excursions/search")
+def search_excursions(
+    q: str = Query(..., min_length=1, max_length=200),
+    lang: Literal["en", "ru"] | None = None,
+    operator_id: int | None = None,
+    limit: int = Query(10, ge=1, le=50),
+    offset: int = Query(0, ge=0),
+    fields: str | None = None,
+):
+    fields = parse_fields(fields, EXCURSION_FIELDS | {"score"})
+    result = excursion_index.search(q, lang=lang, operator_id=operator_id, limit=limit, offset=offset)
+    if fields:
+        result["items"] = project(result["items"], fields + ("score",))
+    return FastJSONResponse(result)
+
+def car_to_dict(car: Car, images: dict):
+    return {
+        "id": car.id,
+        "brand": car.brand,
+        "model": car.model,
+        "color": car.color,
+        "seats": car.seats,
+        "price_per_day": car.price_per_day,
+        "images": item_images(images, car.id, car.image_url),
+        "car_type": car.car_type,
+        "transmission": car.transmission,
+        "has_air_conditioning": car.has_air_conditioning,
+        "year": car.year,
+        "fuel_type": car.fuel_type,
+        "engine_capacity": car.engine_capacity,
+        "mileage": car.mileage,
+        "drive_type": car.drive_type,
+        "supplier": {
+            "id": car.supplier.id,
+            "name": car.supplier.name
+        } if car.supplier else None
+    }
+
+CAR_FIELDS = frozenset({
+    "id", "brand", "model", "color", "seats", "price_per_day", "images", "car_type", "transmission",
+    "has_air_conditioning", "year", "fuel_type", "engine_capacity", "mileage", "drive_type", "supplier",
+})
 
 @app.get("/cars")
-def get_cars(db: Session = Depends(get_db)):
-    cars = db.query(Car).options(joinedload(Car.supplier)).all()
-    result = []
-    for car in cars:
-        result.append({
-            "id": car.id,
-            "brand": car.brand,
-            "model": car.model,
-            "color": car.color,
-            "seats": car.seats,
-            "price_per_day": car.price_per_day,
-            "image_url": car.image_url,
-            "car_type": car.car_type,
-            "transmission": car.transmission,
-            "has_air_conditioning": car.has_air_conditioning,
-            "year": car.year,
-            "fuel_type": car.fuel_type,
-            "engine_capacity": car.engine_capacity,
-            "mileage": car.mileage,
-            "drive_type": car.drive_type,
-            "supplier": {
-                "id": car.supplier.id,
-                "name": car.supplier.name
-            } if car.supplier else None
-        })
-    return result
+async def get_cars(request: Request, fields: str | None = None, db: AsyncSession = Depends(get_async_read_db)):
+    fields = parse_fields(fields, CAR_FIELDS)
+
+    async def load():
+        result = await db.execute(select(Car).options(joinedload(Car.supplier)))
+        images = await db.run_sync(load_images, "car")
+        return project([car_to_dict(car, images) for car in result.scalars()], fields)
+
+    return await cached_json_response_async(request, fields_key("cars", fields), load)
+
+def load_search_cars():
+    db = open_read_session()
+    try:
+        images = load_images(db, "car")
+        return [car_to_dict(car, images) for car in db.query(Car).options(joinedload(Car.supplier))]
+    finally:
+        db.close()
+
+car_index = CarSearchIndex(load_search_cars)
+
+@app.get("/cars/search")
+def search_cars(
+    car_type: list[str] = Query([]),
+    transmission: list[str] = Query([]),
+    fuel_type: list[str] = Query([]),
+    drive_type: list[str] = Query([]),
+    supplier_id: list[int] = Query([]),
+    has_air_conditioning: bool | None = None,
+    min_seats: int | None = None,
+    max_seats: int | None = None,
+    min_year: int | None = None,
+    max_year: int | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    sort: Literal["price_asc", "price_desc", "year_desc", "year_asc", "newest"] = "price_asc",
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    fields: str | None = None,
+):
+    fields = parse_fields(fields, CAR_FIELDS)
+    # Значения одного атрибута объединяются через OR, разные атрибуты — через AND
+    result = car_index.search(
+        values={
+            "car_type": set(car_type),
+            "transmission": set(transmission),
+            "fuel_type": set(fuel_type),
+            "drive_type": set(drive_type),
+            "supplier_id": set(supplier_id),
+            "has_air_conditioning": {has_air_conditioning} if has_air_conditioning is not None else set(),
+        },
+        ranges={"seats": (min_seats, max_seats), "year": (min_year, max_year)},
+        min_price=min_price,
+        max_price=max_price,
+        sort=sort,
+        offset=offset,
+        limit=limit,
+    )
+    result["items"] = project(result["items"], fields)
+    return FastJSONResponse(result)
+
+@app.get("/cars/available")
+def get_available_cars(
+    start_date: date,
+    end_date: date,
+    supplier_id: int | None = None,
+    car_type: str | None = None,
+    transmission: str | None = None,
+    fuel_type: str | None = None,
+    drive_type: str | None = None,
+    min_seats: int | None = None,
+    max_price: float | None = None,
+    has_air_conditioning: bool | None = None,
+    fields: str | None = None,
+    db: Session = Depends(get_read_db),
+):
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    fields = parse_fields(fields, CAR_FIELDS)
+
+    # Одна выборка: машины без пересекающихся броней (даты включительно)
+    overlapping = (
+        db.query(CarReservation.id)
+        .filter(
+            CarReservation.car_id == Car.id,
+            CarReservation.start_date <= end_date,
+            CarReservation.end_date >= start_date,
+        )
+        .exists()
+    )
+    query = db.query(Car).options(joinedload(Car.supplier)).filter(~overlapping)
+
+    if supplier_id is not None:
+        query = query.filter(Car.supplier_id == supplier_id)
+    if car_type is not None:
+        query = query.filter(Car.car_type == car_type)
+    if transmission is not None:
+        query = query.filter(Car.transmission == transmission)
+    if fuel_type is not None:
+        query = query.filter(Car.fuel_type == fuel_type)
+    if drive_type is not None:
+        query = query.filter(Car.drive_type == drive_type)
+    if min_seats is not None:
+        query = query.filter(Car.seats >= min_seats)
+    if max_price is not None:
+        query = query.filter(Car.price_per_day <= max_price)
+    if has_air_conditioning is not None:
+        query = query.filter(Car.has_air_conditioning == has_air_conditioning)
+
+    cars = query.all()
+    images = load_images(db, "car", [car.id for car in cars])
+    return FastJSONResponse(project([car_to_dict(car, images) for car in cars], fields))
+
+CALENDAR_MAX_DAYS = 366
+CALENDAR_MAX_CARS = 200
+
+async def car_calendars(db: AsyncSession, car_ids: list[int], start: date, end: date, encoding: str):
+    if end < start:
+        raise HTTPException(status_code=400, detail="to must not be before from")
+    if (end - start).days >= CALENDAR_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Window is limited to {CALENDAR_MAX_DAYS} days")
+
+    result = await db.execute(
+        select(CarReservation.car_id, CarReservation.start_date, CarReservation.end_date).where(
+            CarReservation.car_id.in_(car_ids),
+            CarReservation.start_date <= end,
+            CarReservation.end_date >= start,
+        )
+    )
+    by_car = {car_id: [] for car_id in car_ids}
+    for car_id, start_date, end_date in result:
+        by_car[car_id].append((start_date, end_date))
+
+    calendars = {}
+    for car_id, ranges in by_car.items():
+        merged = merge_ranges(clip_ranges(ranges, start, end))
+        if encoding == "bitmap":
+            calendars[car_id] = base64.b64encode(ranges_to_bitmap(merged, start, end)).decode()
+        else:
+            calendars[car_id] = [[s.isoformat(), e.isoformat()] for s, e in merged]
+    return calendars
+
+@app.get("/cars/calendar")
+async def get_cars_calendar(
+    car_ids: str = Query(..., description="Comma separated car ids"),
+    start: date = Query(..., alias="from"),
+    end: date = Query(..., alias="to"),
+    encoding: Literal["ranges", "bitmap"] = "ranges",
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    try:
+        ids = list(dict.fromkeys(int(value) for value in car_ids.split(",") if value.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="car_ids must be a comma separated list of integers")
+    if not ids or len(ids) > CALENDAR_MAX_CARS:
+        raise HTTPException(status_code=400, detail=f"Pass between 1 and {CALENDAR_MAX_CARS} car ids")
+
+    calendars = await car_calendars(db, ids, start, end, encoding)
+    return {
+        "from": start,
+        "to": end,
+        "encoding": encoding,
+        "cars": {str(car_id): calendar for car_id, calendar in calendars.items()},
+    }
+
+@app.get("/cars/{car_id}/calendar")
+async def get_car_calendar(
+    car_id: int,
+    start: date = Query(..., alias="from"),
+    end: date = Query(..., alias="to"),
+    encoding: Literal["ranges", "bitmap"] = "ranges",
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    if (await db.execute(select(Car.id).where(Car.id == car_id))).first() is None:
+        raise HTTPException(status_code=404, detail="Car not found")
+    calendars = await car_calendars(db, [car_id], start, end, encoding)
+    return {"car_id": car_id, "from": start, "to": end, "encoding": encoding, "reserved": calendars[car_id]}
+
+BOOKING_FIELDS = column_keys(ConfirmedBooking)
 
 @app.get("/bookings")
-def get_bookings(db: Session = Depends(get_db)):
-    return db.query(ConfirmedBooking).all()
+def get_bookings(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    booking_type: str | None = None,
+    car_id: int | None = None,
+    excursion_id: int | None = None,
+    export_format: Literal["json", "ndjson", "csv"] = Query("json", alias="format"),
+    fields: str | None = None,
+    db: Session = Depends(get_read_db),
+):
+    fields = parse_fields(fields, BOOKING_FIELDS)
+    query = bookings_query(
+        date_from=date_from,
+        date_to=date_to,
+        booking_type=booking_type,
+        car_id=car_id,
+        excursion_id=excursion_id,
+        cursor=cursor,
+        fields=fields,
+    )
+    return bookings_response(db, query, limit, export_format, fields)
 
 @app.get("/excursion-reservations")
-def get_excursion_reservations(excursion_id: int, db: Session = Depends(get_db)):
-    return db.query(ExcursionReservation).filter(ExcursionReservation.excursion_id == excursion_id).all()
+def get_excursion_reservations(excursion_id: int, db: Session = Depends(get_read_db)):
+    reservations = db.query(ExcursionReservation).filter(ExcursionReservation.excursion_id == excursion_id).all()
+    return FastJSONResponse([model_to_dict(r) for r in reservations])
 
 @app.get("/car-reservations")
-def get_car_reservations(car_id: int, db: Session = Depends(get_db)):
-    reservations = db.query(CarReservation).filter(CarReservation.car_id == car_id).all()
-    return [{"id": r.id, "start_date": r.start_date.isoformat(), "end_date": r.end_date.isoformat()} for r in reservations]
+async def get_car_reservations(car_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    result = await db.execute(select(CarReservation).where(CarReservation.car_id == car_id))
+    reservations = result.scalars().all()
+    return FastJSONResponse([{"id": r.id, "start_date": r.start_date, "end_date": r.end_date} for r in reservations])
 
 
 @app.get("/excursions/{excursion_id}")
-def get_excursion(excursion_id: int, db: Session = Depends(get_db)):
-    excursion = (
-        db.query(Excursion)
-        .options(joinedload(Excursion.supplier))
-        .filter(Excursion.id == excursion_id)
-        .first()
+async def get_excursion(excursion_id: int, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    return await cached_json_response_async(request, f"excursions:{excursion_id}", lambda: load_excursion(db, excursion_id))
+
+async def load_excursion(db: AsyncSession, excursion_id: int):
+    result = await db.execute(
+        select(Excursion).options(joinedload(Excursion.supplier)).where(Excursion.id == excursion_id)
     )
+    excursion = result.scalars().first()
     if not excursion:
         raise HTTPException(status_code=404, detail="Excursion not found")
+    images = await db.run_sync(load_images, "excursion", [excursion.id])
     return {
         "id": excursion.id,
         "title": excursion.title,
@@ -206,7 +649,9 @@ def get_excursion(excursion_id: int, db: Session = Depends(get_db)):
         "adult_price": excursion.adult_price,
         "child_price": excursion.child_price,
         "infant_price": excursion.infant_price,
+        "daily_capacity": excursion.daily_capacity,
         "operator_id": excursion.operator_id,
+        "images": item_images(images, excursion.id, excursion.image_urls),
         "supplier": {
             "id": excursion.supplier.id,
             "name": excursion.supplier.name,
@@ -215,44 +660,87 @@ def get_excursion(excursion_id: int, db: Session = Depends(get_db)):
         else None,
     }
 
+@app.get("/excursions/{excursion_id}/calendar")
+async def get_excursion_calendar(
+    excursion_id: int,
+    month: str = Query(..., description="YYYY-MM"),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    try:
+        first_day = datetime.strptime(month, "%Y-%m").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="month must be YYYY-MM")
+    last_day = date(first_day.year, first_day.month, calendar.monthrange(first_day.year, first_day.month)[1])
+
+    capacity = (
+        await db.execute(select(Excursion.daily_capacity).where(Excursion.id == excursion_id))
+    ).first()
+    if capacity is None:
+        raise HTTPException(status_code=404, detail="Excursion not found")
+    capacity = capacity[0]
+
+    # Остатки мест и закрытые даты одной выборкой по индексам (excursion_id, date)
+    closed = select(ExcursionReservation.date, null(), literal(True)).where(
+        ExcursionReservation.excursion_id == excursion_id,
+        ExcursionReservation.date.between(first_day, last_day),
+    )
+    query = closed
+    if capacity is not None:  # без лимита инвентарь не ведётся и остаток не показывается
+        seats = select(ExcursionInventory.date, ExcursionInventory.remaining, literal(False).label("closed")).where(
+            ExcursionInventory.excursion_id == excursion_id,
+            ExcursionInventory.date.between(first_day, last_day),
+        )
+        query = union_all(seats, closed)
+    remaining_by_day = {}
+    closed_days = set()
+    for day, remaining, is_closed in await db.execute(query):
+        if is_closed:
+            closed_days.add(day)
+        else:
+            remaining_by_day[day] = max(remaining, 0)
+
+    days = []
+    for day in days_in_range(first_day, last_day):
+        remaining = remaining_by_day.get(day, capacity)
+        days.append({
+            "date": day.isoformat(),
+            "remaining": remaining,
+            "available": day not in closed_days and remaining != 0,
+        })
+    return {"excursion_id": excursion_id, "month": month, "daily_capacity": capacity, "days": days}
+
 @app.get("/cars/{car_id}")
-def get_car(car_id: int, db: Session = Depends(get_db)):
-    car = db.query(Car).options(joinedload(Car.supplier)).filter(Car.id == car_id).first()
+async def get_car(car_id: int, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    return await cached_json_response_async(request, f"cars:{car_id}", lambda: load_car(db, car_id))
+
+async def load_car(db: AsyncSession, car_id: int):
+    result = await db.execute(select(Car).options(joinedload(Car.supplier)).where(Car.id == car_id))
+    car = result.scalars().first()
     if not car:
         raise HTTPException(status_code=404, detail="Car not found")
+    images = await db.run_sync(load_images, "car", [car.id])
     return {
         "id": car.id,
         "brand": car.brand,
         "model": car.model,
         "price_per_day": car.price_per_day,
         "supplier_id": car.supplier_id,
+        "images": item_images(images, car.id, car.image_url),
         "supplier": {"id": car.supplier.id, "name": car.supplier.name} if car.supplier else None
     }
 
 
 # === Admin login & content management ===
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = int(payload.get("sub"))
-        if user_id is None:
-            raise HTTPException(status_code=401)
-    except JWTError:
-        raise HTTPException(status_code=401)
-
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None or user.current_token != token:
-        raise HTTPException(status_code=401)
-    return user
-
 
 @app.get("/api/admin/excursions")
 def admin_excursions(operator_id: int, db: Session = Depends(get_db)):
-    return db.query(Excursion).filter(Excursion.operator_id == operator_id).all()
+    excursions = db.query(Excursion).filter(Excursion.operator_id == operator_id).all()
+    return FastJSONResponse([model_to_dict(e) for e in excursions])
 
 @app.get("/api/admin/cars")
 def admin_cars(supplier_id: int, db: Session = Depends(get_db)):
-    return db.query(Car).filter(Car.supplier_id == supplier_id).all()
+    cars = db.query(Car).filter(Car.supplier_id == supplier_id).all()
+    return FastJSONResponse([model_to_dict(c) for c in cars])
 
 @app.post("/api/admin/cars")
 def admin_add_car(car: CarCreate, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -263,9 +751,19 @@ def admin_add_car(car: CarCreate, current: User = Depends(get_current_user), db:
 
     db.add(db_car)
     db.commit()
+    catalog_cache.invalidate("cars")
+    car_index.invalidate()
     db.refresh(db_car)
     return {"id": db_car.id}
 
+@app.post("/api/admin/cars/bulk")
+async def admin_bulk_cars(request: Request, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    rows = await read_rows(request)
+    report = await run_in_threadpool(import_rows, db, rows, CarCreate, Car, "supplier_id", current)
+    catalog_cache.invalidate("cars")
+    car_index.invalidate()
+    return report
+
 @app.put("/api/admin/cars/{car_id}")
 def update_car(car_id: int, updated: CarCreate, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
     car = db.query(Car).filter(Car.id == car_id).first()
@@ -277,6 +775,8 @@ def update_car(car_id: int, updated: CarCreate, current: User = Depends(get_curr
     for field, value in updated.dict().items():
         setattr(car, field, value)
     db.commit()
+    catalog_cache.invalidate("cars")
+    car_index.invalidate()
     return {"ok": True}
 
 
@@ -288,7 +788,9 @@ def delete_car(car_id: int, current: User = Depends(get_current_user), db: Sessi
     if not current.is_superuser and current.supplier_id != car.supplier_id:
         raise HTTPException(status_code=403)
     db.delete(car)
-    db.commit()
+    delete_item_images(db, "car", car_id)  # коммитит удаление машины вместе с её фото
+    catalog_cache.invalidate("cars")
+    car_index.invalidate()
     return {"ok": True}
 
 
@@ -304,9 +806,21 @@ def admin_add_excursion(
     db_excursion = Excursion(**excursion.dict())
     db.add(db_excursion)
     db.commit()
+    catalog_cache.invalidate("excursions")
     db.refresh(db_excursion)
+    excursion_index.upsert(excursion_doc(db, db_excursion))
     return {"id": db_excursion.id}
 
+@app.post("/api/admin/excursions/bulk")
+async def admin_bulk_excursions(request: Request, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    rows = await read_rows(request)
+    report = await run_in_threadpool(
+        import_rows, db, rows, ExcursionCreate, Excursion, "operator_id", current, sync_imported_capacity
+    )
+    catalog_cache.invalidate("excursions")
+    excursion_index.invalidate()
+    return report
+
 @app.put("/api/admin/excursions/{excursion_id}")
 def update_excursion(excursion_id: int, updated: ExcursionCreate, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
     excursion = db.query(Excursion).filter(Excursion.id == excursion_id).first()
@@ -315,9 +829,16 @@ def update_excursion(excursion_id: int, updated: ExcursionCreate, current: User
     if not current.is_superuser and current.supplier_id != excursion.operator_id:
         raise HTTPException(status_code=403)
 
-    for field, value in updated.dict().items():
+    values = updated.dict()
+    if "daily_capacity" not in updated.model_fields_set:
+        del values["daily_capacity"]  # клиенты, не знающие о лимите мест, не должны его снимать
+    elif updated.daily_capacity != excursion.daily_capacity:
+        sync_inventory_capacity(db, excursion_id, updated.daily_capacity)
+    for field, value in values.items():
         setattr(excursion, field, value)
     db.commit()
+    catalog_cache.invalidate("excursions")
+    excursion_index.upsert(excursion_doc(db, excursion))
     return {"ok": True}
 
 
@@ -328,14 +849,197 @@ def delete_excursion(excursion_id: int, current: User = Depends(get_current_user
         raise HTTPException(status_code=404, detail="Excursion not found")
     if not current.is_superuser and current.supplier_id != excursion.operator_id:
         raise HTTPException(status_code=403)
+    db.query(ExcursionInventory).filter(ExcursionInventory.excursion_id == excursion_id).delete(synchronize_session=False)
     db.delete(excursion)
+    delete_item_images(db, "excursion", excursion_id)
+    catalog_cache.invalidate("excursions")
+    excursion_index.remove(excursion_id)
+    return {"ok": True}
+
+
+def refresh_item_images(db: Session, item_type: str, item_id: int):
+    if item_type == "car":
+        catalog_cache.invalidate("cars")
+        car_index.invalidate()
+        return
+    catalog_cache.invalidate("excursions")
+    excursion = db.query(Excursion).filter(Excursion.id == item_id).first()
+    if excursion:
+        excursion_index.upsert(excursion_doc(db, excursion))
+
+@app.post("/api/admin/images")
+def upload_image(
+    item_type: Literal["car", "excursion"],
+    item_id: int,
+    file: UploadFile = File(...),
+    current: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    if item_type == "car":
+        item = db.query(Car).filter(Car.id == item_id).first()
+        supplier_id = item.supplier_id if item else None
+    else:
+        item = db.query(Excursion).filter(Excursion.id == item_id).first()
+        supplier_id = item.operator_id if item else None
+    if not item:
+        raise HTTPException(status_code=404, detail=f"{item_type.capitalize()} not found")
+    if not current.is_superuser and current.supplier_id != supplier_id:
+        raise HTTPException(status_code=403)
+
+    # Размеры создаются здесь, один раз: списки каталога отдают готовые маленькие файлы
+    image = store_image(db, item_type, item_id, supplier_id, file.file.read(IMAGE_MAX_BYTES + 1))
+    refresh_item_images(db, item_type, item_id)
+    return image_to_dict(image)
+
+@app.delete("/api/admin/images/{image_id}")
+def remove_image(image_id: int, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    image = db.query(CatalogImage).filter(CatalogImage.id == image_id).first()
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if not current.is_superuser and current.supplier_id != image.supplier_id:
+        raise HTTPException(status_code=403)
+    item_type, item_id = image.item_type, image.item_id
+    delete_image(db, image)
+    refresh_item_images(db, item_type, item_id)
+    return {"ok": True}
+
+
+def check_rate_owner(db: Session, current: User, supplier_id: int, item_type: str, item_id: int | None):
+    if not current.is_superuser and current.supplier_id != supplier_id:
+        raise HTTPException(status_code=403)
+    if item_id is None:
+        return
+    owner_column = Car.supplier_id if item_type == "car" else Excursion.operator_id
+    owner = db.query(owner_column).filter(owner_column.class_.id == item_id).scalar()
+    if owner != supplier_id:
+        raise HTTPException(status_code=400, detail="Item does not belong to this supplier")
+
+@app.get("/api/admin/rates")
+def admin_rates(supplier_id: int, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    check_rate_owner(db, current, supplier_id, "car", None)
+    rates = db.query(SeasonalRate).filter(SeasonalRate.supplier_id == supplier_id).order_by(SeasonalRate.start_date)
+    discounts = db.query(StayDiscount).filter(StayDiscount.supplier_id == supplier_id).order_by(StayDiscount.min_days)
+    return FastJSONResponse({
+        "seasonal_rates": [model_to_dict(r) for r in rates],
+        "stay_discounts": [model_to_dict(d) for d in discounts],
+    })
+
+@app.post("/api/admin/seasonal-rates")
+def admin_add_seasonal_rate(rate: SeasonalRateCreate, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if rate.end_date < rate.start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    check_rate_owner(db, current, rate.supplier_id, rate.item_type, rate.item_id)
+    db_rate = SeasonalRate(**rate.dict())
+    db.add(db_rate)
+    db.commit()
+    catalog_cache.invalidate("rates")
+    return {"id": db_rate.id}
+
+@app.delete("/api/admin/seasonal-rates/{rate_id}")
+def admin_delete_seasonal_rate(rate_id: int, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    rate = db.query(SeasonalRate).filter(SeasonalRate.id == rate_id).first()
+    if not rate:
+        raise HTTPException(status_code=404, detail="Rate not found")
+    check_rate_owner(db, current, rate.supplier_id, rate.item_type, None)
+    db.delete(rate)
+    db.commit()
+    catalog_cache.invalidate("rates")
+    return {"ok": True}
+
+@app.post("/api/admin/stay-discounts")
+def admin_add_stay_discount(discount: StayDiscountCreate, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    check_rate_owner(db, current, discount.supplier_id, "car", discount.car_id)
+    db_discount = StayDiscount(**discount.dict())
+    db.add(db_discount)
+    db.commit()
+    catalog_cache.invalidate("rates")
+    return {"id": db_discount.id}
+
+@app.delete("/api/admin/stay-discounts/{discount_id}")
+def admin_delete_stay_discount(discount_id: int, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    discount = db.query(StayDiscount).filter(StayDiscount.id == discount_id).first()
+    if not discount:
+        raise HTTPException(status_code=404, detail="Discount not found")
+    check_rate_owner(db, current, discount.supplier_id, "car", None)
+    db.delete(discount)
     db.commit()
+    catalog_cache.invalidate("rates")
     return {"ok": True}
 
 
+@app.get("/api/admin/stats")
+def admin_stats(
+    supplier_id: int,
+    start: date = Query(..., alias="from"),
+    end: date = Query(..., alias="to"),
+    granularity: Literal["day", "week", "month", "year"] = "day",
+    current: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    if not current.is_superuser and current.supplier_id != supplier_id:
+        raise HTTPException(status_code=403)
+    try:
+        stats = supplier_stats(db, supplier_id, start, end, granularity)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return FastJSONResponse({"supplier_id": supplier_id, "from": start, "to": end, "granularity": granularity, **stats})
+
+@app.get("/api/admin/catalog-cache")
+def catalog_cache_stats(current: User = Depends(get_current_user)):
+    if not current.is_superuser:
+        raise HTTPException(status_code=403)
+    return catalog_cache.stats()
+
+
+@app.get("/api/admin/db-pool")
+def db_pool_stats(current: User = Depends(get_current_user)):
+    if not current.is_superuser:
+        raise HTTPException(status_code=403)
+    return pool_stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics(request: Request):
+    # Prometheus ходит без логина админки, по Bearer METRICS_TOKEN; без токена эндпоинт выключен
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404)
+    if not secrets.compare_digest(request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401)
+    return PlainTextResponse(
+        metrics_registry.render(pool_stats(), {"catalog": catalog_cache.stats()}, admission.stats()),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
 @app.get("/api/admin/bookings")
-def admin_bookings(supplier_id: int, db: Session = Depends(get_db)):
-    return db.query(ConfirmedBooking).filter(ConfirmedBooking.supplier_id == supplier_id).all()
+def admin_bookings(
+    supplier_id: int,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    booking_type: str | None = None,
+    car_id: int | None = None,
+    excursion_id: int | None = None,
+    export_format: Literal["json", "ndjson", "csv"] = Query("json", alias="format"),
+    fields: str | None = None,
+    current: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    if not current.is_superuser and current.supplier_id != supplier_id:
+        raise HTTPException(status_code=403)
+    fields = parse_fields(fields, BOOKING_FIELDS)
+    query = bookings_query(
+        supplier_id=supplier_id,
+        date_from=date_from,
+        date_to=date_to,
+        booking_type=booking_type,
+        car_id=car_id,
+        excursion_id=excursion_id,
+        cursor=cursor,
+        fields=fields,
+    )
+    return bookings_response(db, query, limit, export_format, fields)
 
 
 @app.post("/api/admin/car-reservations")
@@ -349,14 +1053,171 @@ def add_car_reservation(
         raise HTTPException(status_code=404, detail="Car not found")
     if not current.is_superuser and car.supplier_id != current.supplier_id:
         raise HTTPException(status_code=403)
+    try:
+        check_range(reservation.start_date, reservation.end_date)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
+    lock_car(db, car.id)
+    if car_is_reserved(db, car.id, reservation.start_date, reservation.end_date):
+        raise HTTPException(status_code=409, detail="Car is already reserved for these dates")
     db_res = CarReservation(**reservation.dict())
     db.add(db_res)
+    record_car_days(db, car.supplier_id, [(reservation.start_date, reservation.end_date)])
     db.commit()
     db.refresh(db_res)
     return {"id": db_res.id}
 
 
+@app.post("/api/admin/car-reservations/batch")
+def add_car_reservations_batch(
+    batch: CarReservationBatch,
+    current: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    car = db.query(Car).filter(Car.id == batch.car_id).first()
+    if not car:
+        raise HTTPException(status_code=404, detail="Car not found")
+    if not current.is_superuser and car.supplier_id != current.supplier_id:
+        raise HTTPException(status_code=403)
+
+    try:
+        # Диапазоны не раскладываются по дням, но сводки занятости считают каждый день — длина ограничена
+        for r in batch.ranges:
+            check_range(r.start_date, r.end_date)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    # Повторение раскладывается на отдельные дни, соседние дни и пересечения сливаются
+    days = expand_batch_dates([], batch.recurrence)
+    ranges = merge_ranges([(r.start_date, r.end_date) for r in batch.ranges] + [(d, d) for d in days])
+    if ranges:
+        # Под блокировкой машины: уже занятые дни пропускаются, брони не пересекаются
+        lock_car(db, car.id)
+        taken = db.query(CarReservation.start_date, CarReservation.end_date).filter(
+            CarReservation.car_id == batch.car_id,
+            CarReservation.start_date <= ranges[-1][1],
+            CarReservation.end_date >= ranges[0][0],
+        )
+        ranges = subtract_ranges(ranges, taken.all())
+    if ranges:
+        db.execute(
+            insert(CarReservation),
+            [{"car_id": batch.car_id, "start_date": start, "end_date": end} for start, end in ranges],
+        )
+        record_car_days(db, car.supplier_id, ranges)
+        db.commit()
+    return {
+        "created": len(ranges),
+        "ranges": [{"start_date": start, "end_date": end} for start, end in ranges],
+    }
+
+
+@app.delete("/api/admin/car-reservations")
+def delete_car_reservations_range(
+    car_id: int,
+    start_date: date,
+    end_date: date,
+    current: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    car = db.query(Car).filter(Car.id == car_id).first()
+    if not car:
+        raise HTTPException(status_code=404, detail="Car not found")
+    if not current.is_superuser and car.supplier_id != current.supplier_id:
+        raise HTTPException(status_code=403)
+
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+
+    lock_car(db, car.id)
+    overlapping = (
+        db.query(CarReservation)
+        .filter(
+            CarReservation.car_id == car_id,
+            CarReservation.start_date <= end_date,
+            CarReservation.end_date >= start_date,
+        )
+        .all()
+    )
+    removed = clip_ranges([(r.start_date, r.end_date) for r in overlapping], start_date, end_date)
+    # Брони, задевающие окно краем, обрезаются; накрывающая окно целиком делится на две
+    deleted = trimmed = 0
+    split = []
+    for reservation in overlapping:
+        kept = subtract_ranges([(reservation.start_date, reservation.end_date)], [(start_date, end_date)])
+        if not kept:
+            db.delete(reservation)
+            deleted += 1
+            continue
+        (reservation.start_date, reservation.end_date), *rest = kept
+        split.extend(CarReservation(car_id=car_id, start_date=s, end_date=e) for s, e in rest)
+        trimmed += 1
+    db.flush()  # сначала укорачиваем, иначе вторая половина пересечётся с исходной бронью
+    db.add_all(split)
+    record_car_days(db, car.supplier_id, removed, sign=-1)
+    db.commit()
+    return {"deleted": deleted, "trimmed": trimmed}
+
+
+@app.post("/api/admin/excursion-reservations/batch")
+def add_excursion_reservations_batch(
+    batch: ExcursionReservationBatch,
+    current: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    excursion = db.query(Excursion).filter(Excursion.id == batch.excursion_id).first()
+    if not excursion:
+        raise HTTPException(status_code=404, detail="Excursion not found")
+    if not current.is_superuser and excursion.operator_id != current.supplier_id:
+        raise HTTPException(status_code=403)
+
+    days = set(batch.dates) | set(expand_batch_dates(batch.ranges, batch.recurrence))
+    if days:
+        existing = {
+            day
+            for (day,) in db.query(ExcursionReservation.date).filter(
+                ExcursionReservation.excursion_id == batch.excursion_id,
+                ExcursionReservation.date >= min(days),
+                ExcursionReservation.date <= max(days),
+            )
+        }
+        days -= existing
+    if days:
+        db.execute(
+            insert(ExcursionReservation),
+            [{"excursion_id": batch.excursion_id, "date": day} for day in sorted(days)],
+        )
+        db.commit()
+    return {"created": len(days)}
+
+
+@app.delete("/api/admin/excursion-reservations")
+def delete_excursion_reservations_range(
+    excursion_id: int,
+    start_date: date,
+    end_date: date,
+    current: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    excursion = db.query(Excursion).filter(Excursion.id == excursion_id).first()
+    if not excursion:
+        raise HTTPException(status_code=404, detail="Excursion not found")
+    if not current.is_superuser and excursion.operator_id != current.supplier_id:
+        raise HTTPException(status_code=403)
+
+    deleted = (
+        db.query(ExcursionReservation)
+        .filter(
+            ExcursionReservation.excursion_id == excursion_id,
+            ExcursionReservation.date >= start_date,
+            ExcursionReservation.date <= end_date,
+        )
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return {"deleted": deleted}
+
+
 @app.post("/api/admin/excursion-reservations")
 def add_excursion_reservation(
     reservation: ExcursionReservationCreate,
@@ -388,6 +1249,8 @@ def delete_car_reservation(
     car = db.query(Car).filter(Car.id == reservation.car_id).first()
     if not current.is_superuser and car and car.supplier_id != current.supplier_id:
         raise HTTPException(status_code=403)
+    if car:
+        record_car_days(db, car.supplier_id, [(reservation.start_date, reservation.end_date)], sign=-1)
     db.delete(reservation)
     db.commit()
     return {"ok": True}
@@ -447,7 +1310,7 @@ async def super_add_user(request: Request, current: User = Depends(get_current_u
     if not current.is_superuser:
         raise HTTPException(status_code=403)
     data = await request.json()
-    user = User(email=data["email"], password_hash=hash_password(data.get("password", "123")), supplier_id=data["supplier_id"])
+    user = User(email=data["email"], password_hash=await hash_password_async(data.get("password", "123")), supplier_id=data["supplier_id"])
     db.add(user)
     db.commit()
     return {"ok": True}
@@ -460,6 +1323,7 @@ async def super_add_supplier(request: Request, current: User = Depends(get_curre
     supplier = Supplier(name=data["name"], supplier_type=data["supplier_type"], phone=data.get("phone"), email=data.get("email"), address=data.get("address"))
     db.add(supplier)
     db.commit()
+    catalog_cache.invalidate("operators", "cars", "excursions")
     return {"ok": True}
 
 @app.put("/api/suppliers/{supplier_id}")
@@ -484,6 +1348,8 @@ async def update_supplier(
     supplier.supplier_type = data.get("supplier_type", supplier.supplier_type)
     supplier.address = data.get("address", supplier.address)
     db.commit()
+    catalog_cache.invalidate("operators", "cars", "excursions")
+    car_index.invalidate()
 
     return {"ok": True}
 
@@ -496,6 +1362,9 @@ def super_delete_supplier(supplier_id: int, current: User = Depends(get_current_
         raise HTTPException(status_code=404, detail="Supplier not found")
     db.delete(supplier)
     db.commit()
+    catalog_cache.invalidate("operators", "cars", "excursions")
+    car_index.invalidate()
+    excursion_index.invalidate()
     return {"ok": True}
 
 @app.post("/api/admin/change-password")
@@ -512,7 +1381,7 @@ async def change_password(request: Request, token: str = Depends(oauth2_scheme),
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user.password_hash = hash_password(new_password)
+    user.password_hash = await hash_password_async(new_password)
     db.commit()
     return {"status": "ok"}
 
@@ -530,11 +1399,12 @@ async def super_update_user(user_id: int, request: Request, current: User = Depe
     if "email" in data:
         user.email = data["email"]
     if "password" in data and data["password"]:
-        user.password_hash = hash_password(data["password"])
+        user.password_hash = await hash_password_async(data["password"])
     if "supplier_id" in data:
         user.supplier_id = data["supplier_id"]
 
     db.commit()
+    invalidate_user_tokens(db, user.id)
     return {"ok": True}
 
 @app.delete("/api/super/users/{user_id}")
@@ -546,4 +1416,5 @@ def super_delete_user(user_id: int, current: User = Depends(get_current_user), d
         raise HTTPException(status_code=404, detail="User not found")
     db.delete(user)
     db.commit()
+    invalidate_user_tokens(db, user_id)
     return {"ok": True}
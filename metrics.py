@@ -0,0 +1,240 @@
+"""Метрики запросов и SQL в формате Prometheus (GET /metrics).
+
+MetricsMiddleware меряет время и статусы по шаблону маршрута; события движков SQLAlchemy
+считают запросы к базе и их время в рамках текущего HTTP-запроса.
+"""
+import bisect
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Один и тот же SQL столько раз за запрос — почти всегда ленивая загрузка в цикле
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+# Заголовки X-DB-Queries и X-DB-Time-Ms в ответах — только для разработки
+METRICS_DEBUG_HEADERS = os.getenv("METRICS_DEBUG_HEADERS", "0") == "1"
+# Без токена /metrics отвечает 404: метрики раскрывают маршруты, SQL и нагрузку
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+SLOW_QUERY_PARAMS_LIMIT = 500
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def lines(self, name: str, labels: str):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        cumulative += self.counts[-1]
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.sum:.6f}"
+        yield f"{name}_count{{{labels}}} {cumulative}"
+
+
+class RequestStats:
+    def __init__(self, route: str):
+        self.route = route
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = {}
+        self.n_plus_one = set()
+
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}  # (method, route) -> Histogram
+        self.queries = {}  # (method, route) -> Histogram по числу SQL за запрос
+        self.db_time = {}  # (method, route) -> секунды в базе
+        self.statuses = {}  # (method, route, status) -> count
+        self.n_plus_one = {}  # route -> count
+        self.queries_total = 0
+        self.query_seconds_total = 0.0
+        self.slow_queries = 0
+
+    def record_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        key = (method, route)
+        with self._lock:
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(stats.queries)
+            self.db_time[key] = self.db_time.get(key, 0.0) + stats.db_seconds
+            self.statuses[method, route, status] = self.statuses.get((method, route, status), 0) + 1
+            if stats.n_plus_one:
+                self.n_plus_one[route] = self.n_plus_one.get(route, 0) + len(stats.n_plus_one)
+
+    def record_query(self, seconds: float, slow: bool):
+        with self._lock:
+            self.queries_total += 1
+            self.query_seconds_total += seconds
+            self.slow_queries += slow
+
+    def render(self, pools, caches, admission=None):
+        lines = []
+
+        def header(name, kind, text):
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            header("http_request_duration_seconds", "histogram", "HTTP request latency by route")
+            for (method, route), histogram in sorted(self.latency.items()):
+                lines.extend(histogram.lines("http_request_duration_seconds", _labels(method=method, route=route)))
+            header("http_requests_total", "counter", "HTTP responses by route and status")
+            for (method, route, status), count in sorted(self.statuses.items()):
+                lines.append(f"http_requests_total{{{_labels(method=method, route=route, status=status)}}} {count}")
+            header("http_request_db_queries", "histogram", "SQL statements executed per HTTP request")
+            for (method, route), histogram in sorted(self.queries.items()):
+                lines.extend(histogram.lines("http_request_db_queries", _labels(method=method, route=route)))
+            header("http_request_db_seconds_total", "counter", "Time spent in SQL by route")
+            for (method, route), seconds in sorted(self.db_time.items()):
+                lines.append(f"http_request_db_seconds_total{{{_labels(method=method, route=route)}}} {seconds:.6f}")
+            header("http_n_plus_one_total", "counter", "Repeated statements that looked like N+1 loading")
+            for route, count in sorted(self.n_plus_one.items()):
+                lines.append(f"http_n_plus_one_total{{{_labels(route=route)}}} {count}")
+            header("db_queries_total", "counter", "SQL statements executed, including background work")
+            lines.append(f"db_queries_total {self.queries_total}")
+            header("db_query_seconds_total", "counter", "Time spent in SQL, including background work")
+            lines.append(f"db_query_seconds_total {self.query_seconds_total:.6f}")
+            header("db_slow_queries_total", "counter", f"SQL statements slower than {SLOW_QUERY_MS:g} ms")
+            lines.append(f"db_slow_queries_total {self.slow_queries}")
+
+        header("db_pool", "gauge", "Connection pool state and counters")
+        for pool, stats in sorted(pools.items()):
+            for stat, value in sorted(stats.items()):
+                lines.append(f"db_pool{{{_labels(pool=pool, stat=stat)}}} {value}")
+        header("cache", "gauge", "In-process cache counters")
+        for cache, stats in sorted(caches.items()):
+            for stat, value in sorted(stats.items()):
+                lines.append(f"cache{{{_labels(cache=cache, stat=stat)}}} {value}")
+        if admission:
+            header("admission", "gauge", "Admission control slots, queues and shed requests by route class")
+            for route_class, stats in sorted(admission.items()):
+                for stat, value in sorted(stats.items()):
+                    lines.append(f"admission{{{_labels(route_class=route_class, stat=stat)}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+registry = Registry()
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    seconds = time.perf_counter() - started
+    slow = seconds * 1000 >= SLOW_QUERY_MS
+    registry.record_query(seconds, slow)
+    stats = _current.get()
+    if slow:
+        params = repr(parameters)
+        if len(params) > SLOW_QUERY_PARAMS_LIMIT:
+            params = params[:SLOW_QUERY_PARAMS_LIMIT] + "..."
+        logger.warning(
+            "Slow query %.1f ms%s: %s params=%s",
+            seconds * 1000,
+            f" in {stats.route}" if stats else "",
+            WHITESPACE_RE.sub(" ", statement).strip(),
+            params,
+        )
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.db_seconds += seconds
+    # Текст с плейсхолдерами одинаков для всех итераций цикла, параметры различаются
+    count = stats.statements[statement] = stats.statements.get(statement, 0) + 1
+    if count == N_PLUS_ONE_THRESHOLD:
+        stats.n_plus_one.add(statement)
+        logger.warning(
+            "Possible N+1 in %s: statement executed %d times: %s",
+            stats.route,
+            count,
+            WHITESPACE_RE.sub(" ", statement).strip(),
+        )
+
+
+def _failed_execute(context):
+    # После ошибки after_cursor_execute не вызывается — снимаем отметку времени сами
+    started = context.connection.info.get("query_started")
+    if started:
+        started.pop()
+
+
+# На классе Engine — события всех движков, включая sync_engine асинхронных
+event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+event.listen(Engine, "handle_error", _failed_execute)
+
+
+def _route_template(scope):
+    route = scope.get("route")
+    # Шаблон вместо пути: /cars/{car_id} — одна серия, а не по серии на машину
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Чистый ASGI, без BaseHTTPMiddleware: не буферизует тело и не ломает потоковые ответы."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope["path"])
+        token = _current.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                stats.route = _route_template(scope)
+                if METRICS_DEBUG_HEADERS:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-db-queries", str(stats.queries).encode()))
+                    headers.append((b"x-db-time-ms", f"{stats.db_seconds * 1000:.1f}".encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            stats.route = _route_template(scope)
+            registry.record_request(scope["method"], stats.route, status, time.perf_counter() - started, stats)
@@ -0,0 +1,242 @@
+"""Версионированные миграции схемы.
+
+Запускаются явно перед стартом приложения, а не при импорте:
+
+    python migrations.py            # применить новые миграции
+    python migrations.py status     # применённые и ожидающие версии
+    python migrations.py check      # сверить базу с моделями (таблицы, колонки, индексы)
+
+База выбирается так же, как в приложении (DATABASE_URL или параметры из .env),
+поэтому одна и та же команда проверяет и SQLite, и локальный Postgres.
+"""
+import sys
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.orm import Session
+
+import models  # noqa: F401  регистрирует таблицы в Base.metadata
+import rollups
+from database import Base, engine
+from date_ranges import merge_ranges
+from id_allocator import LEGACY_BOOKING_ID_MIN
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+MIGRATIONS = []
+
+
+def migration(version: int, name: str):
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return register
+
+
+# Хелперы идемпотентны: модели — источник истины, и свежая база,
+# созданная первой миграцией, уже может содержать то, что добавляют следующие.
+
+def create_tables(conn, *names):
+    Base.metadata.create_all(conn, tables=[Base.metadata.tables[name] for name in names])
+
+
+def create_indexes(conn, table_name, *index_names):
+    table = Base.metadata.tables[table_name]
+    for index in table.indexes:
+        if index.name in index_names:
+            index.create(conn, checkfirst=True)
+
+
+def add_column(conn, table_name, column_name):
+    existing = {column["name"] for column in inspect(conn).get_columns(table_name)}
+    if column_name in existing:
+        return
+    column = Base.metadata.tables[table_name].columns[column_name]
+    column_type = column.type.compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+
+
+@migration(1, "initial schema")
+def initial_schema(conn):
+    create_tables(
+        conn,
+        "suppliers",
+        "excursions",
+        "cars",
+        "car_reservations",
+        "excursion_reservations",
+        "confirmed_bookings",
+        "users",
+        "email_outbox",
+        "id_sequences",
+    )
+
+
+@migration(2, "indexes for availability, catalog and booking listings")
+def performance_indexes(conn):
+    create_indexes(conn, "car_reservations", "ix_car_reservations_car_dates")
+    create_indexes(conn, "excursion_reservations", "ix_excursion_reservations_excursion_date")
+    create_indexes(conn, "excursions", "ix_excursions_operator_id")
+    create_indexes(conn, "cars", "ix_cars_supplier_id")
+    create_indexes(
+        conn,
+        "confirmed_bookings",
+        "ix_confirmed_bookings_supplier_date",
+        "ix_confirmed_bookings_date_id",
+    )
+    create_indexes(conn, "email_outbox", "ix_email_outbox_status_next_attempt")
+
+
+@migration(3, "excursion daily capacity and seat inventory")
+def excursion_inventory(conn):
+    add_column(conn, "excursions", "daily_capacity")
+    create_tables(conn, "excursion_inventory")
+
+
+@migration(4, "seasonal rates and length-of-stay discounts")
+def pricing_tables(conn):
+    create_tables(conn, "seasonal_rates", "stay_discounts")
+
+
+@migration(5, "supplier revenue and car occupancy rollups")
+def supplier_rollups(conn):
+    create_tables(conn, "supplier_daily_stats", "supplier_car_occupancy")
+    # Заполняем по уже накопленной истории, коммит делает upgrade()
+    rollups.rebuild(Session(bind=conn))
+
+
+@migration(6, "idempotency keys for payments")
+def idempotency_keys(conn):
+    create_tables(conn, "idempotency_keys")
+
+
+@migration(7, "uploaded catalog images")
+def catalog_images(conn):
+    create_tables(conn, "catalog_images")
+
+
+@migration(8, "exclude overlapping car reservations")
+def car_reservations_no_overlap(conn):
+    if conn.dialect.name != "postgresql":
+        return  # в SQLite пересечения не пускает блокировка записи в booking.lock_car
+    # Пересечения, записанные до ограничения, сливаются в один диапазон на машину
+    cars = [row.car_id for row in conn.execute(text(
+        "SELECT DISTINCT a.car_id FROM car_reservations a JOIN car_reservations b"
+        " ON a.car_id = b.car_id AND a.id < b.id AND a.start_date <= b.end_date AND a.end_date >= b.start_date"
+    ))]
+    for car_id in cars:
+        rows = conn.execute(
+            text("SELECT start_date, end_date FROM car_reservations"
+                 " WHERE car_id = :car_id AND start_date IS NOT NULL AND end_date IS NOT NULL"),
+            {"car_id": car_id},
+        ).all()
+        conn.execute(
+            text("DELETE FROM car_reservations WHERE car_id = :car_id AND start_date IS NOT NULL AND end_date IS NOT NULL"),
+            {"car_id": car_id},
+        )
+        conn.execute(
+            text("INSERT INTO car_reservations (car_id, start_date, end_date) VALUES (:car_id, :start_date, :end_date)"),
+            [{"car_id": car_id, "start_date": start, "end_date": end} for start, end in merge_ranges(rows)],
+        )
+    if cars:
+        print(f"  merged overlapping reservations of {len(cars)} car(s)")
+        rollups.rebuild(Session(bind=conn))  # дни занятости считались по каждой из пересекавшихся броней
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+    conn.execute(text(
+        "ALTER TABLE car_reservations ADD CONSTRAINT car_reservations_no_overlap"
+        " EXCLUDE USING gist (car_id WITH =, daterange(start_date, end_date, '[]') WITH &&)"
+        " WHERE (start_date IS NOT NULL AND end_date IS NOT NULL)"
+    ))
+
+
+@migration(9, "restart booking ids below legacy timestamp ids")
+def restart_booking_ids(conn):
+    # Счётчик, начатый от старых номеров-таймстемпов, пересоздастся аллокатором с короткого диапазона
+    conn.execute(
+        text("DELETE FROM id_sequences WHERE name = 'booking_id' AND next_value >= :legacy"),
+        {"legacy": LEGACY_BOOKING_ID_MIN},
+    )
+
+
+def applied_versions(conn):
+    schema_migrations.create(conn, checkfirst=True)
+    return {row.version for row in conn.execute(select(schema_migrations.c.version))}
+
+
+def upgrade():
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            # Два одновременных деплоя не должны применять миграции параллельно
+            conn.execute(text("SELECT pg_advisory_lock(hashtext('schema_migrations'))"))
+        try:
+            done = applied_versions(conn)
+            conn.commit()
+            for version, name, fn in sorted(MIGRATIONS):
+                if version in done:
+                    continue
+                print(f"Applying {version:04d} {name}")
+                fn(conn)
+                conn.execute(
+                    schema_migrations.insert().values(version=version, name=name, applied_at=datetime.utcnow())
+                )
+                conn.commit()
+        finally:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_unlock(hashtext('schema_migrations'))"))
+                conn.commit()
+
+
+def status():
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+        conn.commit()
+    for version, name, _ in sorted(MIGRATIONS):
+        print(f"{'applied' if version in done else 'pending'}  {version:04d} {name}")
+    return 0
+
+
+def check():
+    problems = []
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        tables = set(inspector.get_table_names())
+        done = applied_versions(conn) if "schema_migrations" in tables else set()
+        pending = [version for version, _, _ in MIGRATIONS if version not in done]
+        if pending:
+            problems.append(f"pending migrations: {pending}")
+        for name, table in Base.metadata.tables.items():
+            if name not in tables:
+                problems.append(f"missing table {name}")
+                continue
+            columns = {column["name"] for column in inspector.get_columns(name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    problems.append(f"missing column {name}.{column.name}")
+            indexes = {index["name"] for index in inspector.get_indexes(name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    problems.append(f"missing index {index.name} on {name}")
+
+    for problem in problems:
+        print(problem)
+    print(f"{engine.dialect.name}: {'OK' if not problems else f'{len(problems)} problem(s)'}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if command == "upgrade":
+        upgrade()
+        sys.exit(check())
+    elif command == "status":
+        sys.exit(status())
+    elif command == "check":
+        sys.exit(check())
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Boolean, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Date, DateTime, ForeignKey, Boolean, Enum, Index, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 import enum
+from datetime import datetime
 
 class ConfirmedBooking(Base):
     __tablename__ = "confirmed_bookings"
@@ -29,6 +30,11 @@ class ConfirmedBooking(Base):
 
     supplier = relationship("Supplier")
 
+    __table_args__ = (
+        Index("ix_confirmed_bookings_supplier_date", "supplier_id", "date", "id"),
+        Index("ix_confirmed_bookings_date_id", "date", "id"),
+    )
+
 
 class Supplier(Base):
     __tablename__ = "suppliers"
@@ -58,7 +64,8 @@ class Excursion(Base):
     child_price = Column(Float)
     infant_price = Column(Float)
     image_urls = Column(String)
-    operator_id = Column(Integer, ForeignKey("suppliers.id"))
+    daily_capacity = Column(Integer, nullable=True)  # мест в день; None — без ограничения
+    operator_id = Column(Integer, ForeignKey("suppliers.id"), index=True)
 
     supplier = relationship("Supplier", back_populates="excursions")
 
@@ -82,7 +89,7 @@ class Car(Base):
     mileage = Column(Integer)  # пробег в км
     drive_type = Column(String)  # полный, передний, задний
 
-    supplier_id = Column(Integer, ForeignKey("suppliers.id"))
+    supplier_id = Column(Integer, ForeignKey("suppliers.id"), index=True)
     supplier = relationship("Supplier", back_populates="cars")
 
 class CarReservation(Base):
@@ -93,6 +100,12 @@ class CarReservation(Base):
     start_date = Column(Date)
     end_date = Column(Date)
 
+    # Поиск пересечений по машине и диапазону дат; в Postgres пересечения запрещены
+    # ограничением car_reservations_no_overlap (EXCLUDE USING gist, миграция 8)
+    __table_args__ = (
+        Index("ix_car_reservations_car_dates", "car_id", "start_date", "end_date"),
+    )
+
 class ExcursionReservation(Base):
     __tablename__ = "excursion_reservations"
 
@@ -100,6 +113,23 @@ class ExcursionReservation(Base):
     excursion_id = Column(Integer, ForeignKey("excursions.id"))
     date = Column(Date)
 
+    __table_args__ = (
+        Index("ix_excursion_reservations_excursion_date", "excursion_id", "date"),
+    )
+
+class ExcursionInventory(Base):
+    __tablename__ = "excursion_inventory"
+
+    id = Column(Integer, primary_key=True, index=True)
+    excursion_id = Column(Integer, ForeignKey("excursions.id"), nullable=False)
+    date = Column(Date, nullable=False)
+    capacity = Column(Integer, nullable=False)
+    remaining = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("excursion_id", "date", name="uq_excursion_inventory_day"),
+    )
+
 class SupplierType(str, enum.Enum):
     tour = "tour"
     car = "car"
@@ -113,4 +143,126 @@ class User(Base):
     supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=True)
     current_token = Column(String, nullable=True)
 
-    supplier = relationship("Supplier")
\ No newline at end of file
+    supplier = relationship("Supplier")
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    recipient = Column(String)
+    subject = Column(String)
+    body = Column(Text)
+    status = Column(String, default="pending")  # pending, sent, failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+
+class IdSequence(Base):
+    __tablename__ = "id_sequences"
+
+    name = Column(String, primary_key=True)
+    next_value = Column(BigInteger, nullable=False)
+
+
+# Коэффициент к базовой цене на период; с item_id — для одной машины/экскурсии, без — для всех у поставщика
+class SeasonalRate(Base):
+    __tablename__ = "seasonal_rates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=False)
+    item_type = Column(String, nullable=False)  # "car" или "excursion"
+    item_id = Column(Integer, nullable=True)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)  # включительно
+    multiplier = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_seasonal_rates_supplier", "supplier_id", "item_type"),
+    )
+
+
+# Скидка за длительную аренду машины: percent при аренде от min_days дней
+class StayDiscount(Base):
+    __tablename__ = "stay_discounts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=False)
+    car_id = Column(Integer, ForeignKey("cars.id"), nullable=True)
+    min_days = Column(Integer, nullable=False)
+    percent = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_stay_discounts_supplier", "supplier_id"),
+    )
+
+
+# Сводки для отчётов поставщика; обновляются вместе с бронями, пересчёт — python rollups.py rebuild
+class SupplierDailyStats(Base):
+    __tablename__ = "supplier_daily_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    supplier_id = Column(Integer, nullable=False)
+    date = Column(Date, nullable=False)
+    booking_type = Column(String, nullable=False)
+    bookings = Column(Integer, nullable=False, default=0)
+    people = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("supplier_id", "date", "booking_type", name="uq_supplier_daily_stats"),
+    )
+
+
+class SupplierCarOccupancy(Base):
+    __tablename__ = "supplier_car_occupancy"
+
+    id = Column(Integer, primary_key=True, index=True)
+    supplier_id = Column(Integer, nullable=False)
+    date = Column(Date, nullable=False)
+    car_days = Column(Integer, nullable=False, default=0)  # сколько машин поставщика занято в этот день
+
+    __table_args__ = (
+        UniqueConstraint("supplier_id", "date", name="uq_supplier_car_occupancy"),
+    )
+
+
+# Ключи Idempotency-Key для /api/pay: повтор запроса получает сохранённый ответ, а не новую бронь
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)
+    request_hash = Column(String, nullable=False)  # sha256 тела запроса
+    status = Column(String, nullable=False)  # in_progress, done
+    response_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)  # начало (или перехват) обработки
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+
+# Загруженные фото машин и экскурсий; файлы вариантов лежат в хранилище images.image_store
+class CatalogImage(Base):
+    __tablename__ = "catalog_images"
+
+    id = Column(Integer, primary_key=True, index=True)
+    item_type = Column(String, nullable=False)  # "car" или "excursion"
+    item_id = Column(Integer, nullable=False)
+    supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+    content_hash = Column(String, nullable=False)  # sha256 исходного файла
+    variants = Column(Text, nullable=False)  # JSON: [{"name", "width", "height", "format", "file"}]
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_catalog_images_item", "item_type", "item_id"),
+    )
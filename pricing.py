@@ -0,0 +1,190 @@
+import bisect
+import os
+import threading
+import time
+from datetime import date, timedelta
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from catalog_cache import CATALOG_CACHE_TTL, catalog_cache
+from models import Car, Excursion, SeasonalRate, StayDiscount
+
+# Допустимое расхождение суммы клиента с серверным расчётом (округление на фронтенде)
+PRICE_TOLERANCE = float(os.getenv("PRICE_TOLERANCE", "0.01"))
+QUOTES_MAX_ITEMS = 200
+
+
+class QuoteError(Exception):
+    pass
+
+
+def rental_days(start_date: date, end_date: date):
+    # Обе даты включительно, как в самой брони машины и в сводках занятости
+    return (end_date - start_date).days + 1
+
+
+class RateTables:
+    """Снимок тарифов: на каждую позицию — непересекающиеся отрезки с коэффициентом.
+
+    Цена за период считается по пересечениям отрезков с диапазоном дат, а не по каждому дню.
+    """
+
+    def __init__(self, rates, discounts):
+        self._rates = {}
+        for rate in rates:
+            self._rates.setdefault((rate.item_type, rate.supplier_id), []).append(rate)
+        self._discounts = {}
+        for discount in discounts:
+            self._discounts.setdefault(discount.supplier_id, []).append(discount)
+        self._segments = {}
+
+    def segments(self, item_type: str, supplier_id: int, item_id: int):
+        key = (item_type, supplier_id, item_id)
+        segments = self._segments.get(key)
+        if segments is None:
+            segments = self._segments[key] = self._compile(
+                [r for r in self._rates.get((item_type, supplier_id), ()) if r.item_id in (None, item_id)]
+            )
+        return segments
+
+    @staticmethod
+    def _compile(rates):
+        # Тариф конкретной позиции важнее общего тарифа поставщика, при равенстве — более новый
+        rates = sorted(rates, key=lambda r: (r.item_id is not None, r.id), reverse=True)
+        bounds = sorted({r.start_date for r in rates} | {r.end_date + timedelta(days=1) for r in rates})
+        segments = []
+        for start, end in zip(bounds, bounds[1:]):
+            rate = next((r for r in rates if r.start_date <= start and r.end_date >= end - timedelta(days=1)), None)
+            if rate is None:
+                continue
+            if segments and segments[-1][1] == start and segments[-1][2] == rate.multiplier:
+                segments[-1] = (segments[-1][0], end, rate.multiplier)
+            else:
+                segments.append((start, end, rate.multiplier))
+        return segments
+
+    def weighted_days(self, item_type: str, supplier_id: int, item_id: int, start: date, days: int):
+        """Сумма коэффициентов по дням [start, start + days): день без тарифа идёт с коэффициентом 1."""
+        end = start + timedelta(days=days)
+        segments = self.segments(item_type, supplier_id, item_id)
+        total = float(days)
+        index = max(bisect.bisect_right(segments, (start,)) - 1, 0)
+        for seg_start, seg_end, multiplier in segments[index:]:
+            if seg_start >= end:
+                break
+            overlap = (min(seg_end, end) - max(seg_start, start)).days
+            if overlap > 0:
+                total += overlap * (multiplier - 1)
+        return total
+
+    def stay_discount(self, supplier_id: int, car_id: int, days: int):
+        applicable = [
+            d.percent
+            for d in self._discounts.get(supplier_id, ())
+            if d.car_id in (None, car_id) and d.min_days <= days
+        ]
+        return max(applicable, default=0.0)
+
+
+class RateCache:
+    """Тарифы перечитываются после инвалидации каталога (правки тарифов и цен) или по TTL."""
+
+    def __init__(self, ttl: float = CATALOG_CACHE_TTL):
+        self.ttl = ttl
+        self._tables = None
+        self._generation = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> RateTables:
+        with self._lock:
+            generation = catalog_cache.generation
+            if self._tables is None or self._generation != generation or time.monotonic() >= self._expires_at:
+                # Строки, а не ORM-объекты: снимок переживает сессию, в которой загружен
+                self._tables = RateTables(
+                    db.execute(select(SeasonalRate.__table__)).all(),
+                    db.execute(select(StayDiscount.__table__)).all(),
+                )
+                self._generation = generation
+                self._expires_at = time.monotonic() + self.ttl
+            return self._tables
+
+
+rate_cache = RateCache()
+
+
+def quote_car(tables: RateTables, car, start_date: date, end_date: date):
+    if end_date < start_date:
+        raise QuoteError("end_date must not be before start_date")
+    if car.price_per_day is None:
+        raise QuoteError("Price is not available for this car")
+    days = rental_days(start_date, end_date)
+    subtotal = car.price_per_day * tables.weighted_days("car", car.supplier_id, car.id, start_date, days)
+    percent = tables.stay_discount(car.supplier_id, car.id, days)
+    discount = subtotal * percent / 100
+    return {
+        "type": "car",
+        "id": car.id,
+        "supplier_id": car.supplier_id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "days": days,
+        "subtotal": round(subtotal, 2),
+        "discount_percent": percent,
+        "discount": round(discount, 2),
+        "total": round(subtotal - discount, 2),
+    }
+
+
+def quote_excursion(tables: RateTables, excursion, day: date, adults: int, children: int, infants: int):
+    adult_price = excursion.adult_price if excursion.adult_price is not None else excursion.price
+    if adult_price is None:
+        raise QuoteError("Price is not available for this excursion")
+    base = adults * adult_price + children * (excursion.child_price or 0) + infants * (excursion.infant_price or 0)
+    multiplier = tables.weighted_days("excursion", excursion.operator_id, excursion.id, day, 1)
+    subtotal = base * multiplier
+    return {
+        "type": "excursion",
+        "id": excursion.id,
+        "supplier_id": excursion.operator_id,
+        "date": day,
+        "adults": adults,
+        "children": children,
+        "infants": infants,
+        "subtotal": round(subtotal, 2),
+        "discount_percent": 0.0,
+        "discount": 0.0,
+        "total": round(subtotal, 2),
+    }
+
+
+def quote_items(db: Session, items):
+    """Считает страницу позиций: по одному запросу на машины и экскурсии, тарифы — из кэша."""
+    tables = rate_cache.get(db)
+    car_ids = {item.id for item in items if item.type == "car"}
+    excursion_ids = {item.id for item in items if item.type == "excursion"}
+    cars = {car.id: car for car in db.query(Car).filter(Car.id.in_(car_ids))} if car_ids else {}
+    excursions = (
+        {e.id: e for e in db.query(Excursion).filter(Excursion.id.in_(excursion_ids))} if excursion_ids else {}
+    )
+
+    quotes = []
+    for item in items:
+        try:
+            if item.type == "car":
+                if item.id not in cars:
+                    raise QuoteError("Car not found")
+                if not item.start_date or not item.end_date:
+                    raise QuoteError("start_date and end_date are required for cars")
+                quotes.append(quote_car(tables, cars[item.id], item.start_date, item.end_date))
+            else:
+                if item.id not in excursions:
+                    raise QuoteError("Excursion not found")
+                if not item.day:
+                    raise QuoteError("date is required for excursions")
+                quotes.append(
+                    quote_excursion(tables, excursions[item.id], item.day, item.adults, item.children, item.infants)
+                )
+        except QuoteError as exc:
+            quotes.append({"type": item.type, "id": item.id, "error": str(exc)})
+    return quotes
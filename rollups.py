@@ -0,0 +1,215 @@
+"""Сводки выручки и загрузки машин по поставщикам.
+
+Счётчики обновляются в той же транзакции, что и брони (record_booking, record_car_days).
+Полный пересчёт из confirmed_bookings и car_reservations:
+
+    python rollups.py rebuild
+"""
+import sys
+from collections import Counter
+from datetime import date, timedelta
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, dialect_insert
+from models import Car, CarReservation, ConfirmedBooking, SupplierCarOccupancy, SupplierDailyStats
+
+ROLLUP_BATCH_SIZE = 1000
+STATS_MAX_DAYS = 3660
+
+
+def _days(start: date, end: date):
+    return (start + timedelta(days=offset) for offset in range((end - start).days + 1))
+
+
+def _upsert(db: Session, model, rows, keys, counters):
+    table = model.__table__
+    insert = dialect_insert(db)
+    # Один порядок строк во всех транзакциях — параллельные брони не ловят взаимную блокировку
+    rows.sort(key=lambda row: tuple(row[key] for key in keys))
+    for start in range(0, len(rows), ROLLUP_BATCH_SIZE):
+        statement = insert(table).values(rows[start:start + ROLLUP_BATCH_SIZE])
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=list(keys),
+                set_={name: table.c[name] + statement.excluded[name] for name in counters},
+            )
+        )
+
+
+def record_booking(db: Session, supplier_id, day, booking_type, people: int, revenue: float, sign: int = 1):
+    if supplier_id is None or day is None:
+        return  # без поставщика или даты бронь в сводки не попадает
+    _upsert(
+        db,
+        SupplierDailyStats,
+        [{
+            "supplier_id": supplier_id,
+            "date": day,
+            "booking_type": booking_type or "unknown",
+            "bookings": sign,
+            "people": sign * (people or 0),
+            "revenue": sign * (revenue or 0),
+        }],
+        ("supplier_id", "date", "booking_type"),
+        ("bookings", "people", "revenue"),
+    )
+
+
+def record_car_days(db: Session, supplier_id, ranges, sign: int = 1):
+    """Учитывает занятые дни машин поставщика; ranges — пары дат, обе включительно."""
+    if supplier_id is None:
+        return
+    counts = Counter()
+    for start, end in ranges:
+        counts.update(_days(start, end))
+    if counts:
+        _upsert(
+            db,
+            SupplierCarOccupancy,
+            [{"supplier_id": supplier_id, "date": day, "car_days": sign * count} for day, count in counts.items()],
+            ("supplier_id", "date"),
+            ("car_days",),
+        )
+
+
+def rebuild(db: Session):
+    """Пересчитывает сводки с нуля; коммит за вызывающим."""
+    if db.get_bind().dialect.name == "postgresql":
+        # Брони, пишущие счётчики параллельно, дождутся конца пересчёта и не потеряются
+        db.execute(text("LOCK TABLE supplier_daily_stats, supplier_car_occupancy IN EXCLUSIVE MODE"))
+    db.query(SupplierDailyStats).delete(synchronize_session=False)
+    db.query(SupplierCarOccupancy).delete(synchronize_session=False)
+
+    booking_type = func.coalesce(ConfirmedBooking.booking_type, "unknown")
+    stats = [
+        {"supplier_id": supplier_id, "date": day, "booking_type": kind, "bookings": bookings, "people": people or 0, "revenue": revenue or 0}
+        for supplier_id, day, kind, bookings, people, revenue in db.query(
+            ConfirmedBooking.supplier_id,
+            ConfirmedBooking.date,
+            booking_type,
+            func.count(ConfirmedBooking.id),
+            func.sum(ConfirmedBooking.people_count),
+            func.sum(ConfirmedBooking.total_price),
+        )
+        .filter(ConfirmedBooking.supplier_id.isnot(None), ConfirmedBooking.date.isnot(None))
+        .group_by(ConfirmedBooking.supplier_id, ConfirmedBooking.date, booking_type)
+    ]
+    _upsert(db, SupplierDailyStats, stats, ("supplier_id", "date", "booking_type"), ("bookings", "people", "revenue"))
+
+    occupancy = Counter()
+    reservations = (
+        db.query(Car.supplier_id, CarReservation.start_date, CarReservation.end_date)
+        .join(Car, Car.id == CarReservation.car_id)
+        .filter(Car.supplier_id.isnot(None))
+        .yield_per(ROLLUP_BATCH_SIZE)
+    )
+    for supplier_id, start, end in reservations:
+        for day in _days(start, end):
+            occupancy[supplier_id, day] += 1
+    _upsert(
+        db,
+        SupplierCarOccupancy,
+        [{"supplier_id": supplier_id, "date": day, "car_days": count} for (supplier_id, day), count in occupancy.items()],
+        ("supplier_id", "date"),
+        ("car_days",),
+    )
+    return {"stats_rows": len(stats), "occupancy_rows": len(occupancy)}
+
+
+def period_start(day: date, granularity: str):
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    if granularity == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+
+def next_period(day: date, granularity: str):
+    if granularity == "week":
+        return day + timedelta(days=7)
+    if granularity == "month":
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    if granularity == "year":
+        return day.replace(year=day.year + 1)
+    return day + timedelta(days=1)
+
+
+def _empty_bucket(period: date, days: int):
+    return {"period": period, "days": days, "bookings": 0, "people": 0, "revenue": 0.0, "by_type": {}, "car_days": 0}
+
+
+def supplier_stats(db: Session, supplier_id: int, start: date, end: date, granularity: str):
+    """Ряд по периодам только из сводок: объём работы зависит от окна, а не от истории броней."""
+    if end < start:
+        raise ValueError("to must not be before from")
+    if (end - start).days >= STATS_MAX_DAYS:
+        raise ValueError(f"Window is limited to {STATS_MAX_DAYS} days")
+
+    buckets = {}
+    period = period_start(start, granularity)
+    while period <= end:
+        following = next_period(period, granularity)
+        days = (min(following - timedelta(days=1), end) - max(period, start)).days + 1
+        buckets[period] = _empty_bucket(period, days)
+        period = following
+
+    rows = db.query(
+        SupplierDailyStats.date,
+        SupplierDailyStats.booking_type,
+        SupplierDailyStats.bookings,
+        SupplierDailyStats.people,
+        SupplierDailyStats.revenue,
+    ).filter(
+        SupplierDailyStats.supplier_id == supplier_id,
+        SupplierDailyStats.date >= start,
+        SupplierDailyStats.date <= end,
+    )
+    for day, kind, bookings, people, revenue in rows:
+        bucket = buckets[period_start(day, granularity)]
+        bucket["bookings"] += bookings
+        bucket["people"] += people
+        bucket["revenue"] += revenue
+        by_type = bucket["by_type"].setdefault(kind, {"bookings": 0, "people": 0, "revenue": 0.0})
+        by_type["bookings"] += bookings
+        by_type["people"] += people
+        by_type["revenue"] += revenue
+
+    occupancy = db.query(SupplierCarOccupancy.date, SupplierCarOccupancy.car_days).filter(
+        SupplierCarOccupancy.supplier_id == supplier_id,
+        SupplierCarOccupancy.date >= start,
+        SupplierCarOccupancy.date <= end,
+    )
+    for day, car_days in occupancy:
+        buckets[period_start(day, granularity)]["car_days"] += car_days
+
+    # Загрузка считается от текущего размера парка: история парка не хранится
+    fleet = db.query(func.count(Car.id)).filter(Car.supplier_id == supplier_id).scalar()
+    totals = _empty_bucket(start, (end - start).days + 1)
+    del totals["period"], totals["by_type"]
+    series = list(buckets.values())
+    for bucket in series:
+        bucket["revenue"] = round(bucket["revenue"], 2)
+        for by_type in bucket["by_type"].values():
+            by_type["revenue"] = round(by_type["revenue"], 2)
+        bucket["occupancy"] = round(bucket["car_days"] / (fleet * bucket["days"]), 4) if fleet else None
+        for key in ("bookings", "people", "revenue", "car_days"):
+            totals[key] += bucket[key]
+    totals["revenue"] = round(totals["revenue"], 2)
+    totals["occupancy"] = round(totals["car_days"] / (fleet * totals["days"]), 4) if fleet else None
+    return {"fleet": fleet, "series": series, "totals": totals}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print(__doc__)
+        sys.exit(2)
+    db = SessionLocal()
+    try:
+        result = rebuild(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Rebuilt {result['stats_rows']} stats rows and {result['occupancy_rows']} occupancy rows")
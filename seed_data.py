@@ -1,68 +1,275 @@
+"""Синтетические данные для разработки и нагрузочного тестирования.
+
+Пишет в ту же базу, что и приложение (DATABASE_URL или .env), пачками через executemany:
+
+    python migrations.py
+    python seed_data.py                                # небольшой набор
+    python seed_data.py --scale 100                    # всё в 100 раз больше
+    python seed_data.py --cars 50000 --bookings 2000000 --seed 7
+
+Данные добавляются к существующим. У каждого поставщика есть админ
+supplier<id>@example.com, суперпользователь — admin@example.com; пароль задаётся --password.
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from sqlalchemy import func, insert, text
+
+import rollups
+from auth import hash_password
 from database import SessionLocal
-from models import TourOperator, Excursion, Car
+from id_allocator import booking_ids
+from models import Car, CarReservation, ConfirmedBooking, Excursion, Supplier, User
 
-# Открываем сессию
-session = SessionLocal()
+DEFAULTS = {"suppliers": 20, "cars": 500, "excursions": 1000, "reservations": 5000, "bookings": 20000}
 
-# Туроператоры
-tour_operators = [
-    TourOperator(name="Dubai Adventures", phone="+971-50-123-4567", email="info@dubaiadv.com", logo_url="https://example.com/logo1.png"),
-    TourOperator(name="Emirates Tours", phone="+971-55-765-4321", email="contact@emiratestours.com", logo_url="https://example.com/logo2.png")
-]
-session.add_all(tour_operators)
-session.commit()
-
-# Экскурсии
-excursions = [
-    Excursion(
-        title="City Tour Dubai",
-        description="Обзорная экскурсия по Дубаю с русским гидом.",
-        duration="4 часа",
-        location="Дубай",
-        price=200,
-        image_urls="https://example.com/dubai1.jpg,https://example.com/dubai2.jpg",
-        operator_id=tour_operators[0].id
-    ),
-    Excursion(
-        title="Safari Desert",
-        description="Сафари по пустыне с ужином.",
-        duration="6 часов",
-        location="Пустыня",
-        price=350,
-        image_urls="https://example.com/safari1.jpg,https://example.com/safari2.jpg",
-        operator_id=tour_operators[1].id
-    )
+CAR_MODELS = {
+    "Toyota": ["Camry", "Corolla", "Land Cruiser", "RAV4", "Prado"],
+    "Nissan": ["Patrol", "Sunny", "X-Trail", "Altima"],
+    "Hyundai": ["Elantra", "Tucson", "Santa Fe", "Accent"],
+    "Kia": ["Rio", "Sportage", "Sorento", "K5"],
+    "Mercedes-Benz": ["C 200", "E 300", "G 63", "V-Class"],
+    "BMW": ["320i", "520d", "X5", "X3"],
+    "Tesla": ["Model 3", "Model Y"],
+    "Chevrolet": ["Tahoe", "Malibu", "Captiva"],
+}
+CAR_TYPES = {"sedan": (4, 5), "SUV": (5, 7), "minivan": (7, 8), "coupe": (2, 4), "hatchback": (4, 5)}
+COLORS = ["white", "black", "silver", "grey", "blue", "red"]
+FUELS = ["petrol", "diesel", "hybrid", "electric"]
+DRIVES = ["fwd", "rwd", "awd"]
+
+PLACES = [
+    ("Dubai", "Дубай"), ("Abu Dhabi", "Абу-Даби"), ("Sharjah", "Шарджа"), ("Fujairah", "Фуджейра"),
+    ("Ras Al Khaimah", "Рас-эль-Хайма"), ("Hatta", "Хатта"), ("Almaty", "Алматы"), ("Phuket", "Пхукет"),
 ]
-session.add_all(excursions)
-session.commit()
-
-# Машины
-cars = [
-    Car(
-        brand="Toyota",
-        model="Camry",
-        color="Белый",
-        seats=5,
-        price_per_day=150,
-        image_url="https://example.com/camry.jpg",
-        car_type="Седан",
-        transmission="Автомат",
-        has_air_conditioning=True
-    ),
-    Car(
-        brand="Nissan",
-        model="Patrol",
-        color="Черный",
-        seats=7,
-        price_per_day=350,
-        image_url="https://example.com/patrol.jpg",
-        car_type="Джип",
-        transmission="Автомат",
-        has_air_conditioning=True
-    )
+TOPICS = [
+    ("desert safari", "сафари по пустыне"), ("city tour", "обзорная экскурсия по городу"),
+    ("yacht cruise", "прогулка на яхте"), ("snorkeling trip", "поездка со снорклингом"),
+    ("mountain hike", "поход в горы"), ("old town walk", "прогулка по старому городу"),
+    ("museum visit", "посещение музея"), ("dhow dinner cruise", "ужин на традиционной лодке"),
+    ("sunset photo tour", "фототур на закате"), ("food market tour", "гастрономический тур по рынкам"),
 ]
-session.add_all(cars)
-session.commit()
+EXTRAS_EN = ["with hotel pickup", "with lunch included", "with a licensed guide", "for families", "in a small group"]
+EXTRAS_RU = ["с трансфером из отеля", "с обедом", "с лицензированным гидом", "для всей семьи", "в малой группе"]
+FIRST_NAMES = ["Aidar", "Anna", "John", "Maria", "Dmitry", "Sara", "Ali", "Elena", "Timur", "Olga"]
+LAST_NAMES = ["Ivanov", "Smith", "Petrova", "Khan", "Nurlanov", "Brown", "Sidorova", "Lee"]
+
+
+def next_id(db, model):
+    return (db.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def bulk_insert(db, model, rows, batch_size: int):
+    """Вставляет строки из генератора пачками, каждая пачка в своей транзакции."""
+    batch = []
+    total = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.execute(insert(model), batch)
+            db.commit()
+            total += len(batch)
+            batch = []
+    if batch:
+        db.execute(insert(model), batch)
+        db.commit()
+        total += len(batch)
+    return total
+
+
+def gen_suppliers(rnd, first_id: int, count: int):
+    for offset in range(count):
+        supplier_id = first_id + offset
+        yield {
+            "id": supplier_id,
+            "name": f"Supplier {supplier_id}",
+            "supplier_type": "car" if offset % 2 == 0 else "tour",
+            "phone": f"+971-50-{rnd.randint(1000000, 9999999)}",
+            "email": f"supplier{supplier_id}@example.com",
+            "address": f"{rnd.randint(1, 300)} {rnd.choice(PLACES)[0]} Street",
+        }
+
+
+def gen_users(supplier_ids, password_hash: str, with_admin: bool):
+    if with_admin:
+        yield {"email": "admin@example.com", "password_hash": password_hash, "is_superuser": True, "supplier_id": None}
+    for supplier_id in supplier_ids:
+        yield {
+            "email": f"supplier{supplier_id}@example.com",
+            "password_hash": password_hash,
+            "is_superuser": False,
+            "supplier_id": supplier_id,
+        }
+
+
+def gen_cars(rnd, first_id: int, count: int, supplier_ids):
+    for offset in range(count):
+        brand = rnd.choice(list(CAR_MODELS))
+        car_type = rnd.choice(list(CAR_TYPES))
+        year = rnd.randint(2012, 2025)
+        yield {
+            "id": first_id + offset,
+            "brand": brand,
+            "model": rnd.choice(CAR_MODELS[brand]),
+            "color": rnd.choice(COLORS),
+            "seats": rnd.randint(*CAR_TYPES[car_type]),
+            "price_per_day": float(rnd.randrange(80, 1500, 10)),
+            "image_url": f"https://example.com/cars/{first_id + offset}.jpg",
+            "car_type": car_type,
+            "transmission": rnd.choice(["automatic", "automatic", "manual"]),
+            "has_air_conditioning": rnd.random() < 0.95,
+            "year": year,
+            "fuel_type": rnd.choice(FUELS),
+            "engine_capacity": round(rnd.uniform(1.2, 5.7), 1),
+            "mileage": rnd.randint(0, 30000) * (2026 - year),
+            "drive_type": rnd.choice(DRIVES),
+            "supplier_id": rnd.choice(supplier_ids),
+        }
+
+
+def gen_excursions(rnd, first_id: int, count: int, supplier_ids):
+    for offset in range(count):
+        (place_en, place_ru), (topic_en, topic_ru) = rnd.choice(PLACES), rnd.choice(TOPICS)
+        extra = rnd.randrange(len(EXTRAS_EN))
+        adult_price = float(rnd.randrange(50, 1200, 5))
+        yield {
+            "id": first_id + offset,
+            "title": f"{place_en} {topic_en} #{first_id + offset}",
+            "description_en": f"{topic_en.capitalize()} in {place_en} {EXTRAS_EN[extra]}.",
+            "description_ru": f"{topic_ru.capitalize()}: {place_ru}, {EXTRAS_RU[extra]}.",
+            "duration": f"{rnd.randint(2, 10)} h",
+            "location_en": place_en,
+            "location_ru": place_ru,
+            "price": adult_price,
+            "adult_price": adult_price,
+            "child_price": round(adult_price * 0.6, 2),
+            "infant_price": 0.0,
+            "image_urls": f"https://example.com/excursions/{first_id + offset}.jpg",
+            "daily_capacity": rnd.choice([None, 10, 20, 40]),
+            "operator_id": rnd.choice(supplier_ids),
+        }
+
+
+def gen_reservations(rnd, car_ids, count: int, start: date):
+    # У каждой машины свой курсор по датам — брони одной машины не пересекаются
+    cursors = {car_id: start + timedelta(days=rnd.randint(0, 30)) for car_id in car_ids}
+    for _ in range(count):
+        car_id = rnd.choice(car_ids)
+        begin = cursors[car_id] + timedelta(days=rnd.randint(0, 20))
+        end = begin + timedelta(days=rnd.randint(0, 10))
+        cursors[car_id] = end + timedelta(days=1)
+        yield {"car_id": car_id, "start_date": begin, "end_date": end}
+
+
+def gen_bookings(rnd, count: int, first_booking_id: int, cars, excursions, start: date, days: int):
+    for offset in range(count):
+        day = start + timedelta(days=rnd.randrange(days))
+        row = {
+            "booking_id": first_booking_id + offset,
+            "first_name": rnd.choice(FIRST_NAMES),
+            "last_name": rnd.choice(LAST_NAMES),
+            "phone": f"+7-701-{rnd.randint(1000000, 9999999)}",
+            "email": f"guest{first_booking_id + offset}@example.com",
+            "contact_method": rnd.choice(["whatsapp", "telegram", "phone"]),
+            "language": rnd.choice(["en", "ru"]),
+            "date": day,
+        }
+        if excursions and (not cars or rnd.random() < 0.6):
+            excursion_id, supplier_id, adult_price, child_price = rnd.choice(excursions)
+            adults, children = rnd.randint(1, 4), rnd.randint(0, 3)
+            row.update(
+                booking_type="excursion",
+                excursion_id=excursion_id,
+                car_id=None,
+                supplier_id=supplier_id,
+                people_count=adults + children,
+                total_price=adults * adult_price + children * child_price,
+            )
+        else:
+            car_id, supplier_id, price_per_day = rnd.choice(cars)
+            row.update(
+                booking_type="car",
+                excursion_id=None,
+                car_id=car_id,
+                supplier_id=supplier_id,
+                people_count=1,
+                total_price=price_per_day * rnd.randint(1, 14),
+            )
+        yield row
+
+
+def sync_sequences(db):
+    # Явные id не двигают последовательности Postgres — подтягиваем их к max(id)
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for table in ("suppliers", "users", "cars", "excursions", "car_reservations", "confirmed_bookings"):
+        db.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 1))"
+        ))
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic booking data")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for all default counts")
+    for name, value in DEFAULTS.items():
+        parser.add_argument(f"--{name}", type=int, help=f"number of {name} (default {value} x scale)")
+    parser.add_argument("--days", type=int, default=730, help="booking history span ending today")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--skip-rollups", action="store_true", help="do not rebuild supplier rollups")
+    args = parser.parse_args()
+    counts = {name: getattr(args, name) or max(int(value * args.scale), 1) for name, value in DEFAULTS.items()}
+
+    rnd = random.Random(args.seed)
+    start = date.today() - timedelta(days=args.days)
+    db = SessionLocal()
+    started = time.perf_counter()
+    try:
+        first_supplier = next_id(db, Supplier)
+        bulk_insert(db, Supplier, gen_suppliers(rnd, first_supplier, counts["suppliers"]), args.batch_size)
+        supplier_ids = list(range(first_supplier, first_supplier + counts["suppliers"]))
+        car_suppliers = supplier_ids[0::2]
+        tour_suppliers = supplier_ids[1::2] or car_suppliers
+
+        # bcrypt медленный намеренно — один хэш на всех тестовых пользователей
+        has_admin = db.query(User.id).filter(User.email == "admin@example.com").first() is not None
+        bulk_insert(db, User, gen_users(supplier_ids, hash_password(args.password), not has_admin), args.batch_size)
+
+        first_car = next_id(db, Car)
+        bulk_insert(db, Car, gen_cars(rnd, first_car, counts["cars"], car_suppliers), args.batch_size)
+        first_excursion = next_id(db, Excursion)
+        bulk_insert(db, Excursion, gen_excursions(rnd, first_excursion, counts["excursions"], tour_suppliers), args.batch_size)
+
+        car_ids = list(range(first_car, first_car + counts["cars"]))
+        bulk_insert(db, CarReservation, gen_reservations(rnd, car_ids, counts["reservations"], start), args.batch_size)
+
+        cars = db.query(Car.id, Car.supplier_id, Car.price_per_day).filter(Car.id >= first_car).all()
+        excursions = (
+            db.query(Excursion.id, Excursion.operator_id, Excursion.adult_price, Excursion.child_price)
+            .filter(Excursion.id >= first_excursion)
+            .all()
+        )
+        first_booking_id, _ = booking_ids.reserve_range(counts["bookings"])
+        bulk_insert(
+            db,
+            ConfirmedBooking,
+            gen_bookings(rnd, counts["bookings"], first_booking_id, cars, excursions, start, args.days + 180),
+            args.batch_size,
+        )
+        sync_sequences(db)
+
+        if not args.skip_rollups:
+            rollups.rebuild(db)
+            db.commit()
+    finally:
+        db.close()
+
+    summary = ", ".join(f"{count} {name}" for name, count in counts.items())
+    print(f"Inserted {summary} in {time.perf_counter() - started:.1f}s")
+
 
-session.close()
-print("✅ Данные успешно добавлены в базу")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
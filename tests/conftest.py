@@ -0,0 +1,92 @@
+"""Тесты идут на временной SQLite базе, схема создаётся миграциями.
+
+    pip install pytest
+    python -m pytest
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# До импорта database: движки создаются при импорте модуля
+_tmp = tempfile.mkdtemp(prefix="booking-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ.pop("DATABASE_REPLICA_URL", None)
+os.environ["EMAIL_WORKERS"] = "0"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["IMAGE_STORE_DIR"] = os.path.join(_tmp, "media")
+
+import migrations  # noqa: E402
+
+migrations.upgrade()
+
+from auth import hash_password, token_cache  # noqa: E402
+from catalog_cache import catalog_cache  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+from models import Car, Excursion, Supplier, User  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def clean_database():
+    yield
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    catalog_cache.invalidate()
+    token_cache.clear()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from main import app
+
+    return TestClient(app)
+
+
+@pytest.fixture
+def supplier(db):
+    supplier = Supplier(name="Supplier", supplier_type="car")
+    db.add(supplier)
+    db.commit()
+    return supplier
+
+
+@pytest.fixture
+def car(db, supplier):
+    car = Car(brand="Toyota", model="Camry", price_per_day=100, supplier_id=supplier.id)
+    db.add(car)
+    db.commit()
+    return car
+
+
+@pytest.fixture
+def excursion(db, supplier):
+    excursion = Excursion(
+        title="Desert safari", duration="4h", price=50, adult_price=50, child_price=25, infant_price=0,
+        operator_id=supplier.id,
+    )
+    db.add(excursion)
+    db.commit()
+    return excursion
+
+
+@pytest.fixture
+def admin_headers(db, client):
+    db.add(User(email="admin@example.com", password_hash=hash_password("password"), is_superuser=True))
+    db.commit()
+    token = client.post("/api/admin/login", json={"email": "admin@example.com", "password": "password"}).json()["token"]
+    return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from admission import ADMISSION_RETRY_AFTER, AdmissionController, AdmissionMiddleware, RouteClass, Shed
+
+
+def controller(total=1, queue=10, timeout=1.0):
+    return AdmissionController(total, {
+        "checkout": RouteClass("checkout", 0, total, queue, timeout),
+        "admin": RouteClass("admin", 1, total, queue, timeout),
+        "public": RouteClass("public", 2, total, queue, timeout),
+    })
+
+
+def test_freed_slot_goes_to_checkout_before_earlier_public_request():
+    async def scenario():
+        admission = controller()
+        await admission.acquire("public")
+        order = []
+
+        async def request(name):
+            await admission.acquire(name)
+            order.append(name)
+            admission.release(name)
+
+        waiters = [asyncio.create_task(request("public")), asyncio.create_task(request("admin"))]
+        await asyncio.sleep(0)
+        waiters.append(asyncio.create_task(request("checkout")))
+        await asyncio.sleep(0)
+        admission.release("public")
+        await asyncio.gather(*waiters)
+        return order
+
+    assert asyncio.run(scenario()) == ["checkout", "admin", "public"]
+
+
+def test_full_queue_sheds_immediately():
+    async def scenario():
+        admission = controller(queue=1)
+        await admission.acquire("public")
+        waiter = asyncio.create_task(admission.acquire("public"))
+        await asyncio.sleep(0)
+        with pytest.raises(Shed):
+            await admission.acquire("public")
+        admission.release("public")
+        await waiter
+        return admission.stats()["public"]
+
+    stats = asyncio.run(scenario())
+    assert stats["shed"] == 1
+    assert stats["admitted"] == 2
+
+
+def test_waiting_longer_than_class_timeout_sheds():
+    async def scenario():
+        admission = controller(timeout=0.05)
+        await admission.acquire("public")
+        with pytest.raises(Shed):
+            await admission.acquire("public")
+        return admission
+
+    admission = asyncio.run(scenario())
+    assert admission.stats()["public"]["shed"] == 1
+    assert admission.stats()["public"]["waiting"] == 0
+    # Ушедший по таймауту не получает место после освобождения
+    admission.release("public")
+    assert admission.active == 0
+
+
+def run_request(app, path):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    return app({"type": "http", "path": path, "method": "GET", "headers": []}, receive, send), messages
+
+
+def make_app(release_response: asyncio.Event):
+    async def app(scope, receive, send):
+        await release_response.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    return app
+
+
+def test_middleware_returns_503_with_retry_after_and_holds_slot_until_response_ends():
+    async def scenario():
+        admission = controller(queue=0)
+        release_response = asyncio.Event()
+        middleware = AdmissionMiddleware(make_app(release_response), admission)
+
+        first, first_messages = run_request(middleware, "/cars")
+        first = asyncio.create_task(first)
+        await asyncio.sleep(0)
+        second, second_messages = run_request(middleware, "/cars")
+        await second
+        active_while_streaming = admission.active
+
+        release_response.set()
+        await first
+        return first_messages, second_messages, active_while_streaming, admission.active
+
+    first_messages, second_messages, active_while_streaming, active_after = asyncio.run(scenario())
+    assert first_messages[0]["status"] == 200
+    assert second_messages[0]["status"] == 503
+    assert (b"retry-after", ADMISSION_RETRY_AFTER.encode()) in second_messages[0]["headers"]
+    assert active_while_streaming == 1
+    assert active_after == 0
+
+
+def test_exempt_route_bypasses_full_controller():
+    async def scenario():
+        admission = controller(queue=0)
+        await admission.acquire("public")
+        release_response = asyncio.Event()
+        release_response.set()
+        request, messages = run_request(AdmissionMiddleware(make_app(release_response), admission), "/metrics")
+        await request
+        return messages
+
+    assert asyncio.run(scenario())[0]["status"] == 200
@@ -0,0 +1,80 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from auth import TokenCache, pwd_context, verify_password, verify_password_async
+
+
+def user(user_id):
+    return SimpleNamespace(id=user_id)
+
+
+def test_token_cache_expires_after_ttl():
+    cache = TokenCache(ttl=0.05, max_size=10)
+    cache.put("token", user(1))
+    assert cache.get("token").id == 1
+    time.sleep(0.06)
+    assert cache.get("token") is None
+
+
+def test_token_cache_entry_does_not_outlive_jwt_exp():
+    cache = TokenCache(ttl=60, max_size=10)
+    cache.put("short", user(1), token_exp=time.time() + 0.05)
+    cache.put("expired", user(1), token_exp=time.time() - 1)
+    assert cache.get("short") is not None
+    assert cache.get("expired") is None
+    time.sleep(0.06)
+    assert cache.get("short") is None
+
+
+def test_token_cache_evicts_least_recently_used():
+    cache = TokenCache(ttl=60, max_size=2)
+    cache.put("a", user(1))
+    cache.put("b", user(2))
+    cache.get("a")
+    cache.put("c", user(3))
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_token_cache_invalidate_user_drops_all_their_tokens():
+    cache = TokenCache(ttl=60, max_size=10)
+    cache.put("phone", user(1))
+    cache.put("laptop", user(1))
+    cache.put("other", user(2))
+    cache.invalidate_user(1)
+    assert cache.get("phone") is None
+    assert cache.get("laptop") is None
+    assert cache.get("other").id == 2
+
+
+def test_verify_password_async_does_not_block_event_loop():
+    # Дорогой хэш, как в проде, независимо от BCRYPT_ROUNDS тестов
+    hashed = pwd_context.copy(bcrypt__rounds=11).hash("secret")
+    started = time.perf_counter()
+    verify_password("secret", hashed)
+    blocking_seconds = time.perf_counter() - started
+
+    async def scenario():
+        gaps = []
+        done = False
+
+        async def ticker():
+            last = time.perf_counter()
+            while not done:
+                await asyncio.sleep(0.005)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        tick = asyncio.create_task(ticker())
+        results = await asyncio.gather(*(verify_password_async("secret", hashed) for _ in range(4)))
+        done = True
+        await tick
+        return results, max(gaps)
+
+    results, max_gap = asyncio.run(scenario())
+    assert all(results)
+    # Проверка в event loop остановила бы его хотя бы на одну проверку целиком
+    assert max_gap < blocking_seconds / 2
@@ -0,0 +1,43 @@
+import threading
+
+from booking import BookingConflict, create_booking
+from database import SessionLocal
+from main import BookingData
+from models import CarReservation, ConfirmedBooking
+
+THREADS = 10
+
+
+def test_simultaneous_bookings_of_one_car_allow_exactly_one(db, client, car):
+    item = {"type": "car", "id": car.id, "start_date": "2030-03-01", "end_date": "2030-03-03"}
+    total = client.post("/api/quotes", json={"items": [item]}).json()["quotes"][0]["total"]
+    booking = BookingData(
+        firstName="Race", lastName="Test", phone="+70000000000", contact_method="email", email="race@example.com",
+        date="2030-03-01", start_date="2030-03-01", end_date="2030-03-03", total_price=total,
+        supplier_id=car.supplier_id, booking_type="car", car_id=car.id,
+    )
+    start = threading.Barrier(THREADS)
+    results = []
+
+    def book():
+        session = SessionLocal()
+        try:
+            start.wait()
+            create_booking(session, booking)
+            results.append("ok")
+        except BookingConflict as exc:
+            session.rollback()
+            results.append(exc.detail)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=book) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count("ok") == 1
+    assert results.count("Car is already reserved for these dates") == THREADS - 1
+    assert db.query(CarReservation).filter(CarReservation.car_id == car.id).count() == 1
+    assert db.query(ConfirmedBooking).count() == 1
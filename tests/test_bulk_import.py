@@ -0,0 +1,13 @@
+def test_malformed_json_body_is_rejected(client, admin_headers):
+    response = client.post(
+        "/api/admin/cars/bulk",
+        content=b'[{"brand": "Toyota",',
+        headers={**admin_headers, "content-type": "application/json"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid JSON body"
+
+
+def test_json_body_must_be_array_of_objects(client, admin_headers):
+    response = client.post("/api/admin/cars/bulk", json={"brand": "Toyota"}, headers=admin_headers)
+    assert response.status_code == 400
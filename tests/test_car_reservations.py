@@ -0,0 +1,63 @@
+from models import CarReservation, SupplierCarOccupancy
+
+BATCH_URL = "/api/admin/car-reservations/batch"
+
+
+def test_batch_rejects_range_longer_than_limit(db, client, admin_headers, car):
+    body = {"car_id": car.id, "ranges": [{"start_date": "0001-01-01", "end_date": "9999-12-31"}]}
+
+    response = client.post(BATCH_URL, json=body, headers=admin_headers)
+
+    assert response.status_code == 400
+    assert db.query(CarReservation).count() == 0
+    assert db.query(SupplierCarOccupancy).count() == 0
+
+
+def test_single_reservation_rejects_range_longer_than_limit(client, admin_headers, car):
+    body = {"car_id": car.id, "start_date": "2030-01-01", "end_date": "2050-01-01"}
+
+    assert client.post("/api/admin/car-reservations", json=body, headers=admin_headers).status_code == 400
+
+
+def test_batch_rejects_recurrence_ending_before_start(client, admin_headers, car):
+    body = {"car_id": car.id, "recurrence": {"weekdays": [0], "start_date": "2030-02-01", "until": "2030-01-01"}}
+
+    assert client.post(BATCH_URL, json=body, headers=admin_headers).status_code == 400
+
+
+def test_batch_rejects_unknown_weekday(client, admin_headers, car):
+    body = {"car_id": car.id, "recurrence": {"weekdays": [7], "start_date": "2030-01-01", "until": "2030-01-31"}}
+
+    assert client.post(BATCH_URL, json=body, headers=admin_headers).status_code == 422
+
+
+def test_batch_skips_taken_days(db, client, admin_headers, car):
+    client.post(BATCH_URL, json={"car_id": car.id, "ranges": [{"start_date": "2030-01-05", "end_date": "2030-01-06"}]},
+                headers=admin_headers)
+
+    response = client.post(
+        BATCH_URL, json={"car_id": car.id, "ranges": [{"start_date": "2030-01-01", "end_date": "2030-01-10"}]},
+        headers=admin_headers,
+    )
+
+    assert response.json()["ranges"] == [
+        {"start_date": "2030-01-01", "end_date": "2030-01-04"},
+        {"start_date": "2030-01-07", "end_date": "2030-01-10"},
+    ]
+
+
+def test_delete_window_trims_and_splits(db, client, admin_headers, car):
+    for start, end in [("2030-01-01", "2030-01-10"), ("2030-01-20", "2030-02-10")]:
+        client.post("/api/admin/car-reservations", json={"car_id": car.id, "start_date": start, "end_date": end},
+                    headers=admin_headers)
+
+    response = client.delete("/api/admin/car-reservations", headers=admin_headers,
+                             params={"car_id": car.id, "start_date": "2030-01-03", "end_date": "2030-01-25"})
+
+    assert response.json() == {"deleted": 0, "trimmed": 2}
+    left = client.get("/car-reservations", params={"car_id": car.id}).json()
+    assert sorted((r["start_date"], r["end_date"]) for r in left) == [
+        ("2030-01-01", "2030-01-02"), ("2030-01-26", "2030-02-10"),
+    ]
+    db.expire_all()
+    assert sum(row.car_days for row in db.query(SupplierCarOccupancy)) == 2 + 16
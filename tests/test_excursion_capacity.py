@@ -0,0 +1,45 @@
+from datetime import date, timedelta
+
+from models import Excursion, ExcursionInventory
+
+
+def excursion_body(excursion, **fields):
+    body = {
+        "title": excursion.title,
+        "duration": excursion.duration,
+        "price": excursion.price,
+        "adult_price": excursion.adult_price,
+        "child_price": excursion.child_price,
+        "infant_price": excursion.infant_price,
+        "operator_id": excursion.operator_id,
+    }
+    body.update(fields)
+    return body
+
+
+def test_update_without_capacity_keeps_limit(db, client, admin_headers, excursion):
+    url = f"/api/admin/excursions/{excursion.id}"
+    assert client.put(url, json=excursion_body(excursion, daily_capacity=10), headers=admin_headers).status_code == 200
+    db.add(ExcursionInventory(excursion_id=excursion.id, date=date.today() + timedelta(days=7), capacity=10, remaining=10))
+    db.commit()
+
+    # Клиент, который ещё не знает о daily_capacity
+    response = client.put(url, json=excursion_body(excursion, title="Renamed"), headers=admin_headers)
+
+    assert response.status_code == 200
+    db.expire_all()
+    updated = db.get(Excursion, excursion.id)
+    assert updated.title == "Renamed"
+    assert updated.daily_capacity == 10
+    assert db.query(ExcursionInventory).filter(ExcursionInventory.excursion_id == excursion.id).count() == 1
+
+
+def test_update_with_null_capacity_removes_limit(db, client, admin_headers, excursion):
+    url = f"/api/admin/excursions/{excursion.id}"
+    client.put(url, json=excursion_body(excursion, daily_capacity=10), headers=admin_headers)
+
+    response = client.put(url, json=excursion_body(excursion, daily_capacity=None), headers=admin_headers)
+
+    assert response.status_code == 200
+    db.expire_all()
+    assert db.get(Excursion, excursion.id).daily_capacity is None
@@ -0,0 +1,30 @@
+import pytest
+
+from excursion_search import ExcursionSearchIndex
+
+
+def doc(doc_id, title):
+    return {"id": doc_id, "title": title, "operator_id": 1}
+
+
+def test_failed_build_stops_buffering_edits():
+    def broken_loader():
+        raise RuntimeError("database is down")
+
+    index = ExcursionSearchIndex(broken_loader)
+    with pytest.raises(RuntimeError):
+        index.search("lake")
+    for doc_id in range(100):
+        index.upsert(doc(doc_id, "Lake tour"))
+        index.remove(doc_id)
+    assert index._pending is None
+
+
+def test_edits_during_build_reach_the_new_index():
+    def loader():
+        index.upsert(doc(2, "Canyon ride"))  # правка админки, пришедшая во время загрузки
+        return [doc(1, "Lake tour")]
+
+    index = ExcursionSearchIndex(loader)
+    assert [item["id"] for item in index.search("canyon")["items"]] == [2]
+    assert [item["id"] for item in index.search("lake")["items"]] == [1]
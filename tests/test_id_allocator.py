@@ -0,0 +1,38 @@
+import threading
+
+from id_allocator import BOOKING_ID_START, BlockIdAllocator, _initial_booking_id
+from models import ConfirmedBooking
+
+THREADS = 8
+IDS_PER_THREAD = 2000
+
+
+def test_allocators_on_threads_never_repeat_ids():
+    # Два аллокатора на один счётчик — как два воркера uvicorn
+    allocators = [BlockIdAllocator("test_ids", 50, lambda db: 1) for _ in range(2)]
+    chunks = [None] * THREADS
+
+    def work(index):
+        allocator = allocators[index % len(allocators)]
+        chunks[index] = [allocator.next_id() for _ in range(IDS_PER_THREAD)]
+
+    threads = [threading.Thread(target=work, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    ids = [value for chunk in chunks for value in chunk]
+    assert len(ids) == THREADS * IDS_PER_THREAD
+    assert len(set(ids)) == len(ids)
+    assert all(a < b for chunk in chunks for a, b in zip(chunk, chunk[1:]))
+
+
+def test_new_booking_ids_start_below_legacy_timestamp_ids(db):
+    db.add(ConfirmedBooking(booking_id=1_700_000_000, first_name="Legacy"))
+    db.commit()
+    assert _initial_booking_id(db) == BOOKING_ID_START
+
+    db.add(ConfirmedBooking(booking_id=BOOKING_ID_START + 41, first_name="New"))
+    db.commit()
+    assert _initial_booking_id(db) == BOOKING_ID_START + 42
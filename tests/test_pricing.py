@@ -0,0 +1,33 @@
+from datetime import date
+
+import pytest
+
+from booking import PriceMismatch, verify_total
+from models import SeasonalRate
+from pricing import RateTables, quote_car, rental_days
+
+
+def test_rental_days_count_both_ends():
+    assert rental_days(date(2030, 1, 1), date(2030, 1, 1)) == 1
+    assert rental_days(date(2030, 1, 1), date(2030, 1, 3)) == 3
+
+
+def test_car_quote_covers_every_reserved_day(car):
+    quote = quote_car(RateTables([], []), car, date(2030, 1, 1), date(2030, 1, 3))
+    assert quote["days"] == 3
+    assert quote["total"] == 3 * car.price_per_day
+
+
+def test_seasonal_rate_applies_to_last_reserved_day(car):
+    rate = SeasonalRate(id=1, item_type="car", supplier_id=car.supplier_id, item_id=None,
+                        start_date=date(2030, 1, 3), end_date=date(2030, 1, 3), multiplier=2.0)
+    quote = quote_car(RateTables([rate], []), car, date(2030, 1, 1), date(2030, 1, 3))
+    assert quote["total"] == 4 * car.price_per_day
+
+
+def test_verify_total_rejects_one_day_undercharge(car):
+    quote = lambda: quote_car(RateTables([], []), car, date(2030, 1, 1), date(2030, 1, 3))
+    assert verify_total(quote, 3 * car.price_per_day) == 3 * car.price_per_day
+    with pytest.raises(PriceMismatch) as exc:
+        verify_total(quote, 2 * car.price_per_day)
+    assert exc.value.quoted_total == 3 * car.price_per_day
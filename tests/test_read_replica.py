@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+import pytest
+
+import database
+from catalog_cache import catalog_cache
+
+
+class FakeReplicaSession:
+    def connection(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeAsyncReplicaSession:
+    async def connection(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    monkeypatch.setattr(database, "replica_engine", object())
+    monkeypatch.setattr(database, "ReadSessionLocal", FakeReplicaSession)
+    monkeypatch.setattr(database, "async_replica_engine", object())
+    monkeypatch.setattr(database, "AsyncReadSessionLocal", FakeAsyncReplicaSession)
+    monkeypatch.setattr(database, "_replica_down_until", 0.0)
+    monkeypatch.setattr(catalog_cache, "invalidated_at", float("-inf"))
+
+
+def read_session():
+    db = database.open_read_session()
+    db.close()
+    return db
+
+
+async def async_read_session():
+    sessions = database.get_async_read_db()
+    db = await sessions.__anext__()
+    await sessions.aclose()
+    return db
+
+
+def test_reads_use_primary_right_after_invalidation(replica):
+    assert isinstance(read_session(), FakeReplicaSession)
+    assert isinstance(asyncio.run(async_read_session()), FakeAsyncReplicaSession)
+
+    catalog_cache.invalidate("cars")
+    assert not isinstance(read_session(), FakeReplicaSession)
+    assert not isinstance(asyncio.run(async_read_session()), FakeAsyncReplicaSession)
+
+
+def test_replica_is_used_again_after_max_lag(replica, monkeypatch):
+    monkeypatch.setattr(catalog_cache, "invalidated_at", time.monotonic() - database.DB_REPLICA_MAX_LAG)
+    assert isinstance(read_session(), FakeReplicaSession)
+    assert isinstance(asyncio.run(async_read_session()), FakeAsyncReplicaSession)